@@ -0,0 +1,422 @@
+"""Assemble question papers from the user's question bank.
+
+The bank is every question already saved in the user's papers for the same
+subject, subject code and semester, keyed by `question_hash`. A paper is
+assembled module by module (matched on `module_number`):
+
+1. For each module, enumerate the marks compositions (how many questions of
+   each marks value) that give exactly `num_questions` questions worth
+   exactly `marks`, within what the bank holds for that module. At most
+   `ASSEMBLY_MAX_COMPOSITIONS` of them are kept, cheapest first, where the
+   cost of a composition is how often its least-used questions have already
+   appeared in papers.
+2. A dynamic programme over the modules picks one composition per module so
+   the paper's counts per marks value add up to `marks_distribution`
+   exactly. Its state is the vector of counts so far, bounded by the
+   target, so it stays small.
+3. Within each chosen composition, questions are picked greedily towards
+   `blooms_distribution` (the level furthest below its target first), least
+   used first. The Bloom's mix is best effort; marks are exact.
+
+Sets are solved one after another without reusing a question across them.
+In "auto" mode a module that cannot be filled from the bank becomes a gap,
+and only gaps are sent to the LLM; in "bank" mode an unsatisfiable request
+is a 422.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .config import settings
+from .database import run_in_session
+from .llm_service import generate_units
+from .paper_service import BeforeCommit, load_generation_context, save_generated_sets
+
+logger = logging.getLogger(__name__)
+
+# Cost of leaving a module to the LLM; larger than any reuse cost, so the
+# solver fills every module it can from the bank.
+GAP_COST = 10**9
+
+Unit = Tuple[int, Dict[str, Any]]
+
+_lock = threading.Lock()
+counters = {"plans": 0, "bank_questions": 0, "gap_units": 0, "unsatisfiable": 0, "solve_ms": 0}
+
+
+@dataclass
+class BankQuestion:
+    question_hash: str
+    text: str
+    module_number: int
+    marks: int
+    blooms_level: Optional[str]
+    # Number of saved papers the question appears in.
+    uses: int
+
+
+@dataclass
+class BankPlan:
+    # set number -> module number -> questions picked from the bank
+    sets: Dict[int, Dict[int, List[BankQuestion]]]
+    # (set number, module) pairs left for the LLM
+    gaps: List[Unit] = field(default_factory=list)
+    hashes: Set[str] = field(default_factory=set)
+    elapsed_ms: float = 0.0
+
+    def question_count(self) -> int:
+        return sum(len(qs) for modules in self.sets.values() for qs in modules.values())
+
+    def to_llm_result(self) -> Dict[str, Any]:
+        """The bank questions in the shape `generate_question_sets` returns."""
+        return {
+            "sets": [
+                {
+                    "set_number": n,
+                    "modules": [
+                        {
+                            "module_number": module_number,
+                            "questions": [
+                                {"text": q.text, "marks": q.marks, "blooms_level": q.blooms_level} for q in questions
+                            ],
+                        }
+                        for module_number, questions in sorted(modules.items())
+                    ],
+                }
+                for n, modules in sorted(self.sets.items())
+            ]
+        }
+
+    def merge(self, generated: Dict[str, Any]) -> Dict[str, Any]:
+        """Combine the bank questions with the LLM's answers for the gaps."""
+        result = self.to_llm_result()
+        by_number = {s["set_number"]: s for s in result["sets"]}
+        for set_obj in generated.get("sets", []):
+            target = by_number.setdefault(
+                set_obj.get("set_number", 0), {"set_number": set_obj.get("set_number", 0), "modules": []}
+            )
+            target["modules"].extend(set_obj.get("modules", []))
+        for set_obj in by_number.values():
+            set_obj["modules"].sort(key=lambda m: m.get("module_number") or 0)
+        return {"sets": [by_number[n] for n in sorted(by_number)]}
+
+
+def assembly_mode(payload: schemas.GeneratePaperRequest) -> str:
+    return payload.assembly_mode or settings.PAPER_ASSEMBLY_MODE
+
+
+def parse_marks_distribution(payload: schemas.GeneratePaperRequest) -> Optional[Dict[int, int]]:
+    """`marks_distribution` as `{marks: count}`, checked against the modules.
+
+    Raises HTTP 422 if it is malformed or inconsistent with the modules.
+    """
+    raw = payload.marks_distribution
+    if not raw:
+        return None
+    try:
+        distribution = {int(marks): int(count) for marks, count in raw.items()}
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=422, detail="marks_distribution must map marks to question counts")
+    distribution = {marks: count for marks, count in distribution.items() if count}
+    if any(marks <= 0 or count < 0 for marks, count in distribution.items()):
+        raise HTTPException(status_code=422, detail="marks_distribution must map marks to question counts")
+    num_questions = sum(m.num_questions for m in payload.modules)
+    if sum(distribution.values()) != num_questions:
+        raise HTTPException(
+            status_code=422,
+            detail=f"marks_distribution has {sum(distribution.values())} questions, the modules ask for {num_questions}",
+        )
+    if sum(marks * count for marks, count in distribution.items()) != payload.total_marks:
+        raise HTTPException(status_code=422, detail="marks_distribution does not add up to total_marks")
+    return distribution
+
+
+def validate_request(payload: schemas.GeneratePaperRequest) -> Optional[Dict[int, int]]:
+    """Check the marks in a request the solver has to satisfy exactly."""
+    module_marks = sum(m.marks for m in payload.modules)
+    if module_marks != payload.total_marks:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Module marks add up to {module_marks}, not total_marks ({payload.total_marks})",
+        )
+    return parse_marks_distribution(payload)
+
+
+def load_bank(db: Session, payload: schemas.GeneratePaperRequest, user_id: int) -> Dict[int, List[BankQuestion]]:
+    """The user's past questions for the request's subject, per module number."""
+    question, paper = models.Question, models.QuestionPaper
+    rows = db.execute(
+        select(
+            question.question_hash,
+            question.question_text,
+            question.module_number,
+            question.marks,
+            question.blooms_level,
+        )
+        .join(paper, question.question_paper_id == paper.id)
+        .where(
+            paper.user_id == user_id,
+            paper.subject == payload.subject,
+            paper.subject_code == payload.subject_code,
+            paper.semester == payload.semester,
+        )
+        .order_by(question.id.desc())
+    ).all()
+    by_hash: Dict[str, BankQuestion] = {}
+    for q_hash, text, module_number, marks, blooms_level in rows:
+        entry = by_hash.get(q_hash)
+        if entry is not None:
+            entry.uses += 1
+        elif marks and marks > 0:
+            # Rows are newest first, so the latest wording and module win.
+            by_hash[q_hash] = BankQuestion(q_hash, text, module_number, marks, blooms_level, 1)
+    bank: Dict[int, List[BankQuestion]] = defaultdict(list)
+    for entry in by_hash.values():
+        bank[entry.module_number].append(entry)
+    return bank
+
+
+def _compositions(
+    available: Dict[int, List[BankQuestion]], num_questions: int, total: int, limit: int
+) -> List[Tuple[int, Dict[int, int]]]:
+    """Up to `limit` cheapest `(cost, {marks: count})` hitting the module's target."""
+    values = sorted(available, reverse=True)
+    # prefix_cost[v][k]: uses of the k least-used questions worth v
+    prefix_cost = {}
+    for v in values:
+        costs = [0]
+        for q in available[v]:
+            costs.append(costs[-1] + q.uses)
+        prefix_cost[v] = costs
+    found: List[Tuple[int, Dict[int, int]]] = []
+    # Enumeration stops after this many, so a huge bank cannot stall a request.
+    budget = limit * 16
+
+    def walk(i: int, left_n: int, left_marks: int, cost: int, picked: Dict[int, int]) -> None:
+        if len(found) >= budget:
+            return
+        if left_n == 0:
+            if left_marks == 0:
+                found.append((cost, dict(picked)))
+            return
+        if i == len(values) or left_marks < left_n * values[-1] or left_marks > left_n * values[i]:
+            return
+        v = values[i]
+        for count in range(min(len(available[v]), left_n, left_marks // v), -1, -1):
+            if count:
+                picked[v] = count
+            walk(i + 1, left_n - count, left_marks - count * v, cost + prefix_cost[v][count], picked)
+            picked.pop(v, None)
+
+    walk(0, num_questions, total, 0, {})
+    found.sort(key=lambda item: item[0])
+    return found[:limit]
+
+
+def _solve_marks(
+    options: List[List[Tuple[int, Dict[int, int]]]],
+    distribution: Optional[Dict[int, int]],
+    allow_gaps: bool,
+) -> Optional[List[Optional[Dict[int, int]]]]:
+    """Pick one composition per module (None for a gap) meeting `distribution`."""
+    keys = sorted(distribution) if distribution else []
+    target = tuple(distribution[k] for k in keys)
+    position = {k: i for i, k in enumerate(keys)}
+    # state -> (cost, choices so far)
+    states: Dict[Tuple[int, ...], Tuple[int, List[Optional[Dict[int, int]]]]] = {
+        tuple(0 for _ in keys): (0, [])
+    }
+    for module_options in options:
+        next_states: Dict[Tuple[int, ...], Tuple[int, List[Optional[Dict[int, int]]]]] = {}
+        for state, (cost, choices) in states.items():
+            candidates: List[Tuple[int, Optional[Dict[int, int]]]] = list(module_options)
+            if allow_gaps:
+                candidates.append((GAP_COST, None))
+            for option_cost, composition in candidates:
+                new_state = list(state)
+                if composition and keys:
+                    if any(v not in position for v in composition):
+                        continue
+                    for v, count in composition.items():
+                        new_state[position[v]] += count
+                    if any(n > t for n, t in zip(new_state, target)):
+                        continue
+                key = tuple(new_state)
+                new_cost = cost + option_cost
+                if key not in next_states or new_cost < next_states[key][0]:
+                    next_states[key] = (new_cost, choices + [composition])
+        states = next_states
+        if not states:
+            return None
+
+    best: Optional[Tuple[int, List[Optional[Dict[int, int]]]]] = None
+    for state, (cost, choices) in states.items():
+        # The LLM fills gaps with whatever marks it chooses, so only a paper
+        # assembled entirely from the bank must match the target exactly.
+        if state != target and None not in choices:
+            continue
+        if best is None or cost < best[0]:
+            best = (cost, choices)
+    return best[1] if best else None
+
+
+def _normalize_level(level: Optional[str]) -> str:
+    return (level or "").strip().lower()
+
+
+def _pick_questions(
+    available: Dict[int, List[BankQuestion]],
+    composition: Dict[int, int],
+    blooms_left: Dict[str, int],
+) -> List[BankQuestion]:
+    """Fill `composition` from `available`, steering towards `blooms_left`."""
+    picked = []
+    for v, count in sorted(composition.items(), reverse=True):
+        pool = list(available[v])
+        for _ in range(count):
+            best = min(
+                range(len(pool)),
+                key=lambda i: (-blooms_left.get(_normalize_level(pool[i].blooms_level), 0), pool[i].uses),
+            )
+            q = pool.pop(best)
+            level = _normalize_level(q.blooms_level)
+            if level in blooms_left:
+                blooms_left[level] -= 1
+            picked.append(q)
+    return picked
+
+
+def plan_from_bank(
+    db: Session,
+    payload: schemas.GeneratePaperRequest,
+    user_id: int,
+    num_sets: int,
+    allow_gaps: bool,
+) -> BankPlan:
+    """Assemble `num_sets` papers from the bank, leaving gaps if `allow_gaps`.
+
+    Raises HTTP 422 if the request's marks are inconsistent, or if it cannot
+    be met from the bank and gaps are not allowed.
+    """
+    distribution = validate_request(payload)
+    start = time.perf_counter()
+    bank = load_bank(db, payload, user_id)
+    taken: Set[str] = set()
+    plan = BankPlan(sets={})
+    num_questions = sum(m.num_questions for m in payload.modules)
+    for set_number in range(1, num_sets + 1):
+        available = []
+        for module in payload.modules:
+            by_marks: Dict[int, List[BankQuestion]] = defaultdict(list)
+            for q in bank.get(module.module_number, []):
+                if q.question_hash not in taken:
+                    by_marks[q.marks].append(q)
+            for questions in by_marks.values():
+                questions.sort(key=lambda q: q.uses)
+            available.append(by_marks)
+        options = [
+            _compositions(by_marks, m.num_questions, m.marks, settings.ASSEMBLY_MAX_COMPOSITIONS)
+            for by_marks, m in zip(available, payload.modules)
+        ]
+        choices = _solve_marks(options, distribution, allow_gaps)
+        if choices is None:
+            with _lock:
+                counters["unsatisfiable"] += 1
+            raise HTTPException(
+                status_code=422,
+                detail=f"The question bank cannot fill set {set_number} with the requested marks",
+            )
+
+        # Bloom's targets scale with the share of the paper taken from the bank.
+        filled = sum(m.num_questions for m, c in zip(payload.modules, choices) if c is not None)
+        blooms_left = {
+            _normalize_level(level): round(count * filled / num_questions) if num_questions else 0
+            for level, count in (payload.blooms_distribution or {}).items()
+        }
+        modules_out: Dict[int, List[BankQuestion]] = {}
+        for module, by_marks, composition in zip(payload.modules, available, choices):
+            if composition is None:
+                plan.gaps.append((set_number, _module_dict(module)))
+                continue
+            picked = _pick_questions(by_marks, composition, blooms_left)
+            modules_out[module.module_number] = picked
+            taken.update(q.question_hash for q in picked)
+        plan.sets[set_number] = modules_out
+
+    plan.hashes = taken
+    plan.elapsed_ms = (time.perf_counter() - start) * 1000
+    with _lock:
+        counters["plans"] += 1
+        counters["bank_questions"] += plan.question_count()
+        counters["gap_units"] += len(plan.gaps)
+        counters["solve_ms"] += int(plan.elapsed_ms)
+    logger.info(
+        "Assembled %d bank questions with %d gap units in %.1f ms",
+        plan.question_count(),
+        len(plan.gaps),
+        plan.elapsed_ms,
+    )
+    return plan
+
+
+def _module_dict(module: schemas.ModuleInput) -> Dict[str, Any]:
+    return {
+        "module_number": module.module_number,
+        "title": module.title,
+        "topics": module.topics,
+        "num_questions": module.num_questions,
+        "marks": module.marks,
+    }
+
+
+async def assemble_papers(
+    payload: schemas.GeneratePaperRequest,
+    user_id: int,
+    num_sets: int,
+    mode: str,
+    before_commit: Optional[BeforeCommit] = None,
+) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """Build and save papers from the bank, generating only the gaps.
+
+    Returns the saved papers and response headers describing the split.
+    `before_commit` is passed on to `persist_papers`.
+    """
+    plan = await run_in_threadpool(run_in_session, plan_from_bank, payload, user_id, num_sets, mode == "auto")
+    tokens_saved = 0
+    llm_result = plan.to_llm_result()
+    if plan.gaps:
+        context = await run_in_threadpool(run_in_session, load_generation_context, payload, user_id)
+        tokens_saved = context.exclusion_tokens_saved
+        generated = await generate_units(
+            plan.gaps,
+            context.reference_text,
+            context.existing_questions,
+            num_sets,
+            bypass_cache=payload.bypass_cache,
+            user_id=user_id,
+        )
+        llm_result = plan.merge(generated)
+    saved = await run_in_threadpool(
+        run_in_session, save_generated_sets, payload, user_id, llm_result, frozenset(plan.hashes), before_commit
+    )
+    headers = {
+        "X-Prompt-Tokens-Saved": str(tokens_saved),
+        "X-Questions-Dropped": str(saved.dropped),
+        "X-Bank-Questions": str(plan.question_count()),
+        "X-Generated-Units": str(len(plan.gaps)),
+    }
+    return saved.papers, headers
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return dict(counters)
@@ -1,34 +1,33 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .config import settings
-from .database import SessionLocal
+from .database import AsyncReadSessionLocal, AsyncSessionLocal
 from . import models
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
-
-
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
 
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+async def get_read_db():
+    """Session on the read replica, if one is configured, for read-only routes."""
+    async with AsyncReadSessionLocal() as db:
+        yield db
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -48,17 +47,112 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return jwt.encode(to_encode, settings.JWT_SECRET_KEY, algorithm=settings.JWT_ALGORITHM)
 
 
-def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)) -> models.User:
-    """Return the currently authenticated user from a Bearer token.
+@dataclass(frozen=True)
+class Principal:
+    """The authenticated user as far as most routes need it."""
+
+    id: int
+    name: str
+    email: str
+
+
+class PrincipalCache:
+    """LRU of verified tokens, keyed on `token_cache_key` (SHA-256 of the whole token).
+
+    Entries live for `ttl_seconds` or until the token expires, whichever is
+    sooner. `invalidate_user` drops every token of a user; it is called
+    whenever a `User` row is updated or deleted in this process, and the
+    TTL bounds how long other workers may serve the old principal.
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[Principal, float]]" = OrderedDict()
+        self._by_user: Dict[int, Set[str]] = {}
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl_seconds > 0
+
+    def get(self, key: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= time.time():
+                if entry is not None:
+                    self._remove(key)
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[0]
+
+    def set(self, key: str, principal: Principal, token_expires_at: float) -> None:
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (principal, min(time.time() + self.ttl_seconds, token_expires_at))
+            self._by_user.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            keys = self._by_user.get(entry[0].id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_user[entry[0].id]
+
+    def invalidate_user(self, user_id: int) -> None:
+        with self._lock:
+            for key in list(self._by_user.get(user_id, ())):
+                self._remove(key)
+            self.counters["invalidations"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "max_entries": self.max_entries}
+
+
+principal_cache = PrincipalCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+
+
+def token_cache_key(token: str) -> str:
+    """`principal_cache` key for a raw Bearer token.
+
+    Hashes the whole token, so tokens that differ anywhere (not only in the
+    signature) never share an entry.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_principal(mapper, connection, target) -> None:
+    principal_cache.invalidate_user(target.id)
+
+
+async def get_current_principal(token: str = Depends(oauth2_scheme)) -> Principal:
+    """Return the authenticated user's id, name and email from a Bearer token.
 
-    Raises HTTP 401 if the token is missing, invalid, expired or the user
-    referenced by the token no longer exists.
+    Verified tokens are served from `principal_cache`; only a miss decodes
+    the JWT and reads the user row. Raises HTTP 401 if the token is missing,
+    invalid, expired or the user referenced by the token no longer exists.
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Invalid authentication credentials.",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    cache_key = token_cache_key(token)
+    if principal_cache.enabled:
+        principal = principal_cache.get(cache_key)
+        if principal is not None:
+            return principal
+
     try:
         payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
         user_id = payload.get("sub")
@@ -72,7 +166,40 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
     except JWTError:
         raise credentials_exception
 
-    user = db.query(models.User).filter(models.User.id == user_id).first()
-    if not user:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(models.User.id, models.User.name, models.User.email).where(models.User.id == user_id)
+        )
+        row = result.first()
+    if not row:
         raise credentials_exception
+    principal = Principal(id=row.id, name=row.name, email=row.email)
+    if principal_cache.enabled:
+        principal_cache.set(cache_key, principal, float(payload.get("exp", time.time())))
+    return principal
+
+
+async def get_current_user_id(principal: Principal = Depends(get_current_principal)) -> int:
+    """Dependency for routes that only need to know who is calling."""
+    return principal.id
+
+
+async def get_current_user(
+    db: AsyncSession = Depends(get_db),
+    principal: Principal = Depends(get_current_principal),
+) -> models.User:
+    """Return the currently authenticated user as an ORM object.
+
+    Prefer `get_current_user_id` or `get_current_principal` when the route
+    does not need the `User` row itself. Raises HTTP 401 like
+    `get_current_principal`.
+    """
+    user = await db.get(models.User, principal.id)
+    if not user:
+        principal_cache.invalidate_user(principal.id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials.",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     return user
@@ -0,0 +1,189 @@
+"""Content-addressed storage for uploaded files.
+
+Each distinct file content is stored once under
+`FILE_UPLOAD_DIR/blobs/<sha[:2]>/` and described by a `FileBlob` row. The
+extracted text is chunked (see `corpus`) and kept in a compressed pack file
+beside the blob (see `chunk_store`). `SyllabusDoc` and `ReferenceMaterial`
+rows point at a blob, so when several faculty upload the same textbook the
+file is kept, text-extracted and chunked only once.
+
+Blobs are reference counted: `store_upload` takes a reference and
+`release_blob` drops one. `collect_garbage` removes blobs nobody references.
+A reference is committed in the same transaction as the row holding it
+(see `commit_upload`), so a failed upload never leaves a count behind.
+"""
+import os
+import uuid
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import models
+from .config import settings
+from .chunk_store import pack_path_for
+from .corpus import build_chunks, pack_chunks
+from .extractors import ExtractionResult, extract_document
+from .uploads import StoredUpload, save_upload
+
+
+def blob_dir() -> str:
+    return os.path.join(settings.FILE_UPLOAD_DIR, "blobs")
+
+
+def _take_reference(db: Session, sha256: str) -> Optional[models.FileBlob]:
+    """Increment the ref count of the blob for `sha256`, if it still exists; the caller commits."""
+    updated = (
+        db.query(models.FileBlob)
+        .filter(models.FileBlob.sha256 == sha256)
+        .update({models.FileBlob.ref_count: models.FileBlob.ref_count + 1}, synchronize_session=False)
+    )
+    if not updated:
+        return None
+    return db.query(models.FileBlob).filter(models.FileBlob.sha256 == sha256).first()
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+@dataclass
+class PreparedBlob:
+    file_path: str
+    chunk_path: str
+    chunks: List[models.ReferenceChunk]
+
+
+def _prepare_blob(stored: StoredUpload, ext: str, extraction: ExtractionResult) -> PreparedBlob:
+    """Move the upload into place and write its chunk pack (CPU-bound, no DB)."""
+    # Every blob row gets its own file name, so garbage collection of an old
+    # row can never delete a file a newer upload of the same content uses.
+    final_path = os.path.join(blob_dir(), stored.sha256[:2], f"{stored.sha256}-{uuid.uuid4().hex[:8]}{ext}")
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(stored.path, final_path)
+    chunks = build_chunks(extraction.text)
+    chunk_path = pack_path_for(final_path)
+    pack_chunks(chunks, chunk_path)
+    return PreparedBlob(file_path=final_path, chunk_path=chunk_path, chunks=chunks)
+
+
+def _insert_blob(
+    db: Session, stored: StoredUpload, extraction: ExtractionResult, prepared: PreparedBlob
+) -> models.FileBlob:
+    blob = models.FileBlob(
+        sha256=stored.sha256,
+        size=stored.size,
+        file_path=prepared.file_path,
+        chunk_path=prepared.chunk_path,
+        page_count=extraction.page_count,
+        extraction_ms=extraction.elapsed_ms,
+        ref_count=1,
+    )
+    db.add(blob)
+    try:
+        db.flush()
+        for chunk in prepared.chunks:
+            chunk.blob_id = blob.id
+        db.add_all(prepared.chunks)
+        db.flush()
+    except IntegrityError:
+        # A concurrent upload of the same content created the blob first.
+        db.rollback()
+        _remove_quietly(prepared.file_path)
+        _remove_quietly(prepared.chunk_path)
+        blob = _take_reference(db, stored.sha256)
+        if blob is None:
+            raise
+    return blob
+
+
+async def store_upload(db: AsyncSession, file: UploadFile) -> models.FileBlob:
+    """Stream `file` into the blob store and return its (referenced) blob.
+
+    Text is only extracted when the content has not been stored before.
+    Extraction and chunking run off the event loop; the database work runs
+    on `db` through `run_sync`. Nothing is committed: add the row that
+    holds the reference and finish with `commit_upload`. Call this before
+    adding anything else to `db`, as a lost insert race rolls it back.
+    """
+    tmp_path = os.path.join(blob_dir(), "tmp", uuid.uuid4().hex)
+    stored = await save_upload(file, tmp_path)
+    try:
+        blob = await db.run_sync(_take_reference, stored.sha256)
+        if blob is not None:
+            return blob
+        # Nothing was written; end the transaction rather than hold it open
+        # through extraction.
+        await db.rollback()
+        ext = os.path.splitext(file.filename or "")[1].lower()
+        extraction = await extract_document(stored.path, ext)
+        prepared = await run_in_threadpool(_prepare_blob, stored, ext, extraction)
+        return await db.run_sync(_insert_blob, stored, extraction, prepared)
+    finally:
+        await run_in_threadpool(_remove_quietly, tmp_path)
+
+
+def _discard_files(db: Session, file_path: str, chunk_path: Optional[str]) -> None:
+    """Remove a blob's files if its row was rolled back."""
+    if db.query(models.FileBlob.id).filter(models.FileBlob.file_path == file_path).first() is None:
+        _remove_quietly(file_path)
+        if chunk_path:
+            _remove_quietly(chunk_path)
+
+
+async def commit_upload(db: AsyncSession, blob: models.FileBlob) -> None:
+    """Commit the row holding `blob` together with the reference `store_upload` took.
+
+    If the commit fails the reference is rolled back with the row, and the
+    files of a blob this upload created are removed.
+    """
+    file_path, chunk_path = blob.file_path, blob.chunk_path
+    try:
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        await db.run_sync(_discard_files, file_path, chunk_path)
+        raise
+
+
+def release_blob(db: Session, blob_id: Optional[int]) -> None:
+    """Drop one reference to a blob; the caller commits."""
+    if blob_id is None:
+        return
+    db.query(models.FileBlob).filter(
+        models.FileBlob.id == blob_id,
+        models.FileBlob.ref_count > 0,
+    ).update({models.FileBlob.ref_count: models.FileBlob.ref_count - 1}, synchronize_session=False)
+
+
+def collect_garbage(db: Session, blob_ids: Optional[Iterable[int]] = None) -> int:
+    """Delete unreferenced blobs (optionally only among `blob_ids`) and their files."""
+    query = db.query(models.FileBlob.id, models.FileBlob.file_path, models.FileBlob.chunk_path).filter(
+        models.FileBlob.ref_count <= 0
+    )
+    if blob_ids is not None:
+        query = query.filter(models.FileBlob.id.in_(list(blob_ids)))
+    removed = 0
+    for blob_id, file_path, chunk_path in query.all():
+        # Re-check the count in the DELETE itself in case an upload just
+        # took a new reference.
+        deleted = (
+            db.query(models.FileBlob)
+            .filter(models.FileBlob.id == blob_id, models.FileBlob.ref_count <= 0)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        if deleted:
+            _remove_quietly(file_path)
+            if chunk_path:
+                _remove_quietly(chunk_path)
+            removed += 1
+    return removed
+
@@ -0,0 +1,127 @@
+"""Compressed on-disk storage for reference chunk text.
+
+The text of a blob's chunks is written once, when the blob is chunked, to a
+pack file next to the blob (`<blob file>.chunks`). Each chunk is compressed
+on its own with zstd (or zlib when the `zstandard` package is missing), and
+its `reference_chunks` row records the frame's offset and length. Retrieval
+only needs the term counts kept in the database, so a generation request
+memory-maps the pack and decompresses just the chunks it puts into the
+prompt; the rest of the document is never read into memory.
+
+Pack layout: an 8-byte header (`QPCHUNK` plus a codec byte, `z` for zstd and
+`d` for zlib) followed by the compressed frames back to back.
+"""
+import mmap
+import os
+import threading
+import uuid
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .config import settings
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+MAGIC = b"QPCHUNK"
+ZSTD = b"z"
+ZLIB = b"d"
+
+_counters_lock = threading.Lock()
+counters: Dict[str, int] = {"packs_written": 0, "chunks_read": 0, "bytes_read": 0}
+
+
+def default_codec() -> bytes:
+    if settings.CHUNK_COMPRESSION == "zstd" and zstandard is not None:
+        return ZSTD
+    return ZLIB
+
+
+def _compress(codec: bytes, data: bytes) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor(level=settings.CHUNK_COMPRESSION_LEVEL).compress(data)
+    return zlib.compress(data, min(max(settings.CHUNK_COMPRESSION_LEVEL, 1), 9))
+
+
+def _decompress(codec: bytes, data: bytes) -> bytes:
+    if codec == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("chunk pack is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def pack_path_for(blob_path: str) -> str:
+    return blob_path + ".chunks"
+
+
+def write_pack(path: str, texts: Sequence[str]) -> List[Tuple[int, int]]:
+    """Write `texts` to a new pack at `path`; return each one's (offset, length)."""
+    codec = default_codec()
+    locations = []
+    tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(MAGIC + codec)
+        offset = len(MAGIC) + 1
+        for text in texts:
+            frame = _compress(codec, text.encode("utf-8"))
+            out.write(frame)
+            locations.append((offset, len(frame)))
+            offset += len(frame)
+    os.replace(tmp_path, path)
+    with _counters_lock:
+        counters["packs_written"] += 1
+    return locations
+
+
+class ChunkPack:
+    """Read-only, memory-mapped view of one pack file.
+
+    The file is mapped on first read and unmapped when the pack is closed or
+    garbage collected (e.g. when its `BlobIndex` leaves the corpus cache).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._map: Optional[mmap.mmap] = None
+        self._codec = ZLIB
+        self._lock = threading.Lock()
+
+    def _mapped(self) -> mmap.mmap:
+        with self._lock:
+            if self._map is None:
+                with open(self.path, "rb") as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                header = mapped[: len(MAGIC) + 1]
+                if header[: len(MAGIC)] != MAGIC:
+                    mapped.close()
+                    raise ValueError(f"{self.path} is not a chunk pack")
+                self._codec = header[len(MAGIC) :]
+                self._map = mapped
+            return self._map
+
+    def read(self, offset: int, length: int) -> str:
+        data = self._mapped()[offset : offset + length]
+        with _counters_lock:
+            counters["chunks_read"] += 1
+            counters["bytes_read"] += length
+        return _decompress(self._codec, data).decode("utf-8")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+def stats() -> Dict[str, object]:
+    with _counters_lock:
+        return {**counters, "codec": "zstd" if default_codec() == ZSTD else "zlib"}
@@ -15,19 +15,148 @@ class Settings:
     # URL-encode the password to safely handle special characters like @, : etc.
     _DB_PASSWORD_ENCODED: str = quote_plus(DB_PASSWORD)
 
-    DATABASE_URL: str = (
-        f"mysql+pymysql://{DB_USER}:{_DB_PASSWORD_ENCODED}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    # DATABASE_URL overrides the DB_* settings above when set.
+    DATABASE_URL: str = os.getenv(
+        "DATABASE_URL",
+        f"mysql+pymysql://{DB_USER}:{_DB_PASSWORD_ENCODED}@{DB_HOST}:{DB_PORT}/{DB_NAME}",
     )
+    # Optional read replica for read-only routes (paper listing/lookup,
+    # profile); empty sends everything to DATABASE_URL.
+    DATABASE_REPLICA_URL: str = os.getenv("DATABASE_REPLICA_URL", "")
+    # Connection pool per engine: persistent connections, extra connections
+    # allowed under load, and how long a request waits for one before the
+    # API answers 503.
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT_SECONDS: float = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "10"))
+    DB_POOL_RECYCLE_SECONDS: int = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "3600"))
 
     JWT_SECRET_KEY: str = os.getenv("JWT_SECRET_KEY", "CHANGE_ME")
     JWT_ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24
+    # bcrypt cost factor; stored hashes made with another cost are upgraded
+    # on the next successful login.
+    BCRYPT_ROUNDS: int = int(os.getenv("BCRYPT_ROUNDS", "12"))
+    # Processes hashing passwords (0 hashes in the API's threadpool), and
+    # how many hashing requests may wait before new ones get a 503.
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))
+    # Verified tokens and their user are cached per process for this long, so
+    # authenticated requests skip the JWT check and the users lookup.
+    AUTH_CACHE_TTL_SECONDS: float = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "10000"))
 
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
+    # Ordered fallback list, "kind" or "kind:model" entries separated by
+    # commas (see `llm_router`); defaults to LLM_PROVIDER alone.
+    LLM_PROVIDERS: str = os.getenv("LLM_PROVIDERS", LLM_PROVIDER)
     OPENAI_API_KEY: str = os.getenv("OPENAI_API_KEY", "")
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    OPENAI_BASE_URL: str = os.getenv("OPENAI_BASE_URL", "")
+    OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    GEMINI_MODEL: str = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    LLM_TIMEOUT_SECONDS: float = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+    # Maximum number of in-flight provider calls per worker process.
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # "module" requests every (set, module) pair as its own prompt, "set" one
+    # prompt per question paper set, "none" a single prompt for everything.
+    LLM_FAN_OUT: str = os.getenv("LLM_FAN_OUT", "module")
+    # Retries per generation unit after a failed or malformed answer, with
+    # exponential backoff starting at LLM_RETRY_BACKOFF_SECONDS.
+    LLM_UNIT_RETRIES: int = int(os.getenv("LLM_UNIT_RETRIES", "2"))
+    LLM_RETRY_BACKOFF_SECONDS: float = float(os.getenv("LLM_RETRY_BACKOFF_SECONDS", "0.5"))
+    # Send the request to the next provider too if the current one has not
+    # answered after this many seconds (0 disables hedging).
+    LLM_HEDGE_AFTER_SECONDS: float = float(os.getenv("LLM_HEDGE_AFTER_SECONDS", "30"))
+    # Skip a provider for LLM_BREAKER_RESET_SECONDS after this many
+    # consecutive failures (0 disables the breaker).
+    LLM_BREAKER_FAILURES: int = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+    LLM_BREAKER_RESET_SECONDS: float = float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30"))
+    # Requests per minute per provider (0 disables), as a token bucket held
+    # in memory or in the database ("db", shared by all workers).
+    LLM_RATE_LIMIT_PER_MINUTE: float = float(os.getenv("LLM_RATE_LIMIT_PER_MINUTE", "0"))
+    LLM_RATE_LIMIT_BURST: float = float(os.getenv("LLM_RATE_LIMIT_BURST", "10"))
+    LLM_RATE_LIMIT_BACKEND: str = os.getenv("LLM_RATE_LIMIT_BACKEND", "db")
+    # Longest wait for a rate-limit token before moving to the next provider.
+    LLM_RATE_LIMIT_MAX_WAIT_SECONDS: float = float(os.getenv("LLM_RATE_LIMIT_MAX_WAIT_SECONDS", "10"))
+    # Queue provider calls per user and dispatch them round-robin, merging
+    # identical prompts (see `llm_batcher`); the window lets a burst of
+    # requests gather before scheduling starts.
+    LLM_BATCHING: bool = os.getenv("LLM_BATCHING", "false").lower() == "true"
+    LLM_BATCH_WINDOW_MS: float = float(os.getenv("LLM_BATCH_WINDOW_MS", "50"))
+    # Response cache in front of provider calls: memory, db, disk or none.
+    LLM_CACHE_BACKEND: str = os.getenv("LLM_CACHE_BACKEND", "memory")
+    LLM_CACHE_TTL_SECONDS: int = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_ENTRIES: int = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+    LLM_CACHE_DIR: str = os.getenv("LLM_CACHE_DIR", "llm_cache")
+
+    # Background generation jobs: in-process worker count (0 to run workers
+    # separately with `python -m app.jobs`), idle poll interval, how long a
+    # claim may go unrenewed before another worker takes the job over, how
+    # often a running job renews its claim, and how many claims a job gets.
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "2"))
+    JOB_POLL_SECONDS: float = float(os.getenv("JOB_POLL_SECONDS", "2"))
+    JOB_STALE_SECONDS: int = int(os.getenv("JOB_STALE_SECONDS", "600"))
+    JOB_HEARTBEAT_SECONDS: float = float(os.getenv("JOB_HEARTBEAT_SECONDS", "30"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+    FAKE_LLM_LATENCY_SECONDS: float = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", "0"))
+    FAKE_LLM_FAILURE_RATE: float = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+    # JSON map of fake model name to {"latency": seconds, "failure_rate": p},
+    # e.g. {"slow": {"latency": 5}} for LLM_PROVIDERS=fake:slow,fake.
+    FAKE_LLM_PROFILES: str = os.getenv("FAKE_LLM_PROFILES", "{}")
+
+    # Papers per page of GET /papers/ by default, and the most a client may ask for.
+    PAPER_PAGE_SIZE: int = int(os.getenv("PAPER_PAGE_SIZE", "50"))
+    PAPER_PAGE_MAX: int = int(os.getenv("PAPER_PAGE_MAX", "200"))
 
     FILE_UPLOAD_DIR: str = os.getenv("FILE_UPLOAD_DIR", "uploaded_files")
+    UPLOAD_CHUNK_BYTES: int = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+    MAX_UPLOAD_BYTES: int = int(os.getenv("MAX_UPLOAD_BYTES", str(250 * 1024 * 1024)))
+    # Upper bound on text kept per document after extraction.
+    MAX_EXTRACTED_TEXT_CHARS: int = int(os.getenv("MAX_EXTRACTED_TEXT_CHARS", str(20 * 1024 * 1024)))
+    # Text extraction process pool.
+    EXTRACTION_WORKERS: int = int(os.getenv("EXTRACTION_WORKERS", str(os.cpu_count() or 2)))
+    EXTRACTION_TIMEOUT_SECONDS: float = float(os.getenv("EXTRACTION_TIMEOUT_SECONDS", "120"))
+    PDF_PAGES_PER_TASK: int = int(os.getenv("PDF_PAGES_PER_TASK", "25"))
+
+    # Reference chunk indexes kept in memory, and whether topic filtering
+    # falls back to the whole text when no chunk matches.
+    REFERENCE_INDEX_CACHE_BLOBS: int = int(os.getenv("REFERENCE_INDEX_CACHE_BLOBS", "64"))
+    REFERENCE_FILTER_FALLBACK_TO_ALL: bool = os.getenv("REFERENCE_FILTER_FALLBACK_TO_ALL", "true").lower() == "true"
+    # "filter" keeps every chunk mentioning a topic; "bm25" ranks chunks per
+    # module and packs the best ones into REFERENCE_TOKEN_BUDGET.
+    REFERENCE_SELECTION_MODE: str = os.getenv("REFERENCE_SELECTION_MODE", "filter")
+    REFERENCE_TOKEN_BUDGET: int = int(os.getenv("REFERENCE_TOKEN_BUDGET", "3000"))
+    # Chunk text is kept in compressed pack files next to each blob: "zstd"
+    # (falls back to zlib when the zstandard package is missing) or "zlib".
+    CHUNK_COMPRESSION: str = os.getenv("CHUNK_COMPRESSION", "zstd")
+    CHUNK_COMPRESSION_LEVEL: int = int(os.getenv("CHUNK_COMPRESSION_LEVEL", "3"))
+    # Previously used questions listed in the prompt: "similar" sends the ones
+    # closest to the requested topics within EXCLUSION_TOKEN_BUDGET, "all"
+    # sends the full history.
+    EXCLUSION_MODE: str = os.getenv("EXCLUSION_MODE", "similar")
+    EXCLUSION_TOKEN_BUDGET: int = int(os.getenv("EXCLUSION_TOKEN_BUDGET", "1500"))
+
+    # In-process index of past questions' signatures used for near-duplicate
+    # detection (0 disables it).
+    QUESTION_INDEX_MAX_BYTES: int = int(os.getenv("QUESTION_INDEX_MAX_BYTES", str(64 * 1024 * 1024)))
+    # Near-duplicate detection: estimated Jaccard similarity of two questions'
+    # content words at or above which a generated question is dropped (0
+    # disables), and MinHash/LSH shape. Distinct questions on related topics
+    # ("process scheduling" vs "disk scheduling") score up to ~0.5, rewordings
+    # of one question 0.75 and up (see tests/test_near_dup.py).
+    NEAR_DUPLICATE_THRESHOLD: float = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.65"))
+    NEAR_DUPLICATE_NUM_PERM: int = int(os.getenv("NEAR_DUPLICATE_NUM_PERM", "128"))
+    NEAR_DUPLICATE_BANDS: int = int(os.getenv("NEAR_DUPLICATE_BANDS", "32"))
+
+    # How papers are built when a request does not say: "generate" asks the
+    # LLM for everything, "bank" assembles them from the user's past questions
+    # only, "auto" assembles what it can and generates the rest.
+    PAPER_ASSEMBLY_MODE: str = os.getenv("PAPER_ASSEMBLY_MODE", "generate")
+    # Marks combinations the solver considers per module.
+    ASSEMBLY_MAX_COMPOSITIONS: int = int(os.getenv("ASSEMBLY_MAX_COMPOSITIONS", "64"))
 
 
 settings = Settings()
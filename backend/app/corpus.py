@@ -0,0 +1,311 @@
+"""Pre-chunked reference corpus with an inverted term index.
+
+Uploaded text is split into paragraph chunks once, when its blob is created.
+The chunk text goes into the blob's compressed pack file (see `chunk_store`)
+and `reference_chunks` keeps only per-chunk term counts and the text's
+location in the pack. At generation time each blob's chunk metadata is loaded
+into a `BlobIndex` (cached in process; blobs are immutable so entries never
+go stale), topic filtering becomes a set lookup in the term -> chunk index
+instead of a substring scan over every paragraph, and only the chunks that
+end up in the prompt are read back from the pack.
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session, undefer
+
+from . import models
+from .chunk_store import ChunkPack, pack_path_for, write_pack
+from .config import settings
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def split_paragraphs(text: str) -> List[str]:
+    return [p.strip() for p in text.split("\n\n") if p.strip()]
+
+
+def parse_topics(topics: str) -> List[str]:
+    """Split a comma/newline separated topic list into lower-cased phrases."""
+    return [t.strip().lower() for t in topics.replace("\n", ",").split(",") if t.strip()]
+
+
+def build_chunks(text: str) -> List[models.ReferenceChunk]:
+    """Chunk rows for `text`, with their text still inline.
+
+    Rows meant for storage go through `pack_chunks` next; the caller then
+    sets `blob_id` and adds them.
+    """
+    chunks = []
+    for position, paragraph in enumerate(split_paragraphs(text)):
+        counts = Counter(tokenize(paragraph))
+        chunks.append(
+            models.ReferenceChunk(
+                position=position,
+                text=paragraph,
+                char_count=len(paragraph),
+                term_counts=dict(counts),
+                token_count=sum(counts.values()),
+            )
+        )
+    return chunks
+
+
+def pack_chunks(rows: List[models.ReferenceChunk], path: str) -> None:
+    """Move the text of `rows` into a new chunk pack at `path`.
+
+    The pack is read back and checked before the rows' text is cleared.
+    Raises `ValueError` if it does not match.
+    """
+    texts = [row.text or "" for row in rows]
+    locations = write_pack(path, texts)
+    pack = ChunkPack(path)
+    try:
+        for text, (offset, length) in zip(texts, locations):
+            if pack.read(offset, length) != text:
+                raise ValueError(f"{path} does not read back as written")
+    finally:
+        pack.close()
+    for row, (offset, length) in zip(rows, locations):
+        if row.char_count is None:
+            row.char_count = len(row.text or "")
+        row.store_offset = offset
+        row.store_length = length
+        row.text = None
+        row.normalized = None
+
+
+@dataclass
+class Chunk:
+    term_counts: Dict[str, int]
+    token_count: int
+    char_count: int
+    # Inline text for documents chunked on the fly; otherwise the chunk's
+    # location in the index's pack.
+    text: Optional[str] = None
+    offset: int = 0
+    length: int = 0
+
+
+@dataclass
+class BlobIndex:
+    """Chunks of one document plus an inverted index term -> chunk positions."""
+
+    chunks: List[Chunk]
+    postings: Dict[str, Set[int]] = field(default_factory=dict)
+    pack: Optional[ChunkPack] = None
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Chunk], pack: Optional[ChunkPack] = None) -> "BlobIndex":
+        postings: Dict[str, Set[int]] = {}
+        for position, chunk in enumerate(chunks):
+            for term in chunk.term_counts:
+                postings.setdefault(term, set()).add(position)
+        return cls(chunks=chunks, postings=postings, pack=pack)
+
+    @classmethod
+    def from_text(cls, text: str) -> "BlobIndex":
+        return cls.from_chunks(
+            [
+                Chunk(
+                    term_counts=row.term_counts,
+                    token_count=row.token_count,
+                    char_count=row.char_count,
+                    text=row.text,
+                )
+                for row in build_chunks(text)
+            ]
+        )
+
+    def text(self, position: int) -> str:
+        """Text of one chunk, decompressed from the pack if it is not inline."""
+        chunk = self.chunks[position]
+        if chunk.text is not None:
+            return chunk.text
+        return self.pack.read(chunk.offset, chunk.length)
+
+    def match_phrase(self, phrase: str) -> Set[int]:
+        """Positions of chunks containing `phrase`.
+
+        Candidates come from intersecting the postings of the phrase's terms;
+        multi-word phrases are then confirmed against the text of the
+        candidates only.
+        """
+        terms = tokenize(phrase)
+        if not terms:
+            return set()
+        candidates: Optional[Set[int]] = None
+        for term in sorted(set(terms), key=lambda t: len(self.postings.get(t, ()))):
+            posting = self.postings.get(term)
+            if not posting:
+                return set()
+            candidates = set(posting) if candidates is None else candidates & posting
+            if not candidates:
+                return set()
+        if len(terms) == 1:
+            return candidates
+        return {pos for pos in candidates if phrase in self.text(pos).lower()}
+
+
+class CorpusCache:
+    """LRU of `BlobIndex` objects keyed by blob id."""
+
+    def __init__(self, max_blobs: int):
+        self.max_blobs = max_blobs
+        self._indexes: "OrderedDict[int, BlobIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "backfills": 0}
+
+    def get(self, db: Session, blob: models.FileBlob) -> BlobIndex:
+        with self._lock:
+            index = self._indexes.get(blob.id)
+            if index is not None:
+                self._indexes.move_to_end(blob.id)
+                self.counters["hits"] += 1
+                return index
+            self.counters["misses"] += 1
+
+        if blob.chunk_path is None:
+            self._pack_blob(db, blob)
+        rows = (
+            db.query(
+                models.ReferenceChunk.store_offset,
+                models.ReferenceChunk.store_length,
+                models.ReferenceChunk.char_count,
+                models.ReferenceChunk.term_counts,
+                models.ReferenceChunk.token_count,
+            )
+            .filter(models.ReferenceChunk.blob_id == blob.id)
+            .order_by(models.ReferenceChunk.position)
+            .all()
+        )
+        index = BlobIndex.from_chunks(
+            [
+                Chunk(
+                    term_counts=term_counts or {},
+                    token_count=token_count or 0,
+                    char_count=char_count or 0,
+                    offset=offset or 0,
+                    length=length or 0,
+                )
+                for offset, length, char_count, term_counts, token_count in rows
+            ],
+            pack=ChunkPack(blob.chunk_path) if blob.chunk_path else None,
+        )
+        with self._lock:
+            self._indexes[blob.id] = index
+            while len(self._indexes) > self.max_blobs:
+                self._indexes.popitem(last=False)
+        return index
+
+    def _pack_blob(self, db: Session, blob: models.FileBlob) -> None:
+        """Move the text of a blob stored before chunk packs into one, once.
+
+        Concurrent requests may find the same blob unpacked. Setting
+        `chunk_path` with a conditional UPDATE claims the migration: it holds
+        the row until commit, so a second request blocks on it and then
+        finds nothing to do, and readers see `chunk_path` only once the pack
+        and the chunk rows are in place.
+        """
+        path = pack_path_for(blob.file_path)
+        claimed = (
+            db.query(models.FileBlob)
+            .filter(models.FileBlob.id == blob.id, models.FileBlob.chunk_path.is_(None))
+            .update({models.FileBlob.chunk_path: path}, synchronize_session=False)
+        )
+        if not claimed:
+            # Another request migrated it; end this transaction so the
+            # refresh sees their commit.
+            db.commit()
+            db.refresh(blob)
+            return
+        try:
+            rows = (
+                db.query(models.ReferenceChunk)
+                .options(undefer(models.ReferenceChunk.text))
+                .filter(models.ReferenceChunk.blob_id == blob.id)
+                .order_by(models.ReferenceChunk.position)
+                .all()
+            )
+            if not rows:
+                # Stored before chunking existed: chunk the blob's text now.
+                if not blob.content_text:
+                    db.rollback()
+                    return
+                rows = build_chunks(blob.content_text)
+                for row in rows:
+                    row.blob_id = blob.id
+                db.add_all(rows)
+            pack_chunks(rows, path)
+            blob.chunk_path = path
+            # Only now that the pack has been verified.
+            blob.content_text = None
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        with self._lock:
+            self.counters["backfills"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self.counters, "blobs": len(self._indexes), "max_blobs": self.max_blobs}
+
+
+corpus_cache = CorpusCache(max_blobs=settings.REFERENCE_INDEX_CACHE_BLOBS)
+
+
+def document_index(db: Session, doc) -> BlobIndex:
+    """Index for a `SyllabusDoc` or `ReferenceMaterial`.
+
+    Rows uploaded before the blob store have no blob; their inline text is
+    chunked on the fly.
+    """
+    if doc.blob is not None:
+        return corpus_cache.get(db, doc.blob)
+    return BlobIndex.from_text(doc.content_text or "")
+
+
+def filter_reference_by_topics(
+    indexes: Iterable[BlobIndex],
+    topics: str,
+    fallback_to_all: bool = True,
+    budget_chars: Optional[int] = None,
+) -> str:
+    """Keep chunks mentioning at least one topic, in document order.
+
+    If no chunk matches, return everything when `fallback_to_all` is set
+    (the historical behaviour) and an empty string otherwise. With
+    `budget_chars`, chunks are taken only until their stored lengths reach
+    it: the prompt keeps that many characters from the start, so the chunks
+    after them would be decompressed only to be thrown away.
+    """
+    indexes = list(indexes)
+    phrases = parse_topics(topics)
+    matches: List[Tuple[BlobIndex, int]] = []
+    for index in indexes:
+        if not phrases:
+            break
+        matched: Set[int] = set()
+        for phrase in phrases:
+            matched |= index.match_phrase(phrase)
+        matches.extend((index, pos) for pos in sorted(matched))
+    if not matches:
+        if phrases and not fallback_to_all:
+            return ""
+        matches = [(index, pos) for index in indexes for pos in range(len(index.chunks))]
+    selected: List[str] = []
+    used = 0
+    for index, pos in matches:
+        if budget_chars is not None and used >= budget_chars:
+            break
+        selected.append(index.text(pos))
+        used += index.chunks[pos].char_count + 2  # plus the separator
+    return "\n\n".join(selected)
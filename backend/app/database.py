@@ -1,13 +1,149 @@
-from sqlalchemy import create_engine
+"""Engines and session factories.
+
+`engine` / `SessionLocal` talk to the primary database. When
+`settings.DATABASE_REPLICA_URL` is set, `read_engine` / `ReadSessionLocal`
+point at that replica and serve routes that only read (see
+`auth.get_read_db`); otherwise they are the primary's. Replicas lag, so
+anything that must see a write just made keeps using the primary.
+
+Routes use the asyncio counterparts, `AsyncSessionLocal` and
+`AsyncReadSessionLocal`, on the same URLs with the async driver
+(`mysql+aiomysql`, or `sqlite+aiosqlite` for local SQLite files). The sync
+engines remain for work done in the threadpool or in background tasks:
+generation's read and write phases, jobs, the LLM cache and rate limiter.
+
+All engines share the pool settings in `config`. Checkouts, the peak
+number of connections in use and pool timeouts are counted for `/metrics/`.
+"""
+import threading
+from typing import Any, Callable, Dict, TypeVar
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 from .config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL,
-    pool_pre_ping=True,
-    pool_recycle=3600,
-)
+T = TypeVar("T")
+
+# Async driver for each sync driver the app is deployed with.
+ASYNC_DRIVERS = {
+    "mysql": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+}
+
+
+def async_url(url: str) -> str:
+    """`url` with its driver swapped for the asyncio one."""
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)).render_as_string(
+        hide_password=False
+    )
+
+
+def _pool_options() -> Dict[str, Any]:
+    return {
+        "pool_pre_ping": True,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    }
+
+
+def _create_engine(url: str) -> Engine:
+    options = _pool_options()
+    if url.startswith("sqlite"):
+        # For running against local SQLite files (e.g. a primary and a
+        # stand-in replica) instead of MySQL.
+        options["connect_args"] = {"check_same_thread": False}
+    return create_engine(url, **options)
+
+
+def _create_async_engine(url: str) -> AsyncEngine:
+    return create_async_engine(async_url(url), **_pool_options())
+
+
+class PoolMonitor:
+    """Counts checkouts of one engine's pool and the peak in use at once."""
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+        self.counters = {"connects": 0, "checkouts": 0, "peak_checked_out": 0}
+        self._checked_out = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "connect", self._on_connect)
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+
+    def _on_connect(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self.counters["connects"] += 1
+
+    def _on_checkout(self, dbapi_connection, connection_record, connection_proxy) -> None:
+        with self._lock:
+            self.counters["checkouts"] += 1
+            self._checked_out += 1
+            self.counters["peak_checked_out"] = max(self.counters["peak_checked_out"], self._checked_out)
+
+    def _on_checkin(self, dbapi_connection, connection_record) -> None:
+        with self._lock:
+            self._checked_out = max(self._checked_out - 1, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        pool = self.engine.pool
+        with self._lock:
+            stats: Dict[str, Any] = {**self.counters, "checked_out": self._checked_out}
+        # Only queue pools report their size and overflow.
+        for name in ("size", "overflow", "checkedin"):
+            method = getattr(pool, name, None)
+            if method is not None:
+                stats[name] = method()
+        return stats
+
+
+engine = _create_engine(settings.DATABASE_URL)
+read_engine = _create_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+async_engine = _create_async_engine(settings.DATABASE_URL)
+async_read_engine = (
+    _create_async_engine(settings.DATABASE_REPLICA_URL) if settings.DATABASE_REPLICA_URL else async_engine
+)
+# Objects stay usable after commit: reloading expired attributes lazily is
+# not possible outside an awaited call.
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
+
+pool_monitors = {"primary": PoolMonitor(engine), "primary_async": PoolMonitor(async_engine.sync_engine)}
+if read_engine is not engine:
+    pool_monitors["replica"] = PoolMonitor(read_engine)
+    pool_monitors["replica_async"] = PoolMonitor(async_read_engine.sync_engine)
+# Requests that gave up waiting for a connection (counted in `main`).
+counters = {"pool_timeouts": 0}
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        **{name: monitor.stats() for name, monitor in pool_monitors.items()},
+        "pool_timeouts": counters["pool_timeouts"],
+    }
+
+
+def run_in_session(func: Callable[..., T], *args: Any) -> T:
+    """Call `func(session, *args)` with a new sync session and close it after.
+
+    Meant for `run_in_threadpool`, so a phase of a request holds a
+    connection only while it runs.
+    """
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
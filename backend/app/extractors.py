@@ -0,0 +1,200 @@
+"""Text extraction for uploaded documents.
+
+Extractors are registered per file extension with `register_extractor` and
+run in a `ProcessPoolExecutor`, so CPU-heavy parsing never blocks the API
+process. Large PDFs are split into page ranges that are extracted in
+parallel and joined in order. Each document is bounded by
+`settings.EXTRACTION_TIMEOUT_SECONDS`; a timed-out document's workers are
+killed and the pool replaced, so pathological files cannot pile up on it.
+A pool broken by a crashed worker is replaced too, and the extraction is
+retried once on the new one.
+
+PDF, DOCX and PPTX support relies on `pypdf`, `python-docx` and
+`python-pptx`; they are imported inside the worker so a missing library only
+affects that file type.
+"""
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from .config import settings
+from .uploads import read_text_incrementally
+
+logger = logging.getLogger(__name__)
+
+# extension (with dot, lower-case) -> function(path) -> (text, page_count)
+EXTRACTORS: Dict[str, Callable[[str], Tuple[str, Optional[int]]]] = {}
+
+
+@dataclass
+class ExtractionResult:
+    text: str
+    page_count: Optional[int]
+    elapsed_ms: int
+
+
+def register_extractor(*extensions: str):
+    def decorator(func):
+        for ext in extensions:
+            EXTRACTORS[ext.lower()] = func
+        return func
+
+    return decorator
+
+
+def _cap(text: str) -> str:
+    return text[: settings.MAX_EXTRACTED_TEXT_CHARS]
+
+
+@register_extractor(".txt", ".md", ".csv")
+def extract_plain_text(path: str) -> Tuple[str, Optional[int]]:
+    return read_text_incrementally(path), None
+
+
+def pdf_page_count(path: str) -> int:
+    from pypdf import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def extract_pdf_pages(path: str, start: int, end: int) -> str:
+    """Text of pages `start` (inclusive) to `end` (exclusive)."""
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return "\n\n".join((reader.pages[i].extract_text() or "").strip() for i in range(start, end))
+
+
+@register_extractor(".pdf")
+def extract_pdf(path: str) -> Tuple[str, Optional[int]]:
+    count = pdf_page_count(path)
+    return _cap(extract_pdf_pages(path, 0, count)), count
+
+
+@register_extractor(".docx")
+def extract_docx(path: str) -> Tuple[str, Optional[int]]:
+    import docx
+
+    document = docx.Document(path)
+    parts = [p.text for p in document.paragraphs if p.text.strip()]
+    for table in document.tables:
+        for row in table.rows:
+            cells = [cell.text.strip() for cell in row.cells if cell.text.strip()]
+            if cells:
+                parts.append(" | ".join(cells))
+    return _cap("\n\n".join(parts)), None
+
+
+@register_extractor(".pptx")
+def extract_pptx(path: str) -> Tuple[str, Optional[int]]:
+    from pptx import Presentation
+
+    presentation = Presentation(path)
+    slides = []
+    for slide in presentation.slides:
+        texts = [
+            shape.text_frame.text.strip()
+            for shape in slide.shapes
+            if shape.has_text_frame and shape.text_frame.text.strip()
+        ]
+        slides.append("\n".join(texts))
+    return _cap("\n\n".join(s for s in slides if s)), len(presentation.slides)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.EXTRACTION_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _replace_pool(pool: ProcessPoolExecutor, kill: bool = False) -> None:
+    """Drop `pool` so the next extraction starts a fresh one.
+
+    With `kill`, its worker processes are terminated first: a task that is
+    already running cannot be cancelled any other way. Other extractions
+    running on it then fail with `BrokenProcessPool` and are retried.
+    """
+    global _pool
+    if _pool is pool:
+        _pool = None
+    if kill:
+        # ProcessPoolExecutor has no public way to stop its workers.
+        for process in list((pool._processes or {}).values()):
+            process.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def _extract_pdf_parallel(pool: ProcessPoolExecutor, path: str) -> Tuple[str, Optional[int]]:
+    loop = asyncio.get_running_loop()
+    count = await loop.run_in_executor(pool, pdf_page_count, path)
+    step = settings.PDF_PAGES_PER_TASK
+    if count <= step:
+        return await loop.run_in_executor(pool, extract_pdf, path)
+    ranges = [(start, min(start + step, count)) for start in range(0, count, step)]
+    parts: List[str] = await asyncio.gather(
+        *(loop.run_in_executor(pool, extract_pdf_pages, path, start, end) for start, end in ranges)
+    )
+    return _cap("\n\n".join(parts)), count
+
+
+async def extract_document(path: str, ext: Optional[str] = None) -> ExtractionResult:
+    """Extract text from the file at `path` in the process pool.
+
+    `ext` overrides the extension taken from `path` (uploads are staged under
+    extension-less names). Unknown types yield empty text. Raises HTTP 422 if
+    extraction fails or exceeds the timeout.
+    """
+    ext = (ext if ext is not None else os.path.splitext(path)[1]).lower()
+    extractor = EXTRACTORS.get(ext)
+    started = time.perf_counter()
+    if extractor is None:
+        return ExtractionResult(text="", page_count=None, elapsed_ms=0)
+
+    for attempt in range(2):
+        pool = get_pool()
+        if extractor is extract_pdf:
+            work = _extract_pdf_parallel(pool, path)
+        else:
+            work = asyncio.get_running_loop().run_in_executor(pool, extractor, path)
+        try:
+            text, page_count = await asyncio.wait_for(work, timeout=settings.EXTRACTION_TIMEOUT_SECONDS)
+            break
+        except asyncio.TimeoutError as e:
+            logger.warning("Extraction of %s timed out; restarting the extraction pool", path)
+            _replace_pool(pool, kill=True)
+            raise HTTPException(
+                status_code=422,
+                detail=f"Text extraction timed out after {settings.EXTRACTION_TIMEOUT_SECONDS:.0f}s.",
+            ) from e
+        except BrokenProcessPool as e:
+            _replace_pool(pool)
+            if attempt:
+                raise HTTPException(status_code=422, detail=f"Text extraction crashed on this {ext} file.") from e
+            logger.warning("Extraction pool broke while extracting %s; retrying on a new pool", path)
+        except ImportError as e:
+            raise HTTPException(status_code=422, detail=f"No extractor library installed for {ext} files: {e}") from e
+        except Exception as e:
+            raise HTTPException(status_code=422, detail=f"Could not extract text from {ext} file: {e}") from e
+    return ExtractionResult(
+        text=text,
+        page_count=page_count,
+        elapsed_ms=int((time.perf_counter() - started) * 1000),
+    )
@@ -0,0 +1,192 @@
+"""Deterministic stand-in for an LLM provider, for local runs and load tests.
+
+`fake_completion` reads the module specification and set numbering back out
+of a prompt produced by `llm_service.build_prompt` and answers with
+well-formed question JSON. It is used in-process by `LLM_PROVIDER=fake`, and
+`app` exposes the same behaviour as an OpenAI-compatible chat completions
+endpoint so the real async client can be exercised end to end:
+
+    python -m uvicorn app.fake_llm:app --port 9000
+    OPENAI_BASE_URL=http://127.0.0.1:9000/v1 OPENAI_API_KEY=fake ...
+
+For exercising the provider router offline, each fake model name can have
+its own latency and failure rate via `FAKE_LLM_PROFILES`, so
+`LLM_PROVIDERS=fake:slow,fake:flaky,fake` behaves like three providers.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Set, Tuple
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+
+from .config import settings
+
+# Exam-style question wordings, with the Bloom's level each one targets.
+# Each adds content words of its own to the topic, so, as with distinct real
+# questions, no two wordings are near-duplicates (see `near_dup`).
+_TEMPLATES = [
+    ("Remember", "Define {topic} and list its key characteristics."),
+    ("Understand", "Explain the working principle of {topic} with a suitable example."),
+    ("Apply", "Apply {topic} to a numerical problem."),
+    ("Analyze", "Compare {topic} with its alternatives in a table."),
+    ("Evaluate", "Evaluate how well {topic} scales."),
+    ("Create", "Propose a new extension to {topic}."),
+    ("Remember", "What are the main components of {topic}?"),
+    ("Understand", "Trace the sequence of events in {topic}."),
+    ("Apply", "Illustrate the use of {topic} in industry."),
+    ("Analyze", "Analyze the advantages and limitations of {topic}."),
+    ("Evaluate", "Critically assess the performance of {topic} under load."),
+    ("Create", "Propose an improvement to {topic} and explain how you would validate it."),
+]
+
+
+def _modules_from_prompt(prompt: str) -> List[Dict[str, Any]]:
+    match = re.search(r"MODULES \(input specification\):\s*(\[.*?\])\s*\n\s*\n", prompt, re.S)
+    if not match:
+        return []
+    try:
+        return json.loads(match.group(1))
+    except json.JSONDecodeError:
+        return []
+
+
+def _set_numbers_from_prompt(prompt: str) -> List[int]:
+    single = re.search(r"Generate exactly ONE set of question papers, numbered (\d+)", prompt)
+    if single:
+        return [int(single.group(1))]
+    many = re.search(r"Generate (\d+) DISTINCT sets", prompt)
+    return list(range(1, int(many.group(1)) + 1)) if many else [1]
+
+
+def _previous_questions_from_prompt(prompt: str) -> Set[str]:
+    match = re.search(r"previously used questions:\s*(\[.*?\])\s*\n\s*\n\s*MODULES", prompt, re.S)
+    if not match:
+        return set()
+    try:
+        return set(json.loads(match.group(1)))
+    except json.JSONDecodeError:
+        return set()
+
+
+def _wordings(topics: List[str]) -> List[Tuple[str, str]]:
+    """Every (level, text) pair for `topics`, alternating topics question by question."""
+    t = len(_TEMPLATES)
+    out = []
+    for k in range(t * len(topics)):
+        level, template = _TEMPLATES[k % t]
+        out.append((level, template.format(topic=topics[(k + k // t) % len(topics)])))
+    return out
+
+
+def fake_completion(prompt: str) -> str:
+    """Return a JSON completion for `prompt` in the `{"sets": [...]}` format.
+
+    Questions are drawn from `_TEMPLATES` over the module's topics. Like a
+    well-behaved model, the fake skips wordings listed as previously used and
+    gives each set its own questions; it repeats itself only when the
+    combinations run out, as a real model does on narrow topics.
+    """
+    previous = _previous_questions_from_prompt(prompt)
+    sets = []
+    for set_number in _set_numbers_from_prompt(prompt):
+        modules_out = []
+        for module in _modules_from_prompt(prompt):
+            count = max(int(module.get("num_questions", 1)), 1)
+            marks = max(int(module.get("marks", count)) // count, 1)
+            topics = [t.strip() for t in str(module.get("topics", "")).split(",") if t.strip()] or ["the module"]
+            wordings = _wordings(topics)
+            fresh = [w for w in wordings if w[1] not in previous] or wordings
+            # Each set starts further along, so sets generated by separate
+            # prompts still differ.
+            offset = (set_number - 1) * count % len(fresh)
+            ordered = fresh[offset:] + fresh[:offset]
+            picks = [ordered[i % len(ordered)] for i in range(count)]
+            questions = [{"text": text, "marks": marks, "blooms_level": level} for level, text in picks]
+            modules_out.append({"module_number": module.get("module_number"), "questions": questions})
+        sets.append({"set_number": set_number, "modules": modules_out})
+    return json.dumps({"sets": sets})
+
+
+@dataclass
+class FakeProfile:
+    latency: float
+    failure_rate: float
+
+
+def fake_profile(model: str) -> FakeProfile:
+    profiles = json.loads(settings.FAKE_LLM_PROFILES or "{}")
+    profile = profiles.get(model, {})
+    return FakeProfile(
+        latency=float(profile.get("latency", settings.FAKE_LLM_LATENCY_SECONDS)),
+        failure_rate=float(profile.get("failure_rate", settings.FAKE_LLM_FAILURE_RATE)),
+    )
+
+
+def _maybe_fail(model: str, profile: FakeProfile) -> None:
+    if profile.failure_rate > 0 and random.random() < profile.failure_rate:
+        raise HTTPException(status_code=502, detail=f"Fake provider {model} failed")
+
+
+async def fake_call(prompt: str, model: str = "fake") -> Dict[str, Any]:
+    """In-process fake provider call, following `model`'s profile."""
+    profile = fake_profile(model)
+    await asyncio.sleep(profile.latency)
+    _maybe_fail(model, profile)
+    return json.loads(fake_completion(prompt))
+
+
+async def fake_stream(prompt: str, model: str = "fake") -> AsyncIterator[str]:
+    """Like `fake_call`, but yields the answer in 64-character pieces."""
+    profile = fake_profile(model)
+    _maybe_fail(model, profile)
+    content = fake_completion(prompt)
+    pieces = [content[i : i + 64] for i in range(0, len(content), 64)]
+    for piece in pieces:
+        await asyncio.sleep(profile.latency / len(pieces))
+        yield piece
+
+
+app = FastAPI(title="Fake LLM provider")
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(body: Dict[str, Any]):
+    profile = fake_profile(body.get("model", "fake"))
+    await asyncio.sleep(profile.latency)
+    _maybe_fail(body.get("model", "fake"), profile)
+    prompt = "\n".join(str(m.get("content", "")) for m in body.get("messages", []) if m.get("role") == "user")
+    content = fake_completion(prompt)
+    if body.get("stream"):
+        return StreamingResponse(_stream_chunks(body, content), media_type="text/event-stream")
+    return {
+        "id": "fake-" + hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:12],
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4, "total_tokens": 0},
+    }
+
+
+async def _stream_chunks(body: Dict[str, Any], content: str):
+    base = {
+        "id": "fake-stream",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+    }
+    for i in range(0, len(content), 64):
+        delta = {"index": 0, "delta": {"content": content[i : i + 64]}, "finish_reason": None}
+        yield f"data: {json.dumps({**base, 'choices': [delta]})}\n\n"
+        await asyncio.sleep(0)
+    done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+    yield f"data: {json.dumps({**base, 'choices': [done]})}\n\n"
+    yield "data: [DONE]\n\n"
@@ -0,0 +1,372 @@
+"""Background queue for question paper generation.
+
+The `generation_jobs` table is the queue. `/papers/generate?background=true`
+inserts a pending row and returns immediately; workers claim rows with a
+conditional UPDATE (so several processes can share the table safely), run
+the same read / LLM / write pipeline as the synchronous route, and record
+the resulting paper ids.
+
+Each claim carries a random token. The worker renews `claimed_at` every
+`JOB_HEARTBEAT_SECONDS` while it runs, so only jobs whose worker died go
+stale and are taken over (at most `JOB_MAX_ATTEMPTS` claims in all), and a
+result is recorded only under the token that is still current. The papers
+are committed in the same transaction as the result, so a worker that lost
+its claim leaves no papers behind.
+
+Workers normally run inside the API process (`settings.JOB_WORKERS`), but
+can also be started on their own:
+
+    python -m app.jobs
+"""
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .assembly import assemble_papers, assembly_mode
+from .config import settings
+from .database import SessionLocal, run_in_session
+from .llm_service import generate_question_sets
+from .paper_service import BeforeCommit, load_generation_context, save_generated_sets
+
+logger = logging.getLogger(__name__)
+
+
+class ClaimLost(Exception):
+    """Another worker took the job over before this one recorded its result."""
+
+
+def submit_job(
+    db: Session,
+    payload: schemas.GeneratePaperRequest,
+    user_id: int,
+    idempotency_key: Optional[str] = None,
+) -> Tuple[models.GenerationJob, bool]:
+    """Queue a generation request, returning `(job, created)`.
+
+    A repeated `idempotency_key` for the same user returns the original job
+    instead of queueing the work again.
+    """
+    if idempotency_key:
+        existing = db.query(models.GenerationJob).filter(
+            models.GenerationJob.user_id == user_id,
+            models.GenerationJob.idempotency_key == idempotency_key,
+        ).first()
+        if existing:
+            return existing, False
+
+    job = models.GenerationJob(
+        user_id=user_id,
+        idempotency_key=idempotency_key,
+        status=models.JobStatus.pending,
+        request=payload.model_dump(),
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # A concurrent submission with the same key won the insert.
+        db.rollback()
+        existing = db.query(models.GenerationJob).filter(
+            models.GenerationJob.user_id == user_id,
+            models.GenerationJob.idempotency_key == idempotency_key,
+        ).first()
+        if existing:
+            return existing, False
+        raise
+    db.refresh(job)
+    job_runner.notify()
+    return job, True
+
+
+def job_papers(db: Session, job: models.GenerationJob) -> List[models.QuestionPaper]:
+    if not job.paper_ids:
+        return []
+    papers = db.query(models.QuestionPaper).filter(
+        models.QuestionPaper.id.in_(job.paper_ids),
+        models.QuestionPaper.user_id == job.user_id,
+    ).all()
+    return sorted(papers, key=lambda p: p.set_number)
+
+
+def _fail_abandoned_jobs(db: Session, stale_before: datetime) -> None:
+    """Fail stale jobs that have already used up their attempts."""
+    job = models.GenerationJob
+    abandoned = db.query(job).filter(
+        job.status == models.JobStatus.running,
+        job.claimed_at < stale_before,
+        job.attempts >= settings.JOB_MAX_ATTEMPTS,
+    ).update(
+        {
+            job.status: models.JobStatus.failed,
+            job.error: f"Abandoned after {settings.JOB_MAX_ATTEMPTS} attempts",
+            job.claim_token: None,
+            job.finished_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    db.commit()
+    if abandoned:
+        logger.warning("Failed %d generation jobs that exhausted their attempts", abandoned)
+
+
+def claim_next_job(db: Session) -> Optional[Tuple[int, str]]:
+    """Atomically mark the oldest runnable job as running.
+
+    Returns the job id and the claim token the worker must present to
+    renew the claim or finish the job, or None if nothing is runnable.
+    """
+    now = datetime.utcnow()
+    stale_before = now - timedelta(seconds=settings.JOB_STALE_SECONDS)
+    _fail_abandoned_jobs(db, stale_before)
+    job = models.GenerationJob
+    runnable = or_(
+        job.status == models.JobStatus.pending,
+        (job.status == models.JobStatus.running)
+        & (job.claimed_at < stale_before)
+        & (job.attempts < settings.JOB_MAX_ATTEMPTS),
+    )
+    candidates = db.query(job.id).filter(runnable).order_by(job.id).limit(10).all()
+    for (job_id,) in candidates:
+        token = uuid.uuid4().hex
+        claimed = (
+            db.query(job)
+            .filter(job.id == job_id, runnable)
+            .update(
+                {
+                    job.status: models.JobStatus.running,
+                    job.claimed_at: now,
+                    job.claim_token: token,
+                    job.attempts: job.attempts + 1,
+                },
+                synchronize_session=False,
+            )
+        )
+        db.commit()
+        if claimed:
+            return job_id, token
+    return None
+
+
+def renew_claim(db: Session, job_id: int, token: str) -> bool:
+    """Refresh `claimed_at` so the job is not taken over; False if it already was."""
+    job = models.GenerationJob
+    renewed = db.query(job).filter(
+        job.id == job_id,
+        job.claim_token == token,
+        job.status == models.JobStatus.running,
+    ).update({job.claimed_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+def _mark_finished(
+    db: Session, job_id: int, token: str, status: models.JobStatus, paper_ids=None, error=None
+) -> bool:
+    """Set the outcome without committing; False if the claim is no longer `token`'s."""
+    job = models.GenerationJob
+    finished = db.query(job).filter(
+        job.id == job_id,
+        job.claim_token == token,
+        job.status == models.JobStatus.running,
+    ).update(
+        {
+            job.status: status,
+            job.paper_ids: paper_ids,
+            job.error: error,
+            job.claim_token: None,
+            job.finished_at: datetime.utcnow(),
+        },
+        synchronize_session=False,
+    )
+    return bool(finished)
+
+
+def _finish_job(
+    db: Session, job_id: int, token: str, status: models.JobStatus, paper_ids=None, error=None
+) -> bool:
+    """Record the outcome, unless another worker has taken the job over."""
+    finished = _mark_finished(db, job_id, token, status, paper_ids, error)
+    db.commit()
+    if not finished:
+        logger.warning("Generation job %s was taken over by another worker; result discarded", job_id)
+    return finished
+
+
+def _record_success(job_id: int, token: str) -> BeforeCommit:
+    """Mark the job succeeded in the transaction that saves its papers."""
+
+    def record(db: Session, paper_ids: List[int]) -> None:
+        if not _mark_finished(db, job_id, token, models.JobStatus.succeeded, paper_ids):
+            raise ClaimLost(job_id)
+
+    return record
+
+
+async def _generate(
+    db: Session, payload: schemas.GeneratePaperRequest, user_id: int, before_commit: BeforeCommit
+) -> List[Dict[str, Any]]:
+    mode = assembly_mode(payload)
+    if mode != "generate":
+        await run_in_threadpool(db.close)
+        papers, _ = await assemble_papers(payload, user_id, 3, mode, before_commit)
+        return papers
+    context = await run_in_threadpool(load_generation_context, db, payload, user_id)
+    # Release the connection while waiting for the provider.
+    await run_in_threadpool(db.close)
+    llm_result = await generate_question_sets(
+        modules=context.modules,
+        reference_text=context.reference_text,
+        existing_questions=context.existing_questions,
+        num_sets=3,
+        bypass_cache=payload.bypass_cache,
+        user_id=user_id,
+    )
+    saved = await run_in_threadpool(
+        save_generated_sets, db, payload, user_id, llm_result, frozenset(), before_commit
+    )
+    return saved.papers
+
+
+async def _keep_claim(job_id: int, token: str, work: asyncio.Future) -> None:
+    """Renew the claim while `work` runs; cancel it if the claim is lost."""
+    while True:
+        await asyncio.sleep(settings.JOB_HEARTBEAT_SECONDS)
+        try:
+            held = await run_in_threadpool(run_in_session, renew_claim, job_id, token)
+        except Exception:
+            logger.exception("Failed to renew the claim on generation job %s", job_id)
+            continue
+        if not held:
+            logger.warning("Lost the claim on generation job %s; stopping it", job_id)
+            work.cancel()
+            return
+
+
+async def run_job(job_id: int, token: str) -> None:
+    db = SessionLocal()
+    try:
+        try:
+            job = await run_in_threadpool(db.get, models.GenerationJob, job_id)
+            if job is None:
+                logger.warning("Generation job %s disappeared before it ran", job_id)
+                return
+            payload = schemas.GeneratePaperRequest(**job.request)
+            user_id = job.user_id
+            # The job is marked succeeded when its papers are committed.
+            work = asyncio.ensure_future(_generate(db, payload, user_id, _record_success(job_id, token)))
+            heartbeat = asyncio.create_task(_keep_claim(job_id, token, work))
+            try:
+                await work
+            except asyncio.CancelledError:
+                if heartbeat.done():
+                    # Another worker owns the job now; leave it to them.
+                    return
+                raise
+            finally:
+                heartbeat.cancel()
+        except ClaimLost:
+            # The papers were rolled back with the result.
+            logger.warning("Generation job %s was taken over by another worker; result discarded", job_id)
+            return
+        except HTTPException as e:
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(_finish_job, db, job_id, token, models.JobStatus.failed, None, str(e.detail))
+            return
+        except Exception as e:
+            logger.exception("Generation job %s failed", job_id)
+            await run_in_threadpool(db.rollback)
+            await run_in_threadpool(_finish_job, db, job_id, token, models.JobStatus.failed, None, str(e))
+            return
+    finally:
+        db.close()
+
+
+def _fail_job(db: Session, job_id: int, token: str, error: str) -> None:
+    _finish_job(db, job_id, token, models.JobStatus.failed, None, error)
+
+
+class JobRunner:
+    """A fixed pool of asyncio workers draining the `generation_jobs` table."""
+
+    def __init__(self, num_workers: int):
+        self.num_workers = num_workers
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def notify(self) -> None:
+        """Wake idle workers; safe to call from any thread."""
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    async def _claim(self) -> Optional[Tuple[int, str]]:
+        def claim():
+            db = SessionLocal()
+            try:
+                return claim_next_job(db)
+            finally:
+                db.close()
+
+        return await run_in_threadpool(claim)
+
+    async def _worker(self) -> None:
+        while True:
+            # Clear before claiming so a submission that lands mid-claim
+            # still wakes us for the next round.
+            self._wakeup.clear()
+            try:
+                claim = await self._claim()
+            except Exception:
+                logger.exception("Failed to claim generation job")
+                claim = None
+            if claim is not None:
+                try:
+                    await run_job(*claim)
+                except Exception as e:
+                    # Keep the worker alive whatever went wrong with this job.
+                    logger.exception("Generation job %s crashed", claim[0])
+                    try:
+                        await run_in_threadpool(run_in_session, _fail_job, *claim, str(e))
+                    except Exception:
+                        logger.exception("Failed to mark generation job %s as failed", claim[0])
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.JOB_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self) -> None:
+        if self._tasks or self.num_workers <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.num_workers)]
+
+    async def run_forever(self) -> None:
+        self.start()
+        await asyncio.gather(*self._tasks)
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+
+job_runner = JobRunner(num_workers=settings.JOB_WORKERS)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(JobRunner(num_workers=max(settings.JOB_WORKERS, 1)).run_forever())
@@ -0,0 +1,220 @@
+"""Incremental parsing of `{"sets": [...]}` answers as they stream in.
+
+`QuestionStreamParser` is fed the provider's text a chunk at a time and
+returns every question object as soon as its closing brace arrives, tagged
+with the set and module it belongs to. It tracks only string/escape state and
+a stack of open containers, so each character is looked at once.
+
+Because completed questions are kept as they are seen, an answer that stops
+mid-way (token limit, dropped connection, trailing garbage) still yields the
+questions before the break; `parse_answer` uses that to recover partial
+results from non-streamed answers that `json.loads` rejects.
+"""
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+
+@dataclass
+class StreamedQuestion:
+    set_number: int
+    module_number: Optional[int]
+    question: Dict[str, Any]
+
+
+@dataclass
+class _Frame:
+    kind: str  # "{" or "["
+    key: Optional[str]  # key this container is the value of, if any
+    start: int
+    index: int  # position within the parent array
+    fields: Dict[str, Any] = field(default_factory=dict)
+    items: int = 0
+
+
+class QuestionStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.questions: List[StreamedQuestion] = []
+        self._stack: List[_Frame] = []
+        self._started = False
+        self._done = False
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._pending_key: Optional[str] = None
+        self._expect_key = False
+        self._scalar_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[StreamedQuestion]:
+        """Consume `chunk` and return the questions it completed."""
+        self.text += chunk
+        emitted: List[StreamedQuestion] = []
+        text = self.text
+        while self.pos < len(text) and not self._done:
+            ch = text[self.pos]
+            if not self._started:
+                # Skip any preamble such as a ```json fence.
+                if ch == "{":
+                    self._started = True
+                    self._open("{")
+                self.pos += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._end_string()
+                self.pos += 1
+                continue
+
+            if self._scalar_start is not None and (ch in ",}]" or ch.isspace()):
+                self._end_scalar()
+
+            if ch == '"':
+                self._in_string = True
+                self._string_start = self.pos
+            elif ch in "{[":
+                self._open(ch)
+            elif ch in "}]":
+                question = self._close()
+                if question is not None:
+                    emitted.append(question)
+            elif ch == ",":
+                if self._stack and self._stack[-1].kind == "{":
+                    self._expect_key = True
+            elif not ch.isspace() and ch != ":" and self._scalar_start is None:
+                self._scalar_start = self.pos
+            self.pos += 1
+        self.questions.extend(emitted)
+        return emitted
+
+    @property
+    def complete(self) -> bool:
+        """Whether the outermost object has been closed."""
+        return self._done
+
+    def _open(self, kind: str) -> None:
+        parent = self._stack[-1] if self._stack else None
+        index = 0
+        key = None
+        if parent is not None:
+            if parent.kind == "[":
+                index = parent.items
+                parent.items += 1
+                key = parent.key
+            else:
+                key = self._pending_key
+        self._stack.append(_Frame(kind=kind, key=key, start=self.pos, index=index))
+        self._pending_key = None
+        self._expect_key = kind == "{"
+
+    def _close(self) -> Optional[StreamedQuestion]:
+        if not self._stack:
+            return None
+        frame = self._stack.pop()
+        if not self._stack:
+            self._done = True
+            return None
+        parent = self._stack[-1]
+        self._expect_key = False
+        if frame.kind == "{" and parent.kind == "[" and parent.key == "questions":
+            try:
+                question = json.loads(self.text[frame.start : self.pos + 1])
+            except json.JSONDecodeError:
+                return None
+            return self._tag(question)
+        return None
+
+    def _tag(self, question: Dict[str, Any]) -> StreamedQuestion:
+        # Stack: root {, "sets" [, set {, "modules" [, module {, "questions" [
+        set_frame = next((f for f in self._stack if f.kind == "{" and f.key == "sets"), None)
+        module_frame = next((f for f in self._stack if f.kind == "{" and f.key == "modules"), None)
+        set_number = 1
+        if set_frame is not None:
+            set_number = _as_int(set_frame.fields.get("set_number")) or set_frame.index + 1
+        module_number = None
+        if module_frame is not None:
+            module_number = _as_int(module_frame.fields.get("module_number")) or module_frame.index + 1
+        return StreamedQuestion(set_number=set_number, module_number=module_number, question=question)
+
+    def _end_string(self) -> None:
+        raw = self.text[self._string_start : self.pos + 1]
+        frame = self._stack[-1] if self._stack else None
+        if frame is None:
+            return
+        if frame.kind == "{" and self._expect_key:
+            self._pending_key = json.loads(raw)
+            self._expect_key = False
+        elif frame.kind == "[":
+            frame.items += 1
+        elif self._pending_key is not None:
+            frame.fields[self._pending_key] = json.loads(raw)
+            self._pending_key = None
+
+    def _end_scalar(self) -> None:
+        raw = self.text[self._scalar_start : self.pos]
+        self._scalar_start = None
+        frame = self._stack[-1] if self._stack else None
+        if frame is None:
+            return
+        if frame.kind == "[":
+            frame.items += 1
+            return
+        if self._pending_key is not None:
+            try:
+                frame.fields[self._pending_key] = json.loads(raw)
+            except json.JSONDecodeError:
+                pass
+            self._pending_key = None
+
+    def result(self) -> Dict[str, Any]:
+        """Questions seen so far, assembled into the `{"sets": [...]}` shape."""
+        return assemble(self.questions)
+
+
+def assemble(questions: List[StreamedQuestion]) -> Dict[str, Any]:
+    sets: Dict[int, Dict[Optional[int], List[Dict[str, Any]]]] = {}
+    for item in questions:
+        sets.setdefault(item.set_number, {}).setdefault(item.module_number, []).append(item.question)
+    return {
+        "sets": [
+            {
+                "set_number": set_number,
+                "modules": [{"module_number": m, "questions": qs} for m, qs in modules.items()],
+            }
+            for set_number, modules in sorted(sets.items())
+        ]
+    }
+
+
+def parse_answer(text: str) -> Dict[str, Any]:
+    """Parse a complete answer, recovering the finished questions if it is malformed.
+
+    Raises `ValueError` if no JSON object is found and no question could be
+    recovered.
+    """
+    start = text.find("{")
+    end = text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start : end + 1])
+        except json.JSONDecodeError:
+            pass
+    parser = QuestionStreamParser()
+    parser.feed(text)
+    if not parser.questions:
+        raise ValueError("answer contains no parseable questions")
+    return parser.result()
+
+
+def _as_int(value: Any) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,141 @@
+"""Fair, coalescing dispatch of provider calls across requests.
+
+With `LLM_BATCHING` on, `call_provider` hands cache misses to a dispatcher
+instead of calling the provider router directly. The dispatcher:
+
+- waits `LLM_BATCH_WINDOW_MS` after the first prompt of a burst so that
+  prompts from requests arriving together are scheduled together;
+- coalesces identical prompts that are queued or in flight, so concurrent
+  requests for the same unit share a single provider call;
+- keeps one queue per user and hands out the `LLM_MAX_CONCURRENCY`
+  provider slots round-robin across users, so a user with a large job gets
+  one slot per round instead of crowding out everyone queued behind them.
+
+The providers' batch APIs complete within hours rather than seconds, which
+does not suit requests that wait for their papers, so batching here means
+sharing one rate-limited budget rather than submitting batch files.
+Streaming requests are not routed through the dispatcher.
+"""
+import asyncio
+import weakref
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+from .config import settings
+
+CallFn = Callable[[str], Awaitable[Dict[str, Any]]]
+
+
+class FairDispatcher:
+    """Round-robin scheduler over per-user queues of prompts, for one event loop."""
+
+    def __init__(self, call: CallFn, slots: int, window_seconds: float, counters: Dict[str, int]):
+        self.call = call
+        self.slots = max(slots, 1)
+        self.window_seconds = window_seconds
+        self.counters = counters
+        self._queues: "OrderedDict[Hashable, Deque[str]]" = OrderedDict()
+        self._futures: Dict[str, asyncio.Future] = {}
+        self._running = 0
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # The loop only keeps weak references to tasks; hold the in-flight
+        # dispatches so none is collected before it resolves its future.
+        self._dispatches: Set[asyncio.Task] = set()
+
+    @property
+    def queued(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def users_waiting(self) -> int:
+        return len(self._queues)
+
+    async def submit(self, prompt: str, user: Hashable) -> Dict[str, Any]:
+        future = self._futures.get(prompt)
+        if future is not None:
+            self.counters["coalesced"] += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            self._futures[prompt] = future
+            self._queues.setdefault(user, deque()).append(prompt)
+            self.counters["queued"] += 1
+            self.counters["max_queue_depth"] = max(self.counters["max_queue_depth"], self.queued)
+            self._wakeup.set()
+            if self._task is None or self._task.done():
+                self._task = asyncio.create_task(self._run())
+        # Shielded so one waiter giving up does not cancel the shared call.
+        return await asyncio.shield(future)
+
+    async def _run(self) -> None:
+        # Started by the first prompt after an idle period: let the burst gather.
+        if self.window_seconds > 0:
+            await asyncio.sleep(self.window_seconds)
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._running < self.slots and self._queues:
+                user, queue = next(iter(self._queues.items()))
+                prompt = queue.popleft()
+                # Move this user to the back of the rotation.
+                del self._queues[user]
+                if queue:
+                    self._queues[user] = queue
+                self._running += 1
+                self.counters["dispatched"] += 1
+                task = asyncio.create_task(self._dispatch(prompt))
+                self._dispatches.add(task)
+                task.add_done_callback(self._dispatches.discard)
+            if not self._queues and self._running == 0:
+                return
+
+    async def _dispatch(self, prompt: str) -> None:
+        future = self._futures[prompt]
+        try:
+            result = await self.call(prompt)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            # Nobody may be waiting any more; avoid "exception never retrieved".
+            future.exception()
+        else:
+            if not future.done():
+                future.set_result(result)
+        finally:
+            del self._futures[prompt]
+            self._running -= 1
+            self._wakeup.set()
+
+
+class LLMBatcher:
+    """Holds one `FairDispatcher` per event loop and shared counters."""
+
+    def __init__(self, call: CallFn):
+        self.call = call
+        self.counters: Dict[str, int] = {"queued": 0, "dispatched": 0, "coalesced": 0, "max_queue_depth": 0}
+        self._dispatchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, FairDispatcher]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _dispatcher(self) -> FairDispatcher:
+        loop = asyncio.get_running_loop()
+        dispatcher = self._dispatchers.get(loop)
+        if dispatcher is None:
+            dispatcher = FairDispatcher(
+                self.call,
+                slots=settings.LLM_MAX_CONCURRENCY,
+                window_seconds=settings.LLM_BATCH_WINDOW_MS / 1000,
+                counters=self.counters,
+            )
+            self._dispatchers[loop] = dispatcher
+        return dispatcher
+
+    async def submit(self, prompt: str, user: Hashable = None) -> Dict[str, Any]:
+        return await self._dispatcher().submit(prompt, user)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            **self.counters,
+            "waiting": sum(d.queued for d in list(self._dispatchers.values())),
+            "users_waiting": sum(d.users_waiting for d in list(self._dispatchers.values())),
+        }
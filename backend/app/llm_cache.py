@@ -0,0 +1,240 @@
+"""Content-addressed cache of LLM responses.
+
+Regenerating with the same syllabus, references and modules produces the
+same prompt, so provider answers are cached under a hash of provider, model,
+whitespace-normalized prompt and temperature. Cached answers are still
+passed through the duplicate filter in `paper_service.save_generated_sets`,
+so a hit never reintroduces questions the user already has.
+
+`settings.LLM_CACHE_BACKEND` selects the storage:
+
+- `memory`: per-process LRU
+- `db`: the `llm_cache_entries` table, shared by all workers
+- `disk`: one JSON file per entry under `settings.LLM_CACHE_DIR`
+- `none`: disabled
+
+Every backend honours `LLM_CACHE_TTL_SECONDS` and evicts least recently used
+entries beyond `LLM_CACHE_MAX_ENTRIES`.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+from .config import settings
+from .database import SessionLocal
+from . import models
+
+
+def cache_key(provider: str, model: str, prompt: str, temperature: float) -> str:
+    normalized_prompt = " ".join(prompt.split())
+    material = json.dumps([provider, model, normalized_prompt, round(temperature, 4)], ensure_ascii=False)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class CacheBackend:
+    """Interface for response cache storage; subclasses must be thread-safe."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": type(self).__name__, **self.counters}
+
+
+class MemoryCacheBackend(CacheBackend):
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.time():
+                if entry is not None:
+                    del self._entries[key]
+                self.counters["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry[1]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            self.counters["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {**super().stats(), "entries": len(self._entries)}
+
+
+class DatabaseCacheBackend(CacheBackend):
+    """Stores entries in `llm_cache_entries` so all workers share one cache."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int):
+        super().__init__(ttl_seconds, max_entries)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            entry = db.get(models.LLMCacheEntry, key)
+            now = datetime.utcnow()
+            if entry is None or entry.expires_at < now:
+                with self._lock:
+                    self.counters["misses"] += 1
+                return None
+            entry.last_used_at = now
+            response = entry.response
+            db.commit()
+            with self._lock:
+                self.counters["hits"] += 1
+            return response
+        finally:
+            db.close()
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            entry = db.get(models.LLMCacheEntry, key)
+            if entry is None:
+                entry = models.LLMCacheEntry(key=key)
+                db.add(entry)
+            entry.response = value
+            entry.expires_at = now + timedelta(seconds=self.ttl_seconds)
+            entry.last_used_at = now
+            db.commit()
+            evicted = self._evict(db, now)
+            with self._lock:
+                self.counters["stores"] += 1
+                self.counters["evictions"] += evicted
+        finally:
+            db.close()
+
+    def _evict(self, db, now: datetime) -> int:
+        evicted = (
+            db.query(models.LLMCacheEntry)
+            .filter(models.LLMCacheEntry.expires_at < now)
+            .delete(synchronize_session=False)
+        )
+        overflow = db.query(models.LLMCacheEntry).count() - self.max_entries
+        if overflow > 0:
+            oldest = [
+                k
+                for (k,) in db.query(models.LLMCacheEntry.key)
+                .order_by(models.LLMCacheEntry.last_used_at)
+                .limit(overflow)
+                .all()
+            ]
+            evicted += (
+                db.query(models.LLMCacheEntry)
+                .filter(models.LLMCacheEntry.key.in_(oldest))
+                .delete(synchronize_session=False)
+            )
+        db.commit()
+        return evicted
+
+
+class DiskCacheBackend(CacheBackend):
+    """One JSON file per entry; file mtime doubles as the LRU timestamp."""
+
+    def __init__(self, ttl_seconds: int, max_entries: int, directory: str):
+        super().__init__(ttl_seconds, max_entries)
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self.counters["misses"] += 1
+            return None
+        if entry.get("expires_at", 0) < time.time():
+            with self._lock:
+                self.counters["misses"] += 1
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        with self._lock:
+            self.counters["hits"] += 1
+        return entry["response"]
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"expires_at": time.time() + self.ttl_seconds, "response": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        evicted = self._evict()
+        with self._lock:
+            self.counters["stores"] += 1
+            self.counters["evictions"] += evicted
+
+    def _evict(self) -> int:
+        entries = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    path = os.path.join(root, name)
+                    try:
+                        entries.append((os.path.getmtime(path), path))
+                    except OSError:
+                        pass
+        overflow = len(entries) - self.max_entries
+        if overflow <= 0:
+            return 0
+        evicted = 0
+        for _, path in sorted(entries)[:overflow]:
+            try:
+                os.remove(path)
+                evicted += 1
+            except OSError:
+                pass
+        return evicted
+
+
+def create_cache_backend() -> Optional[CacheBackend]:
+    backend = settings.LLM_CACHE_BACKEND
+    ttl, max_entries = settings.LLM_CACHE_TTL_SECONDS, settings.LLM_CACHE_MAX_ENTRIES
+    if backend == "memory":
+        return MemoryCacheBackend(ttl, max_entries)
+    if backend == "db":
+        return DatabaseCacheBackend(ttl, max_entries)
+    if backend == "disk":
+        return DiskCacheBackend(ttl, max_entries, settings.LLM_CACHE_DIR)
+    return None
+
+
+response_cache = create_cache_backend()
@@ -0,0 +1,354 @@
+"""Routing of LLM calls over an ordered list of providers.
+
+`settings.LLM_PROVIDERS` lists providers in order of preference, each as
+`kind` or `kind:model` (for example `openai:gpt-4o-mini,gemini,fake`). For
+every call the router:
+
+- skips providers whose circuit breaker is open, i.e. that failed
+  `LLM_BREAKER_FAILURES` times in a row within the last
+  `LLM_BREAKER_RESET_SECONDS`; after that period one trial call is let
+  through and its outcome closes or re-opens the breaker;
+- takes a token from the provider's rate-limit bucket, waiting up to
+  `LLM_RATE_LIMIT_MAX_WAIT_SECONDS` for one and otherwise moving on to the
+  next provider. With `LLM_RATE_LIMIT_BACKEND=db` the buckets live in the
+  `llm_rate_buckets` table and are shared by every worker;
+- hedges: if the provider has not answered after `LLM_HEDGE_AFTER_SECONDS`,
+  the same request is sent to the next provider as well and whichever
+  answers first wins;
+- fails over to the next provider on error, and raises the last error once
+  every provider has failed or been skipped.
+
+Streams fail over the same way, but only until their first chunk, and are
+not hedged.
+"""
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.exc import IntegrityError
+
+from .config import settings
+from .database import SessionLocal
+from . import models
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ProviderSpec:
+    kind: str
+    model: str
+
+    @property
+    def name(self) -> str:
+        return f"{self.kind}:{self.model}"
+
+
+def parse_providers(value: str, default_models: Dict[str, str]) -> List[ProviderSpec]:
+    specs = []
+    for entry in value.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        kind, _, model = entry.partition(":")
+        specs.append(ProviderSpec(kind=kind.strip(), model=model.strip() or default_models.get(kind.strip(), kind)))
+    return specs
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open -> closed."""
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def release_trial(self) -> None:
+        """Give back a half-open trial that ended without a verdict."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failure_threshold > 0 and (self.failures >= self.failure_threshold or self.opened_at is not None):
+                self.opened_at = time.monotonic()
+
+
+class TokenBucket:
+    """Interface: `take(name)` returns 0 if a token was taken, else seconds to wait."""
+
+    def __init__(self, rate_per_second: float, burst: float):
+        self.rate = rate_per_second
+        self.burst = max(burst, 1.0)
+
+    def _refill(self, tokens: float, updated_at: float, now: float) -> float:
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def take(self, name: str) -> float:
+        raise NotImplementedError
+
+
+class MemoryTokenBucket(TokenBucket):
+    """Per-process buckets."""
+
+    def __init__(self, rate_per_second: float, burst: float):
+        super().__init__(rate_per_second, burst)
+        self._buckets: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, name: str) -> float:
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(name, (self.burst, now))
+            tokens = self._refill(tokens, updated_at, now)
+            if tokens >= 1:
+                self._buckets[name] = [tokens - 1, now]
+                return 0.0
+            self._buckets[name] = [tokens, now]
+            return (1 - tokens) / self.rate
+
+
+class DatabaseTokenBucket(TokenBucket):
+    """Buckets in `llm_rate_buckets`, updated under a row lock so all workers share them."""
+
+    def take(self, name: str) -> float:
+        db = SessionLocal()
+        try:
+            now = time.time()
+            row = db.query(models.LLMRateBucket).filter(models.LLMRateBucket.name == name).with_for_update().first()
+            if row is None:
+                db.add(models.LLMRateBucket(name=name, tokens=self.burst - 1, updated_at=now))
+                try:
+                    db.commit()
+                    return 0.0
+                except IntegrityError:
+                    # Another worker created it first; use theirs.
+                    db.rollback()
+                    return self.take(name)
+            tokens = self._refill(row.tokens, row.updated_at, now)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+            row.tokens = tokens
+            row.updated_at = now
+            db.commit()
+            return wait
+        finally:
+            db.close()
+
+
+def create_rate_limiter() -> Optional[TokenBucket]:
+    if settings.LLM_RATE_LIMIT_PER_MINUTE <= 0:
+        return None
+    rate = settings.LLM_RATE_LIMIT_PER_MINUTE / 60.0
+    if settings.LLM_RATE_LIMIT_BACKEND == "db":
+        return DatabaseTokenBucket(rate, settings.LLM_RATE_LIMIT_BURST)
+    return MemoryTokenBucket(rate, settings.LLM_RATE_LIMIT_BURST)
+
+
+CallFn = Callable[[str, str], Awaitable[Dict[str, Any]]]
+StreamFn = Callable[[str, str], AsyncIterator[str]]
+
+
+class ProviderRouter:
+    def __init__(
+        self,
+        specs: List[ProviderSpec],
+        calls: Dict[str, CallFn],
+        streams: Dict[str, StreamFn],
+        rate_limiter: Optional[TokenBucket] = None,
+    ):
+        if not specs:
+            raise ValueError("at least one provider is required")
+        self.specs = specs
+        self.calls = calls
+        self.streams = streams
+        self.rate_limiter = rate_limiter
+        self.breakers = {
+            spec.name: CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET_SECONDS)
+            for spec in specs
+        }
+        self.counters: Dict[str, Dict[str, int]] = {
+            spec.name: {"calls": 0, "failures": 0, "skipped_open": 0, "rate_limited": 0, "hedges": 0, "hedge_wins": 0}
+            for spec in specs
+        }
+
+    @property
+    def primary(self) -> ProviderSpec:
+        return self.specs[0]
+
+    async def _acquire(self, spec: ProviderSpec) -> bool:
+        """Take a rate-limit token for `spec`, or give up if the wait is too long."""
+        if self.rate_limiter is None:
+            return True
+        waited = 0.0
+        while True:
+            wait = await run_in_threadpool(self.rate_limiter.take, spec.name)
+            if wait <= 0:
+                return True
+            if waited + wait > settings.LLM_RATE_LIMIT_MAX_WAIT_SECONDS:
+                self.counters[spec.name]["rate_limited"] += 1
+                return False
+            await asyncio.sleep(wait)
+            waited += wait
+
+    async def _available(self, start: int) -> Optional[int]:
+        """Index of the first provider from `start` that may be called now."""
+        for i in range(start, len(self.specs)):
+            spec = self.specs[i]
+            if not self.breakers[spec.name].allow():
+                self.counters[spec.name]["skipped_open"] += 1
+                continue
+            if await self._acquire(spec):
+                return i
+            # The breaker may have granted its half-open trial; give it back.
+            self.breakers[spec.name].release_trial()
+        return None
+
+    async def _attempt(self, spec: ProviderSpec, prompt: str) -> Dict[str, Any]:
+        self.counters[spec.name]["calls"] += 1
+        try:
+            result = await self.calls[spec.kind](prompt, spec.model)
+        except asyncio.CancelledError:
+            # Lost a hedge race; says nothing about the provider's health.
+            self.breakers[spec.name].release_trial()
+            raise
+        except Exception:
+            self.counters[spec.name]["failures"] += 1
+            self.breakers[spec.name].record_failure()
+            raise
+        self.breakers[spec.name].record_success()
+        return result
+
+    async def call(self, prompt: str) -> Dict[str, Any]:
+        """Answer `prompt` from the first healthy provider, hedging slow ones."""
+        last_error: Optional[Exception] = None
+        running: Dict[asyncio.Task, ProviderSpec] = {}
+        hedges: Set[asyncio.Task] = set()
+        next_index = 0
+        try:
+            while True:
+                if not running:
+                    index = await self._available(next_index)
+                    if index is None:
+                        break
+                    next_index = index + 1
+                    running[asyncio.create_task(self._attempt(self.specs[index], prompt))] = self.specs[index]
+
+                hedge_after = settings.LLM_HEDGE_AFTER_SECONDS
+                can_hedge = hedge_after > 0 and len(running) == 1 and next_index < len(self.specs)
+                done, _ = await asyncio.wait(
+                    running,
+                    timeout=hedge_after if can_hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    index = await self._available(next_index)
+                    if index is not None:
+                        next_index = index + 1
+                        spec = self.specs[index]
+                        self.counters[spec.name]["hedges"] += 1
+                        logger.info("Hedging slow LLM call to %s", spec.name)
+                        task = asyncio.create_task(self._attempt(spec, prompt))
+                        running[task] = spec
+                        hedges.add(task)
+                    else:
+                        next_index = len(self.specs)
+                    continue
+
+                for task in done:
+                    spec = running.pop(task)
+                    if task.exception() is None:
+                        if task in hedges:
+                            self.counters[spec.name]["hedge_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning("LLM provider %s failed: %s", spec.name, getattr(last_error, "detail", last_error))
+        finally:
+            for task in running:
+                task.cancel()
+
+        if last_error is not None:
+            raise last_error
+        raise HTTPException(status_code=503, detail="No LLM provider is currently available.")
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Stream from the first healthy provider, failing over before the first chunk."""
+        last_error: Optional[Exception] = None
+        next_index = 0
+        while True:
+            index = await self._available(next_index)
+            if index is None:
+                break
+            next_index = index + 1
+            spec = self.specs[index]
+            self.counters[spec.name]["calls"] += 1
+            started = False
+            verdict = False
+            try:
+                async for chunk in self.streams[spec.kind](prompt, spec.model):
+                    started = True
+                    yield chunk
+                verdict = True
+                self.breakers[spec.name].record_success()
+                return
+            except Exception as e:
+                verdict = True
+                self.counters[spec.name]["failures"] += 1
+                self.breakers[spec.name].record_failure()
+                if started:
+                    raise
+                last_error = e
+                logger.warning("LLM provider %s failed: %s", spec.name, getattr(e, "detail", e))
+                continue
+            finally:
+                if not verdict:
+                    # Closed or cancelled by the consumer (e.g. the client
+                    # disconnected); give back a half-open trial, as `_attempt` does.
+                    self.breakers[spec.name].release_trial()
+
+        if last_error is not None:
+            raise last_error
+        raise HTTPException(status_code=503, detail="No LLM provider is currently available.")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            spec.name: {**self.counters[spec.name], "breaker": self.breakers[spec.name].state}
+            for spec in self.specs
+        }
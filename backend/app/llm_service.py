@@ -1,30 +1,107 @@
+import asyncio
 import json
-from typing import List, Dict, Any
+import logging
+import random
+import weakref
+from typing import Any, AsyncIterator, Awaitable, Dict, List, Optional, Tuple, TypeVar
 
+import httpx
 from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
 
 from .config import settings
-from .utils import filter_reference_by_topics
+from .fake_llm import fake_call, fake_stream
+from .llm_batcher import LLMBatcher
+from .json_stream import QuestionStreamParser, parse_answer
+from .llm_router import ProviderRouter, create_rate_limiter, parse_providers
+from .llm_cache import cache_key, response_cache
 
 import openai
-from openai import OpenAI
+from openai import AsyncOpenAI
 import google.generativeai as genai
 from google.api_core import exceptions as google_exceptions
 
-openai_client = None
-if settings.LLM_PROVIDER == "openai" and settings.OPENAI_API_KEY:
-    openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+logger = logging.getLogger(__name__)
 
-if settings.LLM_PROVIDER == "gemini" and settings.GEMINI_API_KEY:
+T = TypeVar("T")
+
+if settings.GEMINI_API_KEY:
     genai.configure(api_key=settings.GEMINI_API_KEY)
 
+# Async clients and the concurrency limiter are bound to the event loop they
+# are first used on, so keep one of each per running loop.
+_openai_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncOpenAI]" = weakref.WeakKeyDictionary()
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+
+def get_openai_client() -> Optional[AsyncOpenAI]:
+    """Return the pooled OpenAI client for the running event loop."""
+    if not settings.OPENAI_API_KEY:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _openai_clients.get(loop)
+    if client is None:
+        client = AsyncOpenAI(
+            api_key=settings.OPENAI_API_KEY,
+            base_url=settings.OPENAI_BASE_URL or None,
+            timeout=settings.LLM_TIMEOUT_SECONDS,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=settings.LLM_MAX_CONCURRENCY,
+                    max_keepalive_connections=settings.LLM_MAX_CONCURRENCY,
+                ),
+            ),
+        )
+        _openai_clients[loop] = client
+    return client
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(settings.LLM_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+
+# Context window per provider, in tokens, and how much of it to keep free for
+# the instructions, module spec, question history and the answer.
+PROVIDER_CONTEXT_TOKENS = {"openai": 128_000, "gemini": 1_000_000, "fake": 16_000}
+PROMPT_RESERVED_TOKENS = 8_000
+
+
+def reference_token_budget() -> int:
+    """Tokens of reference content to put in a prompt for the configured provider."""
+    # Any provider in the chain may end up answering, so fit the smallest.
+    context = min(PROVIDER_CONTEXT_TOKENS.get(spec.kind, 16_000) for spec in llm_router.specs)
+    return max(min(settings.REFERENCE_TOKEN_BUDGET, context - PROMPT_RESERVED_TOKENS), 0)
+
+
+def reference_char_budget() -> int:
+    """Characters of reference text `build_prompt` keeps (~4 per token)."""
+    return reference_token_budget() * 4
+
 
 def build_prompt(
     modules: List[Dict[str, Any]],
     reference_text: str,
     existing_questions: List[str],
     num_sets: int = 3,
+    set_number: Optional[int] = None,
+    single_module: bool = False,
 ) -> str:
+    reference_chars = reference_char_budget()
+    if set_number is None:
+        sets_instruction = f"Generate {num_sets} DISTINCT sets of question papers."
+    else:
+        sets_instruction = (
+            f"Generate exactly ONE set of question papers, numbered {set_number}. "
+            f"It is set {set_number} of {num_sets}; other sets are generated separately, "
+            "so vary question wording and emphasis accordingly."
+        )
+    if single_module:
+        sets_instruction += " Only the single module below is requested; the other modules are generated separately."
     return f"""
 You are an assistant that generates university examination question papers.
 
@@ -33,7 +110,7 @@ CONSTRAINTS:
 - NO questions should be outside these syllabus topics and reference content.
 - Respect the number of questions and marks for each module.
 - Use Bloom's taxonomy levels (Remember, Understand, Apply, Analyze, Evaluate, Create).
-- Generate {num_sets} DISTINCT sets of question papers.
+- {sets_instruction}
 - Absolutely NO repetition of any question text across:
   - different sets in this response
   - and this list of previously used questions:
@@ -43,7 +120,7 @@ MODULES (input specification):
 {json.dumps(modules, ensure_ascii=False, indent=2)}
 
 REFERENCE CONTENT (filtered by topics, concatenated syllabus + reference books + reference question papers):
-{reference_text[:12000]}
+{reference_text[:reference_chars]}
 
 OUTPUT FORMAT:
 Return ONLY JSON with this exact structure (no extra text):
@@ -51,7 +128,7 @@ Return ONLY JSON with this exact structure (no extra text):
 {{
   "sets": [
     {{
-      "set_number": 1,
+      "set_number": {set_number or 1},
       "modules": [
         {{
           "module_number": 1,
@@ -70,26 +147,27 @@ Return ONLY JSON with this exact structure (no extra text):
     """
 
 
-def call_openai(prompt: str) -> Dict[str, Any]:
+async def call_openai(prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
     """Call OpenAI chat completions API and return parsed JSON.
 
     Any provider-side errors are converted into HTTPException so the API
     returns a clean 4xx/5xx instead of a raw traceback.
     """
-    if not openai_client:
+    client = get_openai_client()
+    if not client:
         raise HTTPException(status_code=503, detail="OpenAI client not initialized.")
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await client.chat.completions.create(
+            model=model or settings.OPENAI_MODEL,
             messages=[
                 {"role": "system", "content": "You generate exam questions strictly from provided content."},
                 {"role": "user", "content": prompt},
             ],
-            temperature=0.7,
+            temperature=settings.LLM_TEMPERATURE,
             max_tokens=2400,
         )
         content = response.choices[0].message.content
-        return json.loads(content)
+        return parse_answer(content)
     except openai.RateLimitError as e:
         # More user-friendly message when quota is exhausted.
         raise HTTPException(
@@ -100,21 +178,20 @@ def call_openai(prompt: str) -> Dict[str, Any]:
         raise HTTPException(status_code=502, detail=f"OpenAI error: {str(e)}") from e
 
 
-def call_gemini(prompt: str) -> Dict[str, Any]:
+async def call_gemini(prompt: str, model: Optional[str] = None) -> Dict[str, Any]:
     """Call Gemini and return parsed JSON.
 
     Uses a widely available model name and converts common provider errors
     into HTTPException with clear messages.
     """
     try:
-        # Use the requested Gemini model; adjust here if your project uses a different one.
-        model = genai.GenerativeModel("gemini-2.5-pro")
-        response = model.generate_content(prompt)
-        text = response.text.strip()
-        start = text.find("{")
-        end = text.rfind("}")
-        json_text = text[start : end + 1]
-        return json.loads(json_text)
+        gemini = genai.GenerativeModel(model or settings.GEMINI_MODEL)
+        response = await gemini.generate_content_async(
+            prompt,
+            generation_config={"temperature": settings.LLM_TEMPERATURE},
+            request_options={"timeout": settings.LLM_TIMEOUT_SECONDS},
+        )
+        return parse_answer(response.text)
     except google_exceptions.NotFound as e:
         raise HTTPException(
             status_code=503,
@@ -127,16 +204,391 @@ def call_gemini(prompt: str) -> Dict[str, Any]:
         raise HTTPException(status_code=502, detail=f"Gemini error: {str(e)}") from e
 
 
-def generate_question_sets(
+async def stream_openai(prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+    client = get_openai_client()
+    if not client:
+        raise HTTPException(status_code=503, detail="OpenAI client not initialized.")
+    try:
+        stream = await client.chat.completions.create(
+            model=model or settings.OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": "You generate exam questions strictly from provided content."},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=settings.LLM_TEMPERATURE,
+            max_tokens=2400,
+            stream=True,
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except openai.RateLimitError as e:
+        raise HTTPException(
+            status_code=503,
+            detail="OpenAI quota exceeded. Please check your OpenAI billing/plan or switch LLM provider.",
+        ) from e
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"OpenAI error: {str(e)}") from e
+
+
+async def stream_gemini(prompt: str, model: Optional[str] = None) -> AsyncIterator[str]:
+    try:
+        gemini = genai.GenerativeModel(model or settings.GEMINI_MODEL)
+        response = await gemini.generate_content_async(
+            prompt,
+            generation_config={"temperature": settings.LLM_TEMPERATURE},
+            request_options={"timeout": settings.LLM_TIMEOUT_SECONDS},
+            stream=True,
+        )
+        async for chunk in response:
+            yield chunk.text
+    except google_exceptions.NotFound as e:
+        raise HTTPException(
+            status_code=503,
+            detail=(
+                "Gemini model not available or not enabled for this project. "
+                "Check your Google AI Studio configuration or adjust the model name."
+            ),
+        ) from e
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Gemini error: {str(e)}") from e
+
+
+def _bounded(call):
+    """Hold a concurrency slot for each provider call, hedges included."""
+
+    async def bounded_call(prompt: str, model: str) -> Dict[str, Any]:
+        async with _llm_semaphore():
+            return await call(prompt, model)
+
+    return bounded_call
+
+
+llm_router = ProviderRouter(
+    parse_providers(
+        settings.LLM_PROVIDERS,
+        {"openai": settings.OPENAI_MODEL, "gemini": settings.GEMINI_MODEL, "fake": "fake"},
+    ),
+    calls={"openai": _bounded(call_openai), "gemini": _bounded(call_gemini), "fake": _bounded(fake_call)},
+    streams={"openai": stream_openai, "gemini": stream_gemini, "fake": fake_stream},
+    rate_limiter=create_rate_limiter(),
+)
+
+
+llm_batcher = LLMBatcher(llm_router.call)
+
+
+def _cache_key(prompt: str) -> str:
+    # Keyed on the whole chain: the answer may come from any provider in it.
+    chain = ",".join(spec.name for spec in llm_router.specs)
+    return cache_key(chain, "", prompt, settings.LLM_TEMPERATURE)
+
+
+async def call_provider(prompt: str, bypass_cache: bool = False, user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Answer one prompt via `llm_router`, bounded by the concurrency limit.
+
+    Answers are served from and stored in `response_cache` unless
+    `bypass_cache` is set. With `LLM_BATCHING` cache misses are queued under
+    `user_id` in `llm_batcher` for fair, coalesced dispatch.
+    """
+    key = None
+    if response_cache is not None:
+        key = _cache_key(prompt)
+        if not bypass_cache:
+            cached = await run_in_threadpool(response_cache.get, key)
+            if cached is not None:
+                return cached
+
+    if settings.LLM_BATCHING:
+        result = await llm_batcher.submit(prompt, user_id)
+    else:
+        result = await llm_router.call(prompt)
+    if key is not None:
+        await run_in_threadpool(response_cache.set, key, result)
+    return result
+
+
+async def stream_provider(prompt: str, bypass_cache: bool = False) -> AsyncIterator[str]:
+    """Stream the raw answer text for one prompt via `llm_router`.
+
+    A cached answer is replayed as a single chunk; a streamed answer that
+    parses as JSON is stored in the cache once complete.
+    """
+    key = None
+    if response_cache is not None:
+        key = _cache_key(prompt)
+        if not bypass_cache:
+            cached = await run_in_threadpool(response_cache.get, key)
+            if cached is not None:
+                yield json.dumps(cached)
+                return
+
+    parts = []
+    async with _llm_semaphore():
+        async for chunk in llm_router.stream(prompt):
+            parts.append(chunk)
+            yield chunk
+
+    if key is not None:
+        text = "".join(parts)
+        try:
+            result = json.loads(text[text.find("{") : text.rfind("}") + 1])
+        except json.JSONDecodeError:
+            return
+        await run_in_threadpool(response_cache.set, key, result)
+
+
+def _backoff_delay(attempt: int) -> float:
+    return settings.LLM_RETRY_BACKOFF_SECONDS * (2**attempt) * random.uniform(0.5, 1.5)
+
+
+class UnitError(Exception):
+    """A provider answer that does not contain the requested unit."""
+
+
+def _unit_questions(result: Dict[str, Any], module_number: int) -> List[Dict[str, Any]]:
+    """Pull the questions for `module_number` out of a single-unit answer."""
+    modules = [m for s in result.get("sets", [])[:1] for m in s.get("modules", [])]
+    # Accept a lone module even if the model renumbered it.
+    matching = [m for m in modules if m.get("module_number") == module_number] or modules[:1]
+    questions = [q for m in matching for q in m.get("questions", []) if isinstance(q, dict) and q.get("text")]
+    if not questions:
+        raise UnitError(f"no questions for module {module_number}")
+    return questions
+
+
+async def generate_unit(
+    module: Dict[str, Any],
+    reference_text: str,
+    existing_questions: List[str],
+    num_sets: int,
+    set_number: int,
+    bypass_cache: bool = False,
+    user_id: Optional[int] = None,
+) -> List[Dict[str, Any]]:
+    """Generate the questions of one module for one set, retrying on failure.
+
+    Provider errors (5xx `HTTPException`) and answers without usable
+    questions are retried up to `LLM_UNIT_RETRIES` times with jittered
+    exponential backoff. Retries skip the response cache so a malformed
+    cached answer is replaced rather than served again.
+    """
+    prompt = build_prompt(
+        [module], reference_text, existing_questions, num_sets=num_sets, set_number=set_number, single_module=True
+    )
+    attempt = 0
+    while True:
+        try:
+            result = await call_provider(prompt, bypass_cache=bypass_cache or attempt > 0, user_id=user_id)
+            return _unit_questions(result, module["module_number"])
+        except (HTTPException, UnitError) as e:
+            if isinstance(e, HTTPException) and e.status_code < 500:
+                raise
+            if attempt >= settings.LLM_UNIT_RETRIES:
+                if isinstance(e, UnitError):
+                    raise HTTPException(status_code=502, detail=f"LLM returned no usable questions: {e}") from e
+                raise
+            delay = _backoff_delay(attempt)
+            logger.warning(
+                "Retrying set %s module %s in %.2fs after: %s",
+                set_number,
+                module["module_number"],
+                delay,
+                getattr(e, "detail", e),
+            )
+            attempt += 1
+            await asyncio.sleep(delay)
+
+
+async def gather_or_cancel(*aws: Awaitable[T]) -> List[T]:
+    """Like `asyncio.gather`, but the first failure cancels the rest.
+
+    Siblings of a unit that has failed for good would otherwise keep
+    calling the provider for a result nobody reads. (`asyncio.TaskGroup`
+    does this from Python 3.11.)
+    """
+    tasks = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    finally:
+        # Also reached when the caller itself is cancelled.
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            raise task.exception()
+    return [task.result() for task in tasks]
+
+
+async def generate_units(
+    units: List[Tuple[int, Dict[str, Any]]],
+    reference_text: str,
+    existing_questions: List[str],
+    num_sets: int,
+    bypass_cache: bool = False,
+    user_id: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Generate the given (set number, module) pairs concurrently, as `{"sets": [...]}`."""
+    results = await gather_or_cancel(
+        *(
+            generate_unit(
+                module, reference_text, existing_questions, num_sets, n, bypass_cache=bypass_cache, user_id=user_id
+            )
+            for n, module in units
+        )
+    )
+    sets: Dict[int, List[Dict[str, Any]]] = {}
+    for (n, module), questions in zip(units, results):
+        sets.setdefault(n, []).append({"module_number": module["module_number"], "questions": questions})
+    return {"sets": [{"set_number": n, "modules": mods} for n, mods in sorted(sets.items())]}
+
+
+async def generate_question_sets(
     modules: List[Dict[str, Any]],
     reference_text: str,
     existing_questions: List[str],
     num_sets: int = 3,
+    bypass_cache: bool = False,
+    user_id: Optional[int] = None,
 ) -> Dict[str, Any]:
-    merged_topics = "\n".join([m.get("topics", "") for m in modules])
-    filtered_ref = filter_reference_by_topics(reference_text, merged_topics)
+    """Generate `num_sets` papers and return them as `{"sets": [...]}`.
+
+    `LLM_FAN_OUT` picks the unit of work: with `module` every (set, module)
+    pair is its own prompt, so answers stay short and a failure only
+    re-runs that pair (see `generate_unit`); with `set` each set is one
+    prompt; with `none` a single prompt asks for everything. Units run
+    concurrently, bounded by `LLM_MAX_CONCURRENCY`. `reference_text` is
+    expected to be topic-selected already (see `retrieval`).
+    """
+    if settings.LLM_FAN_OUT == "module":
+        units = [(n, module) for n in range(1, num_sets + 1) for module in modules]
+        return await generate_units(units, reference_text, existing_questions, num_sets, bypass_cache, user_id)
+
+    if settings.LLM_FAN_OUT != "set" or num_sets <= 1:
+        prompt = build_prompt(modules, reference_text, existing_questions, num_sets=num_sets)
+        return await call_provider(prompt, bypass_cache=bypass_cache, user_id=user_id)
+
+    prompts = [
+        build_prompt(modules, reference_text, existing_questions, num_sets=num_sets, set_number=n)
+        for n in range(1, num_sets + 1)
+    ]
+    results = await gather_or_cancel(*(call_provider(p, bypass_cache=bypass_cache, user_id=user_id) for p in prompts))
+
+    sets_out = []
+    for set_number, result in enumerate(results, start=1):
+        for set_obj in result.get("sets", [])[:1]:
+            sets_out.append({**set_obj, "set_number": set_number})
+    return {"sets": sets_out}
+
+
+# (prompt, set number to report, module number to report or None to keep
+# whatever the answer says)
+StreamUnit = Tuple[str, int, Optional[int]]
+
+
+def _stream_units(
+    modules: List[Dict[str, Any]],
+    reference_text: str,
+    existing_questions: List[str],
+    num_sets: int,
+    only: Optional[List[Tuple[int, Dict[str, Any]]]] = None,
+) -> List[StreamUnit]:
+    if only is not None or settings.LLM_FAN_OUT == "module":
+        pairs = only if only is not None else [(n, module) for n in range(1, num_sets + 1) for module in modules]
+        return [
+            (
+                build_prompt(
+                    [module], reference_text, existing_questions, num_sets=num_sets, set_number=n, single_module=True
+                ),
+                n,
+                module["module_number"],
+            )
+            for n, module in pairs
+        ]
+    if settings.LLM_FAN_OUT == "set" and num_sets > 1:
+        return [
+            (build_prompt(modules, reference_text, existing_questions, num_sets=num_sets, set_number=n), n, None)
+            for n in range(1, num_sets + 1)
+        ]
+    return [(build_prompt(modules, reference_text, existing_questions, num_sets=num_sets), 0, None)]
 
-    prompt = build_prompt(modules, filtered_ref, existing_questions, num_sets=num_sets)
-    if settings.LLM_PROVIDER == "gemini":
-        return call_gemini(prompt)
-    return call_openai(prompt)
+
+async def _stream_unit(unit: StreamUnit, queue: asyncio.Queue, bypass_cache: bool) -> None:
+    """Push one unit's questions onto `queue` as they complete.
+
+    The unit is retried like `generate_unit` as long as it has not produced
+    anything yet; once questions have been sent, a failure keeps them as a
+    partial result and reports a `unit_error` event.
+    """
+    prompt, set_number, module_number = unit
+    attempt = 0
+    while True:
+        parser = QuestionStreamParser()
+        try:
+            async for chunk in stream_provider(prompt, bypass_cache=bypass_cache or attempt > 0):
+                for item in parser.feed(chunk):
+                    await queue.put(
+                        {
+                            "type": "question",
+                            "set_number": set_number or item.set_number,
+                            "module_number": module_number if module_number is not None else item.module_number,
+                            "question": item.question,
+                        }
+                    )
+            if parser.questions:
+                return
+            error: Exception = UnitError("no questions in answer")
+        except HTTPException as e:
+            if parser.questions or e.status_code < 500:
+                await queue.put(_unit_error(set_number, module_number, e.detail))
+                return
+            error = e
+        if attempt >= settings.LLM_UNIT_RETRIES:
+            await queue.put(_unit_error(set_number, module_number, getattr(error, "detail", str(error))))
+            return
+        delay = _backoff_delay(attempt)
+        logger.warning("Retrying streamed set %s module %s in %.2fs after: %s", set_number, module_number, delay, error)
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+def _unit_error(set_number: int, module_number: Optional[int], detail: Any) -> Dict[str, Any]:
+    return {"type": "unit_error", "set_number": set_number, "module_number": module_number, "detail": str(detail)}
+
+
+async def stream_question_sets(
+    modules: List[Dict[str, Any]],
+    reference_text: str,
+    existing_questions: List[str],
+    num_sets: int = 3,
+    bypass_cache: bool = False,
+    only: Optional[List[Tuple[int, Dict[str, Any]]]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield `question` and `unit_error` events as the units' answers stream in.
+
+    Units are split the same way as in `generate_question_sets` (or are
+    exactly the (set number, module) pairs in `only`) and run concurrently;
+    events from different units interleave in arrival order.
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    units = _stream_units(modules, reference_text, existing_questions, num_sets, only)
+    tasks = [asyncio.create_task(_stream_unit(unit, queue, bypass_cache)) for unit in units]
+    done = asyncio.ensure_future(asyncio.gather(*tasks))
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            await asyncio.wait({getter, done}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            done.result()
+            return
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -1,28 +1,61 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 
+from . import database, passwords
 from .database import Base, engine
-from .routers import auth_routes, user_routes, file_routes, paper_routes
+from .extractors import shutdown_pool
+from .jobs import job_runner
+from .routers import auth_routes, user_routes, file_routes, paper_routes, metrics_routes
 
 # Create all tables in the database (users, question_papers, etc.) if they don't exist
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="LLM Question Paper Generator")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_runner.start()
+    yield
+    await job_runner.stop()
+    shutdown_pool()
+    passwords.shutdown_pool()
+
+
+app = FastAPI(title="LLM Question Paper Generator", lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
     "http://localhost:3000",
 ]
 
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout_handler(request: Request, exc: PoolTimeoutError):
+    # Every pooled connection stayed busy for DB_POOL_TIMEOUT_SECONDS.
+    database.counters["pool_timeouts"] += 1
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, please retry shortly."})
+
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[
+        "X-Next-Cursor",
+        "X-Prompt-Tokens-Saved",
+        "X-Questions-Dropped",
+        "X-Bank-Questions",
+        "X-Generated-Units",
+    ],
 )
 
 app.include_router(auth_routes.router)
 app.include_router(user_routes.router)
 app.include_router(file_routes.router)
 app.include_router(paper_routes.router)
+app.include_router(metrics_routes.router)
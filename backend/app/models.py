@@ -1,6 +1,6 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, TIMESTAMP, JSON, Enum
+from sqlalchemy import BigInteger, Column, Float, Integer, LargeBinary, String, Text, ForeignKey, TIMESTAMP, JSON, Enum, Index, UniqueConstraint
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from .database import Base
 import enum
 
@@ -10,6 +10,13 @@ class MaterialType(str, enum.Enum):
     question_paper = "question_paper"
 
 
+class JobStatus(str, enum.Enum):
+    pending = "pending"
+    running = "running"
+    succeeded = "succeeded"
+    failed = "failed"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -35,6 +42,45 @@ class FacultyProfile(Base):
     user = relationship("User", back_populates="profile")
 
 
+class FileBlob(Base):
+    """A stored file, shared by every upload with the same SHA-256."""
+
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    sha256 = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    file_path = Column(String(255), nullable=False)
+    # Compressed chunk text (see `chunk_store`). Blobs stored before chunk
+    # packs keep their extracted text in `content_text` instead.
+    chunk_path = Column(String(255))
+    content_text = deferred(Column(Text))
+    page_count = Column(Integer)
+    extraction_ms = Column(Integer)
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class ReferenceChunk(Base):
+    """A paragraph of a blob's extracted text, pre-tokenized for retrieval."""
+
+    __tablename__ = "reference_chunks"
+    __table_args__ = (Index("ix_reference_chunks_blob_id_position", "blob_id", "position"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    blob_id = Column(Integer, ForeignKey("file_blobs.id", ondelete="CASCADE"), nullable=False)
+    position = Column(Integer, nullable=False)
+    # Where the chunk's compressed text sits in the blob's chunk pack.
+    store_offset = Column(BigInteger)
+    store_length = Column(Integer)
+    char_count = Column(Integer)
+    # Only set on rows chunked before chunk packs existed.
+    text = deferred(Column(Text))
+    normalized = deferred(Column(Text))
+    term_counts = Column(JSON, nullable=False)
+    token_count = Column(Integer, nullable=False)
+
+
 class SyllabusDoc(Base):
     __tablename__ = "syllabus_docs"
 
@@ -45,9 +91,13 @@ class SyllabusDoc(Base):
     semester = Column(String(20), nullable=False)
     original_name = Column(String(255))
     file_path = Column(String(255))
-    content_text = Column(Text)
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), index=True)
+    # Text of rows uploaded before the blob store; never loaded unless used.
+    content_text = deferred(Column(Text))
     uploaded_at = Column(TIMESTAMP, server_default=func.now())
 
+    blob = relationship("FileBlob")
+
 
 class ReferenceMaterial(Base):
     __tablename__ = "reference_materials"
@@ -58,12 +108,18 @@ class ReferenceMaterial(Base):
     title = Column(String(255))
     original_name = Column(String(255))
     file_path = Column(String(255))
-    content_text = Column(Text)
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), index=True)
+    # Text of rows uploaded before the blob store; never loaded unless used.
+    content_text = deferred(Column(Text))
     uploaded_at = Column(TIMESTAMP, server_default=func.now())
 
+    blob = relationship("FileBlob")
+
 
 class QuestionPaper(Base):
     __tablename__ = "question_papers"
+    # Paper listings are per user, newest first (see `pagination`).
+    __table_args__ = (Index("ix_question_papers_user_id_created_at", "user_id", "created_at"),)
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
@@ -82,14 +138,64 @@ class QuestionPaper(Base):
 
 class Question(Base):
     __tablename__ = "questions"
+    # Duplicate detection looks up hashes per user, so keep that path join-free.
+    __table_args__ = (Index("ix_questions_user_id_question_hash", "user_id", "question_hash"),)
 
     id = Column(Integer, primary_key=True, index=True)
     question_paper_id = Column(Integer, ForeignKey("question_papers.id", ondelete="CASCADE"), nullable=False)
+    # Denormalized from question_papers.user_id.
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     module_number = Column(Integer, nullable=False)
     question_text = Column(Text, nullable=False)
     blooms_level = Column(String(50))
     marks = Column(Integer, nullable=False)
     question_hash = Column(String(64), index=True, nullable=False)
+    # MinHash signature for near-duplicate detection (see near_dup).
+    minhash = Column(LargeBinary)
     created_at = Column(TIMESTAMP, server_default=func.now())
 
     question_paper = relationship("QuestionPaper", back_populates="questions")
+
+
+class GenerationJob(Base):
+    """A queued `/papers/generate` request, processed by `app.jobs` workers."""
+
+    __tablename__ = "generation_jobs"
+    __table_args__ = (UniqueConstraint("user_id", "idempotency_key", name="uq_generation_jobs_user_key"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    idempotency_key = Column(String(100))
+    status = Column(Enum(JobStatus), default=JobStatus.pending, nullable=False, index=True)
+    request = Column(JSON, nullable=False)
+    paper_ids = Column(JSON)
+    error = Column(Text)
+    attempts = Column(Integer, default=0, nullable=False)
+    claimed_at = Column(TIMESTAMP, nullable=True)
+    # Identifies the current claim; see `jobs.claim_next_job`.
+    claim_token = Column(String(32))
+    created_at = Column(TIMESTAMP, server_default=func.now())
+    finished_at = Column(TIMESTAMP, nullable=True)
+
+
+class LLMCacheEntry(Base):
+    """A cached provider response, keyed by `llm_cache.cache_key`."""
+
+    __tablename__ = "llm_cache_entries"
+
+    key = Column(String(64), primary_key=True)
+    response = Column(JSON, nullable=False)
+    expires_at = Column(TIMESTAMP, nullable=False, index=True)
+    last_used_at = Column(TIMESTAMP, nullable=False, index=True)
+    created_at = Column(TIMESTAMP, server_default=func.now())
+
+
+class LLMRateBucket(Base):
+    """Token bucket state per LLM provider, shared by all workers (see `llm_router`)."""
+
+    __tablename__ = "llm_rate_buckets"
+
+    name = Column(String(255), primary_key=True)
+    tokens = Column(Float, nullable=False)
+    # Unix time of the last refill; a float keeps sub-second precision.
+    updated_at = Column(Float, nullable=False)
@@ -0,0 +1,147 @@
+"""Near-duplicate question detection with MinHash and LSH banding.
+
+`question_hash` only catches questions that are identical after whitespace
+and case normalization. Here each question is reduced to the set of its
+content words: lower-cased, with stopwords, instruction verbs ("explain",
+"describe", ...), generic filler ("way", "concept") and numbers removed, and
+plural / "-ing" endings stripped, so "Explain TCP handshake." and "Explain the
+TCP 3-way handshake" both become {tcp, handshake}. The set is summarized by a
+MinHash signature whose agreement rate estimates the Jaccard similarity of
+two questions' word sets.
+
+Signatures are split into bands; questions sharing any band bucket become
+candidates, and only candidates have their similarity estimated. That keeps
+a check against thousands of past questions to a few dict lookups.
+Signatures are stored on `questions.minhash` so they are computed once; they
+carry a version byte, and `from_bytes` rejects signatures of another version
+or size so they are recomputed.
+"""
+import re
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+from .config import settings
+
+# Bumped whenever `shingles` or the signature layout changes.
+SIGNATURE_VERSION = 2
+_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+_SEED = 1729
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    """
+    a an the of to and or in on at for from by with as is are was were be been its it this that these those
+    their there what which who whom how why when where explain describe discuss define state write give list
+    briefly brief short note notes detail detailed suitable example examples neat diagram help using
+    compare contrast differentiate distinguish illustrate outline elaborate justify identify mention name
+    apply solve analyze analyse evaluate assess critically propose trace under
+    do does did can could should would must may might will shall has have had any all each some your you
+    between into about also other various different way ways concept
+    """.split()
+)
+_NUMBER_WORDS = frozenset(
+    "zero one two three four five six seven eight nine ten first second third fourth fifth".split()
+)
+
+
+def _stem(word: str) -> str:
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 5 and word.endswith("ing"):
+        return word[:-3]
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+def shingles(text: str) -> Set[str]:
+    """The normalized content words of `text`."""
+    return {
+        _stem(word)
+        for word in _WORD_RE.findall(text.lower())
+        if len(word) > 1 and not word.isdigit() and word not in _STOPWORDS and word not in _NUMBER_WORDS
+    }
+
+
+class MinHasher:
+    """Universal hash family (a * x + b) mod p over CRC32 shingle ids."""
+
+    def __init__(self, num_perm: int, seed: int = _SEED):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self.a = rng.randint(1, 2**32 - 1, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 2**32 - 1, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        grams = shingles(text)
+        if not grams:
+            return np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint32)
+        ids = np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams))
+        # a < 2**32 and ids < 2**32, so the product fits in uint64.
+        hashed = (np.outer(ids, self.a) % _PRIME + self.b) % _PRIME
+        return hashed.min(axis=0).astype(np.uint32)
+
+    def to_bytes(self, signature: np.ndarray) -> bytes:
+        return bytes([SIGNATURE_VERSION]) + signature.astype("<u4").tobytes()
+
+    def from_bytes(self, data: bytes) -> Optional[np.ndarray]:
+        """The stored signature, or None if it is stale and must be recomputed."""
+        if len(data) != 1 + self.num_perm * 4 or data[0] != SIGNATURE_VERSION:
+            return None
+        return np.frombuffer(data, dtype="<u4", offset=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of the word sets behind two signatures."""
+    return float(np.count_nonzero(a == b)) / len(a)
+
+
+class LSHIndex:
+    """Banded LSH over MinHash signatures."""
+
+    def __init__(self, num_perm: int, bands: int):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.buckets: List[Dict[bytes, List[Hashable]]] = [{} for _ in range(bands)]
+        self.signatures: Dict[Hashable, np.ndarray] = {}
+
+    def _band_keys(self, signature: np.ndarray) -> Iterable[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows : (band + 1) * self.rows].tobytes()
+
+    def add(self, key: Hashable, signature: np.ndarray) -> None:
+        if key in self.signatures:
+            return
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+
+    def query(self, signature: np.ndarray, threshold: float) -> List[Tuple[Hashable, float]]:
+        """Keys whose estimated similarity to `signature` is at least `threshold`."""
+        candidates: Set[Hashable] = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        matches = []
+        for key in candidates:
+            score = similarity(signature, self.signatures[key])
+            if score >= threshold:
+                matches.append((key, score))
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.signatures)
+
+    @property
+    def size_bytes(self) -> int:
+        # Signature array plus one bucket entry per band, roughly.
+        return len(self.signatures) * (self.rows * self.bands * 4 + 100 + self.bands * 60)
+
+
+minhasher = MinHasher(settings.NEAR_DUPLICATE_NUM_PERM)
+
+
+def new_lsh_index() -> LSHIndex:
+    return LSHIndex(settings.NEAR_DUPLICATE_NUM_PERM, settings.NEAR_DUPLICATE_BANDS)
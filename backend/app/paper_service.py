@@ -0,0 +1,402 @@
+"""Database side of question paper generation.
+
+`/papers/generate` is split into a read phase (`load_generation_context`),
+the LLM call, and a write phase (`save_generated_sets`). The two database
+phases are plain sync functions so the route can run them in the threadpool
+while the provider call itself stays on the event loop.
+"""
+import logging
+import threading
+from dataclasses import dataclass
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Optional, Set
+
+from fastapi import HTTPException
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .config import settings
+from .corpus import document_index, filter_reference_by_topics
+from .llm_service import reference_char_budget, reference_token_budget
+from .near_dup import minhasher, new_lsh_index
+from .question_index import question_index, user_scope
+from .retrieval import select_reference_chunks, select_similar_questions
+from .serialization import paper_dict
+from .utils import chunked, question_hash
+
+logger = logging.getLogger(__name__)
+
+# Upper bound on hashes per `IN (...)` clause when checking for duplicates.
+HASH_LOOKUP_BATCH_SIZE = 500
+
+_lock = threading.Lock()
+counters = {"duplicates_dropped": 0, "near_duplicates_dropped": 0}
+
+# Called by `persist_papers` with the session and the new paper ids just
+# before it commits; raising rolls the papers back.
+BeforeCommit = Callable[[Session, List[int]], None]
+
+
+@dataclass
+class SavedPapers:
+    # `QuestionPaperOut`-shaped dicts
+    papers: List[Dict[str, Any]]
+    # Generated questions dropped as exact or near-duplicates.
+    duplicates: int = 0
+    near_duplicates: int = 0
+
+    @property
+    def dropped(self) -> int:
+        return self.duplicates + self.near_duplicates
+
+
+@dataclass
+class GenerationContext:
+    modules: List[Dict[str, Any]]
+    # Syllabus and reference chunks already filtered to the requested topics.
+    reference_text: str
+    existing_questions: List[str]
+    # Estimated prompt tokens saved by listing only similar past questions.
+    exclusion_tokens_saved: int = 0
+
+
+def load_generation_context(
+    db: Session, payload: schemas.GeneratePaperRequest, user_id: int
+) -> GenerationContext:
+    """Collect the syllabus, reference text and question history for a request.
+
+    Raises HTTP 404 if the syllabus or all reference materials are missing.
+    """
+    syllabus = db.query(models.SyllabusDoc).filter(
+        models.SyllabusDoc.id == payload.syllabus_doc_id,
+        models.SyllabusDoc.user_id == user_id,
+    ).first()
+    if not syllabus:
+        raise HTTPException(status_code=404, detail="Syllabus not found")
+
+    base_query = db.query(models.ReferenceMaterial).filter(
+        models.ReferenceMaterial.user_id == user_id
+    )
+
+    refs = base_query.filter(
+        models.ReferenceMaterial.id.in_(payload.reference_material_ids),
+        models.ReferenceMaterial.material_type == models.MaterialType.reference,
+    ).all()
+
+    ref_qps = []
+    if payload.reference_question_material_ids:
+        ref_qps = base_query.filter(
+            models.ReferenceMaterial.id.in_(payload.reference_question_material_ids),
+            models.ReferenceMaterial.material_type == models.MaterialType.question_paper,
+        ).all()
+
+    if not refs and not ref_qps:
+        raise HTTPException(status_code=404, detail="No reference materials found")
+
+    # Topic filtering runs against the pre-built chunk indexes, so the
+    # documents' full text is never re-split or concatenated here.
+    indexes = [document_index(db, doc) for doc in [syllabus] + refs + ref_qps]
+    if settings.REFERENCE_SELECTION_MODE == "bm25":
+        reference_text = select_reference_chunks(
+            indexes,
+            [m.topics for m in payload.modules],
+            budget_tokens=reference_token_budget(),
+            fallback_to_all=settings.REFERENCE_FILTER_FALLBACK_TO_ALL,
+        )
+    else:
+        merged_topics = "\n".join(m.topics for m in payload.modules)
+        reference_text = filter_reference_by_topics(
+            indexes,
+            merged_topics,
+            fallback_to_all=settings.REFERENCE_FILTER_FALLBACK_TO_ALL,
+            budget_chars=reference_char_budget(),
+        )
+
+    old_qs = (
+        db.query(models.Question.question_text)
+        .join(models.QuestionPaper)
+        .filter(
+            models.QuestionPaper.user_id == user_id,
+            models.QuestionPaper.subject == payload.subject,
+            models.QuestionPaper.subject_code == payload.subject_code,
+            models.QuestionPaper.semester == payload.semester,
+        )
+        .order_by(models.Question.id.desc())
+        .all()
+    )
+    existing_texts = [text for (text,) in old_qs]
+    tokens_saved = 0
+    if settings.EXCLUSION_MODE == "similar":
+        # Everything not listed is still excluded exactly by hash after generation.
+        existing_texts, tokens_saved = select_similar_questions(
+            existing_texts,
+            [m.topics for m in payload.modules],
+            budget_tokens=settings.EXCLUSION_TOKEN_BUDGET,
+        )
+        logger.info(
+            "Listing %d of %d past questions in the prompt (~%d tokens saved)",
+            len(existing_texts),
+            len(old_qs),
+            tokens_saved,
+        )
+
+    modules_data = [
+        {
+            "module_number": m.module_number,
+            "title": m.title,
+            "topics": m.topics,
+            "num_questions": m.num_questions,
+            "marks": m.marks,
+        }
+        for m in payload.modules
+    ]
+
+    return GenerationContext(
+        modules=modules_data,
+        reference_text=reference_text,
+        existing_questions=existing_texts,
+        exclusion_tokens_saved=tokens_saved,
+    )
+
+
+def existing_question_hashes(db: Session, user_id: int, hashes: Iterable[str]) -> Set[str]:
+    """Return the subset of `hashes` already used in any of the user's papers.
+
+    Lookups go through the (user_id, question_hash) index in bounded `IN`
+    batches, so the cost is a few round trips regardless of batch size.
+    """
+    found: Set[str] = set()
+    for batch in chunked(sorted(hashes), HASH_LOOKUP_BATCH_SIZE):
+        rows = (
+            db.query(models.Question.question_hash)
+            .filter(
+                models.Question.user_id == user_id,
+                models.Question.question_hash.in_(batch),
+            )
+            .all()
+        )
+        found.update(h for (h,) in rows)
+    return found
+
+
+def save_generated_sets(
+    db: Session,
+    payload: schemas.GeneratePaperRequest,
+    user_id: int,
+    llm_result: Dict[str, Any],
+    reused_hashes: AbstractSet[str] = frozenset(),
+    before_commit: Optional[BeforeCommit] = None,
+) -> SavedPapers:
+    """Persist the LLM's sets as question papers, skipping duplicate questions.
+
+    Returns the saved papers as `QuestionPaperOut`-shaped dicts, with how
+    many questions were dropped so callers can report short papers.
+
+    Exact duplicates (same `question_hash`) and near-duplicates (MinHash
+    similarity at or above `NEAR_DUPLICATE_THRESHOLD`) of the user's past
+    questions, or of questions earlier in the batch, are dropped. Questions
+    in `reused_hashes` were deliberately taken from the question bank (see
+    `assembly`) and are only checked against the rest of the batch.
+    `before_commit` is passed on to `persist_papers`.
+    """
+    # Normalize and hash every candidate up front so duplicates can be resolved
+    # against the database in a handful of queries instead of one per question.
+    candidate_sets = []
+    candidate_hashes = set()
+    for set_obj in llm_result.get("sets", []):
+        candidates = []
+        for module in set_obj.get("modules", []):
+            module_number = module.get("module_number")
+            for q in module.get("questions", []):
+                q_text = (q.get("text") or "").strip()
+                if not q_text:
+                    continue
+                q_hash = question_hash(q_text)
+                candidates.append((module_number, q_text, q, q_hash))
+                candidate_hashes.add(q_hash)
+        candidate_sets.append((set_obj.get("set_number", 0), candidates))
+
+    scope = user_scope(user_id)
+    fresh_hashes = candidate_hashes - reused_hashes
+    used_hashes = existing_question_hashes(db, user_id, fresh_hashes)
+
+    # Near-duplicates: reworded versions of past questions are dropped via the
+    # user's LSH index, and of questions accepted earlier in this batch via a
+    # batch-local one.
+    signatures = {
+        q_hash: minhasher.signature(q_text)
+        for _, candidates in candidate_sets
+        for _, q_text, _, q_hash in candidates
+    }
+    threshold = settings.NEAR_DUPLICATE_THRESHOLD
+    near_duplicates: Set[str] = set()
+    if threshold > 0 and question_index.enabled:
+        fresh = {h: sig for h, sig in signatures.items() if h not in used_hashes and h not in reused_hashes}
+        near_duplicates = question_index.find_near_duplicates(db, scope, fresh, threshold)
+    batch_lsh = new_lsh_index()
+    new_entries = []
+    duplicates = 0
+    near_duplicate_count = 0
+
+    paper_rows = []
+    question_rows = []
+    for set_number, candidates in candidate_sets:
+        paper_rows.append(
+            {
+                "user_id": user_id,
+                "subject": payload.subject,
+                "subject_code": payload.subject_code,
+                "semester": payload.semester,
+                "total_marks": payload.total_marks,
+                "set_number": set_number,
+                "num_modules": len(payload.modules),
+                "marks_distribution": payload.marks_distribution,
+            }
+        )
+        questions = []
+        for module_number, q_text, q, q_hash in candidates:
+            if q_hash in used_hashes:
+                duplicates += 1
+                continue
+            if q_hash in near_duplicates:
+                near_duplicate_count += 1
+                continue
+            signature = signatures[q_hash]
+            reused = q_hash in reused_hashes
+            if threshold > 0 and not reused and batch_lsh.query(signature, threshold):
+                near_duplicate_count += 1
+                continue
+            batch_lsh.add(q_hash, signature)
+            questions.append(
+                {
+                    "user_id": user_id,
+                    "module_number": module_number,
+                    "question_text": q_text,
+                    "marks": int(q.get("marks", 0)),
+                    "blooms_level": q.get("blooms_level"),
+                    "question_hash": q_hash,
+                    "minhash": minhasher.to_bytes(signature),
+                }
+            )
+            used_hashes.add(q_hash)
+            if not reused:
+                new_entries.append((q_hash, signature))
+        question_rows.append(questions)
+
+    papers_out = persist_papers(db, paper_rows, question_rows, before_commit)
+    question_index.record(scope, new_entries)
+    with _lock:
+        counters["duplicates_dropped"] += duplicates
+        counters["near_duplicates_dropped"] += near_duplicate_count
+    if duplicates or near_duplicate_count:
+        logger.warning(
+            "Dropped %d duplicate and %d near-duplicate generated questions",
+            duplicates,
+            near_duplicate_count,
+        )
+    return SavedPapers(papers_out, duplicates, near_duplicate_count)
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        return dict(counters)
+
+
+def _returns_many(db: Session) -> bool:
+    """Whether one multi-row INSERT can return ids in parameter order."""
+    return db.get_bind().dialect.insert_executemany_returning_sort_by_parameter_order
+
+
+def _commit(db: Session, paper_ids: List[int], before_commit: Optional[BeforeCommit]) -> None:
+    if before_commit is not None:
+        try:
+            before_commit(db, paper_ids)
+        except Exception:
+            db.rollback()
+            raise
+    db.commit()
+
+
+def persist_papers(
+    db: Session,
+    paper_rows: List[Dict[str, Any]],
+    question_rows: List[List[Dict[str, Any]]],
+    before_commit: Optional[BeforeCommit] = None,
+) -> List[Dict[str, Any]]:
+    """Insert papers and their questions in one transaction and commit.
+
+    `question_rows[i]` are the questions of `paper_rows[i]`. Papers go in
+    as one INSERT and questions as one executemany (batched into multi-row
+    INSERTs by the driver), without building ORM objects. Where the
+    database supports `INSERT ... RETURNING` (SQLite, MariaDB, PostgreSQL)
+    ids come back from the inserts. MySQL has no RETURNING, so papers are
+    inserted one per statement and question ids are read back in a single
+    query. The result is built from the rows in hand, shaped like
+    `QuestionPaperOut` (see `serialization`), instead of reloading the
+    papers.
+
+    `before_commit` lets the caller write in the same transaction, e.g. a
+    background job recording its result (see `jobs`); if it raises, nothing
+    is committed.
+    """
+    if not paper_rows:
+        _commit(db, [], before_commit)
+        return []
+    returning = _returns_many(db)
+    paper = models.QuestionPaper
+    if returning:
+        result = db.execute(insert(paper).returning(paper.id, sort_by_parameter_order=True), paper_rows)
+        paper_ids = list(result.scalars())
+    else:
+        paper_ids = [db.execute(insert(paper).values(**row)).inserted_primary_key[0] for row in paper_rows]
+
+    rows = [
+        {**question, "question_paper_id": paper_id}
+        for paper_id, questions in zip(paper_ids, question_rows)
+        for question in questions
+    ]
+    question_ids: List[int] = []
+    if rows:
+        question = models.Question
+        if returning:
+            result = db.execute(insert(question).returning(question.id, sort_by_parameter_order=True), rows)
+            question_ids = list(result.scalars())
+        else:
+            db.execute(insert(question), rows)
+            # Ids of one multi-row INSERT increase in row order.
+            question_ids = list(
+                db.execute(
+                    select(question.id)
+                    .where(question.question_paper_id.in_(paper_ids))
+                    .order_by(question.question_paper_id, question.id)
+                ).scalars()
+            )
+    _commit(db, paper_ids, before_commit)
+
+    ids = iter(question_ids)
+    papers_out = []
+    for paper_id, paper_row, questions in zip(paper_ids, paper_rows, question_rows):
+        papers_out.append(
+            paper_dict(
+                (
+                    paper_id,
+                    paper_row["set_number"],
+                    paper_row["subject"],
+                    paper_row["subject_code"],
+                    paper_row["semester"],
+                    paper_row["total_marks"],
+                    paper_row["num_modules"],
+                ),
+                [
+                    {
+                        "id": next(ids),
+                        "module_number": q["module_number"],
+                        "question_text": q["question_text"],
+                        "blooms_level": q["blooms_level"],
+                        "marks": q["marks"],
+                    }
+                    for q in questions
+                ],
+            )
+        )
+    return papers_out
@@ -0,0 +1,100 @@
+"""Password hashing off the request path.
+
+bcrypt is deliberately slow (~100-300 ms of CPU per hash at the default
+cost), so hashing and verification run in a dedicated `ProcessPoolExecutor`
+of `settings.PASSWORD_HASH_WORKERS` processes: a burst of logins uses those
+cores instead of holding the GIL in the API process and slowing every other
+endpoint. Requests beyond the pool's capacity wait in its queue, and once
+`settings.PASSWORD_HASH_MAX_PENDING` are waiting new ones are refused with a
+503 rather than piling up.
+
+The cost factor is `settings.BCRYPT_ROUNDS`. `verify_password` reports a
+replacement hash when the stored one was made with a different cost, so
+login can upgrade it transparently.
+"""
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from passlib.context import CryptContext
+
+from .config import settings
+
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.BCRYPT_ROUNDS)
+
+
+def hash_password_sync(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def verify_password_sync(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """Return whether `password` matches, and a new hash if `hashed` is outdated."""
+    return pwd_context.verify_and_update(password, hashed)
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_lock = threading.Lock()
+counters: Dict[str, int] = {"submitted": 0, "completed": 0, "rejected": 0, "rehashed": 0, "pending": 0, "max_pending": 0}
+
+
+def get_pool() -> Optional[ProcessPoolExecutor]:
+    """The hashing pool, or None to hash in the threadpool (PASSWORD_HASH_WORKERS=0)."""
+    global _pool
+    if settings.PASSWORD_HASH_WORKERS <= 0:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS)
+    return _pool
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+async def _run(func, *args):
+    with _lock:
+        if counters["pending"] >= settings.PASSWORD_HASH_MAX_PENDING:
+            counters["rejected"] += 1
+            raise HTTPException(status_code=503, detail="Too many sign-in requests, please retry shortly.")
+        counters["submitted"] += 1
+        counters["pending"] += 1
+        counters["max_pending"] = max(counters["max_pending"], counters["pending"])
+    try:
+        pool = get_pool()
+        if pool is None:
+            return await run_in_threadpool(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(pool, func, *args)
+    finally:
+        with _lock:
+            counters["pending"] -= 1
+            counters["completed"] += 1
+
+
+async def hash_password(password: str) -> str:
+    return await _run(hash_password_sync, password)
+
+
+async def verify_password(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    ok, new_hash = await _run(verify_password_sync, password, hashed)
+    if new_hash is not None:
+        with _lock:
+            counters["rehashed"] += 1
+    return ok, new_hash
+
+
+def stats() -> Dict[str, int]:
+    with _lock:
+        # Requests beyond the worker count are waiting in the pool's queue.
+        queued = max(counters["pending"] - max(settings.PASSWORD_HASH_WORKERS, 0), 0)
+        return {
+            **counters,
+            "queued": queued,
+            "workers": settings.PASSWORD_HASH_WORKERS,
+            "rounds": settings.BCRYPT_ROUNDS,
+        }
@@ -0,0 +1,216 @@
+"""In-process index of the MinHash signatures of a user's past questions.
+
+Near-duplicate detection in `/papers/generate` compares every generated
+question with everything the user was given before. Instead of loading past
+`Question` rows on every request we keep one LSH index (see `near_dup`) per
+scope (a user, optionally narrowed to a subject/subject_code/semester), and
+only candidates sharing an LSH band with a new question are compared.
+
+Exact duplicates are not checked here: `paper_service` asks the database in
+one indexed `question_hash IN (...)` query, which is exact whichever worker
+wrote the rows, and no in-process structure can answer without a round trip
+of its own to learn about other workers' writes.
+
+Indexes warm lazily from `questions.minhash` and catch up on rows written
+by other workers by reading only ids greater than the last one seen, and
+take this process's own saves through `record`. Ids are not committed in
+order across workers, so the catch-up can miss a row committed late below
+the watermark; that only lets a near-duplicate of it through. The cache is
+LRU-evicted once its estimated size exceeds `settings.QUESTION_INDEX_MAX_BYTES`.
+
+Database work (catch-up queries, signature backfill) runs outside the
+cache-wide lock, which only guards the in-memory structures; a per-scope lock
+keeps concurrent saves for one scope from repeating it.
+"""
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from .config import settings
+from . import models
+from .near_dup import minhasher, new_lsh_index
+from .utils import chunked
+
+# (user_id, subject, subject_code, semester); trailing fields may be None.
+IndexScope = Tuple[int, Optional[str], Optional[str], Optional[str]]
+
+
+class QuestionHashIndex:
+    """The LSH index of one scope's question signatures, keyed by hash."""
+
+    def __init__(self, last_question_id: int = 0):
+        self.last_question_id = last_question_id
+        self.lsh = new_lsh_index()
+
+    def add_signatures(self, entries: Iterable[Tuple[str, np.ndarray]]) -> None:
+        for digest, signature in entries:
+            self.lsh.add(digest, signature)
+
+    def __len__(self) -> int:
+        return len(self.lsh)
+
+    @property
+    def size_bytes(self) -> int:
+        return self.lsh.size_bytes
+
+
+class QuestionIndexCache:
+    """LRU cache of `QuestionHashIndex` objects with a memory cap."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._indexes: "OrderedDict[IndexScope, QuestionHashIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._scope_locks: Dict[IndexScope, threading.Lock] = {}
+        self.counters: Dict[str, int] = {
+            "near_duplicate_lookups": 0,
+            "near_duplicate_hits": 0,
+            "warm_loads": 0,
+            "evictions": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _scope_lock(self, scope: IndexScope) -> threading.Lock:
+        with self._lock:
+            lock = self._scope_locks.get(scope)
+            if lock is None:
+                lock = self._scope_locks[scope] = threading.Lock()
+            return lock
+
+    def _query(self, db: Session, scope: IndexScope, after_id: int = 0):
+        user_id, subject, subject_code, semester = scope
+        query = db.query(
+            models.Question.id,
+            models.Question.question_hash,
+            models.Question.minhash,
+        ).filter(models.Question.user_id == user_id, models.Question.id > after_id)
+        if subject is not None or subject_code is not None or semester is not None:
+            query = query.join(models.QuestionPaper)
+            if subject is not None:
+                query = query.filter(models.QuestionPaper.subject == subject)
+            if subject_code is not None:
+                query = query.filter(models.QuestionPaper.subject_code == subject_code)
+            if semester is not None:
+                query = query.filter(models.QuestionPaper.semester == semester)
+        return query.all()
+
+    def _load(self, db: Session, scope: IndexScope) -> QuestionHashIndex:
+        """Return the index for `scope`, warming it or catching up on new rows."""
+        with self._scope_lock(scope):
+            while True:
+                with self._lock:
+                    snapshot = self._indexes.get(scope)
+                    after_id = snapshot.last_question_id if snapshot else 0
+                rows = self._query(db, scope, after_id)
+                signatures = _signatures(db, rows) if rows else []
+                with self._lock:
+                    index = self._indexes.get(scope)
+                    if index is None and after_id:
+                        # Evicted while we caught up; the rows are only the tail.
+                        continue
+                    if index is None:
+                        self.counters["warm_loads"] += 1
+                        index = QuestionHashIndex()
+                        self._indexes[scope] = index
+                    if rows:
+                        index.add_signatures(signatures)
+                        index.last_question_id = max(index.last_question_id, max(row.id for row in rows))
+                    self._indexes.move_to_end(scope)
+                    self._evict()
+                    return index
+
+    def _evict(self) -> None:
+        total = sum(index.size_bytes for index in self._indexes.values())
+        # Always keep the most recently used index, even if it alone is over budget.
+        while total > self.max_bytes and len(self._indexes) > 1:
+            scope, evicted = self._indexes.popitem(last=False)
+            total -= evicted.size_bytes
+            self.counters["evictions"] += 1
+            lock = self._scope_locks.get(scope)
+            if lock is not None and not lock.locked():
+                del self._scope_locks[scope]
+
+    def find_near_duplicates(
+        self,
+        db: Session,
+        scope: IndexScope,
+        signatures: Dict[str, np.ndarray],
+        threshold: float,
+    ) -> Set[str]:
+        """Return the keys of `signatures` that resemble a recorded question."""
+        index = self._load(db, scope)
+        with self._lock:
+            found = set()
+            for digest, signature in signatures.items():
+                self.counters["near_duplicate_lookups"] += 1
+                if index.lsh.query(signature, threshold):
+                    self.counters["near_duplicate_hits"] += 1
+                    found.add(digest)
+            return found
+
+    def record(self, scope: IndexScope, entries: Iterable[Tuple[str, Optional[np.ndarray]]]) -> None:
+        """Add freshly committed `(hash, signature)` pairs to a resident index."""
+        with self._lock:
+            index = self._indexes.get(scope)
+            if index is not None:
+                index.add_signatures((d, sig) for d, sig in entries if sig is not None)
+                self._evict()
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._indexes.clear()
+                return
+            for scope in [s for s in self._indexes if s[0] == user_id]:
+                del self._indexes[scope]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                **self.counters,
+                "indexes": len(self._indexes),
+                "signatures": sum(len(index) for index in self._indexes.values()),
+                "size_bytes": sum(index.size_bytes for index in self._indexes.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+
+def _signatures(db: Session, rows) -> List[Tuple[str, np.ndarray]]:
+    """Signatures for warm-loaded rows, backfilling rows stored without a current one."""
+    out = []
+    missing = []
+    for row in rows:
+        signature = minhasher.from_bytes(row.minhash) if row.minhash is not None else None
+        if signature is None:
+            missing.append(row.id)
+        else:
+            out.append((row.question_hash, signature))
+    if not missing:
+        return out
+    backfill = []
+    for batch in chunked(missing, 500):
+        texts = (
+            db.query(models.Question.id, models.Question.question_hash, models.Question.question_text)
+            .filter(models.Question.id.in_(batch))
+            .all()
+        )
+        for question_id, digest, text in texts:
+            signature = minhasher.signature(text)
+            out.append((digest, signature))
+            backfill.append({"id": question_id, "minhash": minhasher.to_bytes(signature)})
+    db.bulk_update_mappings(models.Question, backfill)
+    db.commit()
+    return out
+
+
+def user_scope(user_id: int) -> IndexScope:
+    return (user_id, None, None, None)
+
+
+question_index = QuestionIndexCache(max_bytes=settings.QUESTION_INDEX_MAX_BYTES)
@@ -0,0 +1,200 @@
+"""Selection of what goes into the prompt: reference chunks and question history.
+
+Reference chunks
+----------------
+
+Instead of keeping every chunk that mentions a topic and letting the prompt
+truncate whatever comes last, chunks from all selected documents are scored
+with BM25 against each module's topics. Each module gets an equal share of
+the token budget and takes its best chunks first; budget a module cannot use
+goes to the best remaining chunks overall. The selection is emitted in
+document order.
+
+Scoring works on a compressed sparse row (CSR) term x chunk matrix
+restricted to the query vocabulary, so each query term costs one vectorized
+NumPy update regardless of corpus size.
+
+Question history
+----------------
+The prompt used to list every question ever generated for the subject. Now
+only the past questions most similar to the requested topics (word unigram
+and bigram overlap) are listed, up to a token budget; exact exclusion of
+everything else still happens after generation, by question hash.
+"""
+from dataclasses import dataclass
+import json
+from typing import Dict, List, Sequence, Set, Tuple
+
+import numpy as np
+
+from .corpus import BlobIndex, parse_topics, tokenize
+from .utils import estimate_tokens
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+@dataclass
+class TermMatrix:
+    """CSR matrix of term frequencies: row per query term, column per chunk."""
+
+    vocabulary: Dict[str, int]
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+    doc_lengths: np.ndarray
+
+    @classmethod
+    def build(cls, indexes: Sequence[BlobIndex], terms: Sequence[str]) -> "TermMatrix":
+        vocabulary = {term: row for row, term in enumerate(dict.fromkeys(terms))}
+        offsets = np.cumsum([0] + [len(index.chunks) for index in indexes])
+        doc_lengths = np.fromiter(
+            (chunk.token_count for index in indexes for chunk in index.chunks),
+            dtype=np.float64,
+            count=int(offsets[-1]),
+        )
+        indptr = [0]
+        nnz = 0
+        indices: List[np.ndarray] = []
+        data: List[np.ndarray] = []
+        for term in vocabulary:
+            for index, offset in zip(indexes, offsets):
+                positions = sorted(index.postings.get(term, ()))
+                if not positions:
+                    continue
+                pos = np.fromiter(positions, dtype=np.int64, count=len(positions))
+                indices.append(pos + offset)
+                nnz += len(pos)
+                data.append(
+                    np.fromiter((index.chunks[p].term_counts[term] for p in positions), dtype=np.float64, count=len(positions))
+                )
+            indptr.append(nnz)
+        return cls(
+            vocabulary=vocabulary,
+            indptr=np.asarray(indptr, dtype=np.int64),
+            indices=np.concatenate(indices) if indices else np.zeros(0, dtype=np.int64),
+            data=np.concatenate(data) if data else np.zeros(0, dtype=np.float64),
+            doc_lengths=doc_lengths,
+        )
+
+    def bm25(self, query_terms: Sequence[str]) -> np.ndarray:
+        num_docs = len(self.doc_lengths)
+        scores = np.zeros(num_docs, dtype=np.float64)
+        if num_docs == 0:
+            return scores
+        avg_length = max(float(self.doc_lengths.mean()), 1.0)
+        length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / avg_length)
+        for term in set(query_terms):
+            row = self.vocabulary.get(term)
+            if row is None:
+                continue
+            start, end = self.indptr[row], self.indptr[row + 1]
+            if start == end:
+                continue
+            cols = self.indices[start:end]
+            tf = self.data[start:end]
+            df = end - start
+            idf = np.log(1 + (num_docs - df + 0.5) / (df + 0.5))
+            scores[cols] += idf * tf * (BM25_K1 + 1) / (tf + length_norm[cols])
+        return scores
+
+
+def select_reference_chunks(
+    indexes: Sequence[BlobIndex],
+    module_topics: Sequence[str],
+    budget_tokens: int,
+    fallback_to_all: bool = True,
+) -> str:
+    """Pack the best-scoring chunks for each module into `budget_tokens`.
+
+    Chunks that match no topic term are only used when nothing matches at
+    all and `fallback_to_all` is set; the leading chunks are taken then.
+    """
+    owners = [(index, pos) for index in indexes for pos in range(len(index.chunks))]
+    chunks = [index.chunks[pos] for index, pos in owners]
+    if not chunks:
+        return ""
+    queries = [tokenize(" ".join(parse_topics(topics))) for topics in module_topics]
+    queries = [q for q in queries if q] or [[]]
+
+    matrix = TermMatrix.build(indexes, [t for q in queries for t in q])
+    # Same estimate as `estimate_tokens`, from the stored length, so no
+    # chunk text is read before it is selected.
+    costs = (np.fromiter((c.char_count for c in chunks), dtype=np.int64, count=len(chunks)) + 3) // 4
+    selected = np.zeros(len(chunks), dtype=bool)
+    remaining = budget_tokens
+
+    rankings = []
+    for query in queries:
+        scores = matrix.bm25(query)
+        # Stable sort keeps document order among equal scores.
+        rankings.append((scores, np.argsort(-scores, kind="stable")))
+
+    share = budget_tokens // len(queries)
+    for scores, order in rankings:
+        allowance = share
+        for pos in order:
+            if scores[pos] <= 0:
+                break
+            if selected[pos] or costs[pos] > allowance:
+                continue
+            selected[pos] = True
+            allowance -= costs[pos]
+            remaining -= costs[pos]
+
+    # Hand unused budget to the best remaining chunks across all modules.
+    best = np.max([scores for scores, _ in rankings], axis=0)
+    include_unmatched = fallback_to_all and not selected.any()
+    for pos in np.argsort(-best, kind="stable"):
+        if remaining <= 0 or (best[pos] <= 0 and not include_unmatched):
+            break
+        if selected[pos] or costs[pos] > remaining:
+            continue
+        selected[pos] = True
+        remaining -= costs[pos]
+
+    return "\n\n".join(owners[pos][0].text(owners[pos][1]) for pos in np.flatnonzero(selected))
+
+
+def _ngrams(text: str) -> Set[str]:
+    tokens = tokenize(text)
+    return set(tokens) | {f"{a} {b}" for a, b in zip(tokens, tokens[1:])}
+
+
+def prompt_list_tokens(items: Sequence[str]) -> int:
+    """Tokens a list costs when embedded in the prompt as JSON."""
+    return estimate_tokens(json.dumps(list(items), ensure_ascii=False))
+
+
+def select_similar_questions(
+    questions: Sequence[str],
+    module_topics: Sequence[str],
+    budget_tokens: int,
+) -> Tuple[List[str], int]:
+    """Pick the past questions closest to the modules' topics within a budget.
+
+    Questions are scored by the share of their word n-grams that appear in
+    the topics of the best-matching module; ties keep the input order, so
+    callers should pass the most recent questions first. Returns the chosen
+    questions and the estimated prompt tokens saved versus listing them all.
+    """
+    topic_grams = [_ngrams(" ".join(parse_topics(topics))) for topics in module_topics]
+    scored = []
+    for position, question in enumerate(questions):
+        grams = _ngrams(question)
+        if not grams:
+            continue
+        score = max((len(grams & topic) / len(grams) for topic in topic_grams), default=0.0)
+        scored.append((-score, position, question))
+    scored.sort()
+
+    chosen: List[str] = []
+    used = 2  # the surrounding "[]"
+    for _, _, question in scored:
+        cost = prompt_list_tokens([question])
+        if used + cost > budget_tokens:
+            continue
+        chosen.append(question)
+        used += cost
+    saved = max(prompt_list_tokens(questions) - prompt_list_tokens(chosen), 0)
+    return chosen, saved
@@ -1,40 +1,65 @@
 from datetime import timedelta
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
-from ..auth import get_db, hash_password, verify_password, create_access_token
+from ..auth import get_db, create_access_token
 from ..config import settings
+from ..passwords import hash_password, verify_password
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/signup", response_model=schemas.UserBase)
-def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(models.User).filter(models.User.email == user_in.email).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Email already registered")
+async def _find_user(db: AsyncSession, email: str):
+    result = await db.execute(select(models.User).where(models.User.email == email))
+    return result.scalars().first()
+
+
+async def _create_user(db: AsyncSession, user_in: schemas.UserCreate, password_hash: str) -> models.User:
     user = models.User(
         name=user_in.name,
         email=user_in.email,
-        password_hash=hash_password(user_in.password),
+        password_hash=password_hash,
     )
     db.add(user)
-    db.commit()
-    db.refresh(user)
+    await db.flush()
 
     profile = models.FacultyProfile(user_id=user.id)
     db.add(profile)
-    db.commit()
+    await db.commit()
 
     return user
 
 
+# Password hashing runs in a process pool (see `passwords`); everything else
+# here awaits the async session.
+@router.post("/signup", response_model=schemas.UserBase)
+async def signup(user_in: schemas.UserCreate, db: AsyncSession = Depends(get_db)):
+    existing = await _find_user(db, user_in.email)
+    if existing:
+        raise HTTPException(status_code=400, detail="Email already registered")
+    # End the read transaction so no connection is held while hashing.
+    await db.commit()
+    password_hash = await hash_password(user_in.password)
+    return await _create_user(db, user_in, password_hash)
+
+
 @router.post("/login", response_model=schemas.Token)
-def login(form_data: schemas.UserLogin, db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.email == form_data.email).first()
-    if not user or not verify_password(form_data.password, user.password_hash):
+async def login(form_data: schemas.UserLogin, db: AsyncSession = Depends(get_db)):
+    user = await _find_user(db, form_data.email)
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    # Objects outlive the commit (expire_on_commit=False); only the
+    # connection is released while the password is checked.
+    await db.commit()
+    ok, new_hash = await verify_password(form_data.password, user.password_hash)
+    if not ok:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    if new_hash is not None:
+        # Stored with an older BCRYPT_ROUNDS; upgrade while we have the password.
+        user.password_hash = new_hash
+        await db.commit()
     access_token = create_access_token(
         {"sub": user.id},
         expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES),
@@ -1,9 +1,12 @@
 import os
-from fastapi import APIRouter, UploadFile, File, Depends, Form
+from fastapi import APIRouter, UploadFile, File, Depends, Form, HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..auth import get_db, get_current_user
+from ..auth import get_db, get_current_user_id
 from .. import models
+from ..blob_store import collect_garbage, commit_upload, release_blob, store_upload
 from ..config import settings
 from ..models import MaterialType
 
@@ -12,40 +15,27 @@ router = APIRouter(prefix="/files", tags=["files"])
 os.makedirs(settings.FILE_UPLOAD_DIR, exist_ok=True)
 
 
-def read_file_text(file_path: str) -> str:
-    # For demo: only handle .txt; extend to PDF/docx as needed.
-    if file_path.lower().endswith(".txt"):
-        with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-            return f.read()
-    return ""
-
-
 @router.post("/upload-syllabus")
 async def upload_syllabus(
     semester: str = Form(...),
     subject: str = Form(...),
     subject_code: str = Form(...),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    save_path = os.path.join(settings.FILE_UPLOAD_DIR, file.filename)
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
-
-    content_text = read_file_text(save_path)
+    blob = await store_upload(db, file)
     doc = models.SyllabusDoc(
-        user_id=current_user.id,
+        user_id=user_id,
         subject=subject,
         subject_code=subject_code,
         semester=semester,
         original_name=file.filename,
-        file_path=save_path,
-        content_text=content_text,
+        file_path=blob.file_path,
+        blob_id=blob.id,
     )
     db.add(doc)
-    db.commit()
-    db.refresh(doc)
+    await commit_upload(db, blob)
     return {"id": doc.id, "message": "Syllabus uploaded"}
 
 
@@ -54,23 +44,65 @@ async def upload_reference(
     title: str = Form(...),
     material_type: MaterialType = Form(MaterialType.reference),
     file: UploadFile = File(...),
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    save_path = os.path.join(settings.FILE_UPLOAD_DIR, file.filename)
-    with open(save_path, "wb") as f:
-        f.write(await file.read())
-
-    content_text = read_file_text(save_path)
+    blob = await store_upload(db, file)
     ref = models.ReferenceMaterial(
-        user_id=current_user.id,
+        user_id=user_id,
         title=title,
         original_name=file.filename,
-        file_path=save_path,
-        content_text=content_text,
+        file_path=blob.file_path,
+        blob_id=blob.id,
         material_type=material_type,
     )
     db.add(ref)
-    db.commit()
-    db.refresh(ref)
+    await commit_upload(db, blob)
     return {"id": ref.id, "message": "Reference uploaded"}
+
+
+def _delete_document(db: Session, doc) -> None:
+    blob_id = doc.blob_id
+    db.delete(doc)
+    release_blob(db, blob_id)
+    db.commit()
+    if blob_id is not None:
+        collect_garbage(db, [blob_id])
+
+
+@router.delete("/syllabus/{doc_id}")
+async def delete_syllabus(
+    doc_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    result = await db.execute(
+        select(models.SyllabusDoc).where(
+            models.SyllabusDoc.id == doc_id,
+            models.SyllabusDoc.user_id == user_id,
+        )
+    )
+    doc = result.scalars().first()
+    if not doc:
+        raise HTTPException(status_code=404, detail="Syllabus not found")
+    await db.run_sync(_delete_document, doc)
+    return {"id": doc_id, "message": "Syllabus deleted"}
+
+
+@router.delete("/reference/{ref_id}")
+async def delete_reference(
+    ref_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    result = await db.execute(
+        select(models.ReferenceMaterial).where(
+            models.ReferenceMaterial.id == ref_id,
+            models.ReferenceMaterial.user_id == user_id,
+        )
+    )
+    ref = result.scalars().first()
+    if not ref:
+        raise HTTPException(status_code=404, detail="Reference material not found")
+    await db.run_sync(_delete_document, ref)
+    return {"id": ref_id, "message": "Reference deleted"}
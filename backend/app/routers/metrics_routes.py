@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends
+
+from .. import assembly, chunk_store, paper_service, passwords
+from ..auth import get_current_user_id, principal_cache
+from ..corpus import corpus_cache
+from ..database import pool_stats
+from ..llm_cache import response_cache
+from ..llm_service import llm_batcher, llm_router
+from ..question_index import question_index
+
+router = APIRouter(prefix="/metrics", tags=["metrics"])
+
+
+@router.get("/")
+def get_metrics(user_id: int = Depends(get_current_user_id)):
+    """In-process cache and pool counters, for sizing the deployment."""
+    return {
+        "db_pools": pool_stats(),
+        "question_index": question_index.stats(),
+        "auth_cache": principal_cache.stats(),
+        "password_hashing": passwords.stats(),
+        "llm_cache": response_cache.stats() if response_cache else None,
+        "llm_providers": llm_router.stats(),
+        "llm_batcher": llm_batcher.stats(),
+        "reference_index": corpus_cache.stats(),
+        "chunk_store": chunk_store.stats(),
+        "paper_assembly": assembly.stats(),
+        "duplicate_filter": paper_service.stats(),
+    }
@@ -1,167 +1,242 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from typing import Any, Dict, List, Optional, Union
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from ..auth import get_db, get_current_user
+from ..assembly import assemble_papers, assembly_mode, plan_from_bank
+from ..auth import get_db, get_current_user_id, get_read_db
 from .. import models, schemas
-from ..llm_service import generate_question_sets
-from ..utils import question_hash
+from ..config import settings
+from ..database import run_in_session
+from ..jobs import job_papers, submit_job
+from ..json_stream import StreamedQuestion, assemble
+from ..llm_service import generate_question_sets, stream_question_sets
+from ..pagination import decode_cursor, encode_cursor
+from ..serialization import (
+    PAPER_COLUMNS,
+    FastJSONResponse,
+    paper_by_id,
+    paper_summaries,
+    papers_with_questions,
+)
+from ..paper_service import load_generation_context, save_generated_sets
 
 router = APIRouter(prefix="/papers", tags=["papers"])
 
 
 @router.post("/generate", response_model=List[schemas.QuestionPaperOut])
-def generate_papers(
+async def generate_papers(
     payload: schemas.GeneratePaperRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    background: bool = False,
+    idempotency_key: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    syllabus = db.query(models.SyllabusDoc).filter(
-        models.SyllabusDoc.id == payload.syllabus_doc_id,
-        models.SyllabusDoc.user_id == current_user.id,
-    ).first()
-    if not syllabus:
-        raise HTTPException(status_code=404, detail="Syllabus not found")
-
-    base_query = db.query(models.ReferenceMaterial).filter(
-        models.ReferenceMaterial.user_id == current_user.id
+    """Generate three question paper sets.
+
+    `assembly_mode` "bank" assembles them from the user's past questions
+    for the subject, with exact module marks and `marks_distribution` (see
+    `assembly`); "auto" does the same and generates only the modules the
+    bank cannot fill. With `?background=true` the request is queued instead and a 202 with the
+    job is returned right away; poll `GET /papers/jobs/{id}` for the papers.
+    Resubmitting with the same `Idempotency-Key` header returns the same job.
+    """
+    if background:
+        job, _ = await db.run_sync(submit_job, payload, user_id, idempotency_key)
+        job_out = schemas.GenerationJobOut(
+            id=job.id,
+            status=job.status.value,
+            error=job.error,
+            created_at=job.created_at,
+            finished_at=job.finished_at,
+        )
+        return JSONResponse(status_code=202, content=jsonable_encoder(job_out))
+
+    mode = assembly_mode(payload)
+    if mode != "generate":
+        content, headers = await assemble_papers(payload, user_id, 3, mode)
+        return FastJSONResponse(content, headers=headers)
+
+    # The read and write phases are CPU-heavy (chunk scoring, near-duplicate
+    # checks), so they run in the threadpool on sync sessions of their own;
+    # only the provider call is awaited on the event loop, and no connection
+    # is held while it runs.
+    context = await run_in_threadpool(run_in_session, load_generation_context, payload, user_id)
+
+    llm_result = await generate_question_sets(
+        modules=context.modules,
+        reference_text=context.reference_text,
+        existing_questions=context.existing_questions,
+        num_sets=3,
+        bypass_cache=payload.bypass_cache,
+        user_id=user_id,
     )
 
-    refs = base_query.filter(
-        models.ReferenceMaterial.id.in_(payload.reference_material_ids),
-        models.ReferenceMaterial.material_type == models.MaterialType.reference,
-    ).all()
+    saved = await run_in_threadpool(run_in_session, save_generated_sets, payload, user_id, llm_result)
+    headers = {
+        "X-Prompt-Tokens-Saved": str(context.exclusion_tokens_saved),
+        "X-Questions-Dropped": str(saved.dropped),
+    }
+    return FastJSONResponse(saved.papers, headers=headers)
 
-    ref_qps = []
-    if payload.reference_question_material_ids:
-        ref_qps = base_query.filter(
-            models.ReferenceMaterial.id.in_(payload.reference_question_material_ids),
-            models.ReferenceMaterial.material_type == models.MaterialType.question_paper,
-        ).all()
 
-    if not refs and not ref_qps:
-        raise HTTPException(status_code=404, detail="No reference materials found")
+@router.post("/generate/stream")
+async def generate_papers_stream(
+    payload: schemas.GeneratePaperRequest,
+    request: Request,
+    user_id: int = Depends(get_current_user_id),
+):
+    """Generate papers, streaming each question as soon as it is complete.
+
+    The body is NDJSON, or server-sent events if the client accepts
+    `text/event-stream`. `question` events carry `set_number`,
+    `module_number` and the question; `unit_error` reports a unit that failed
+    (questions it produced before failing are kept); the final `papers`
+    event has the saved papers, after duplicates were dropped (counted in
+    `dropped`), or an `error`
+    event is sent instead. With a bank `assembly_mode` the bank's questions
+    are sent first and only the gaps are streamed from the LLM.
+    """
+    mode = assembly_mode(payload)
+    plan = None
+    if mode != "generate":
+        plan = await run_in_threadpool(run_in_session, plan_from_bank, payload, user_id, 3, mode == "auto")
+    context = None
+    if plan is None or plan.gaps:
+        context = await run_in_threadpool(run_in_session, load_generation_context, payload, user_id)
+    sse = "text/event-stream" in request.headers.get("accept", "")
+
+    def encode(event: Dict[str, Any]) -> str:
+        data = json.dumps(event, ensure_ascii=False)
+        return f"event: {event['type']}\ndata: {data}\n\n" if sse else data + "\n"
+
+    async def events():
+        received: List[StreamedQuestion] = []
+        reused = frozenset()
+        if plan is not None:
+            reused = frozenset(plan.hashes)
+            for set_obj in plan.to_llm_result()["sets"]:
+                for module in set_obj["modules"]:
+                    for question in module["questions"]:
+                        received.append(StreamedQuestion(set_obj["set_number"], module["module_number"], question))
+                        yield encode(
+                            {
+                                "type": "question",
+                                "set_number": set_obj["set_number"],
+                                "module_number": module["module_number"],
+                                "question": question,
+                            }
+                        )
+        if context is not None:
+            async for event in stream_question_sets(
+                modules=context.modules,
+                reference_text=context.reference_text,
+                existing_questions=context.existing_questions,
+                num_sets=3,
+                bypass_cache=payload.bypass_cache,
+                only=plan.gaps if plan is not None else None,
+            ):
+                if event["type"] == "question":
+                    received.append(StreamedQuestion(event["set_number"], event["module_number"], event["question"]))
+                yield encode(event)
+        try:
+            saved = await run_in_threadpool(
+                run_in_session, save_generated_sets, payload, user_id, assemble(received), reused
+            )
+        except HTTPException as e:
+            yield encode({"type": "error", "detail": e.detail})
+            return
+        yield encode({"type": "papers", "papers": saved.papers, "dropped": saved.dropped})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        headers={"X-Prompt-Tokens-Saved": str(context.exclusion_tokens_saved if context else 0)},
+    )
 
-    reference_text = (syllabus.content_text or "") + "\n\n"
-    reference_text += "\n\n".join([r.content_text or "" for r in refs + ref_qps])
 
-    old_qs = (
-        db.query(models.Question)
-        .join(models.QuestionPaper)
+def _job_out(db: Session, job_id: int, user_id: int) -> Optional[schemas.GenerationJobOut]:
+    job = (
+        db.query(models.GenerationJob)
         .filter(
-            models.QuestionPaper.user_id == current_user.id,
-            models.QuestionPaper.subject == payload.subject,
-            models.QuestionPaper.subject_code == payload.subject_code,
-            models.QuestionPaper.semester == payload.semester,
+            models.GenerationJob.id == job_id,
+            models.GenerationJob.user_id == user_id,
         )
-        .all()
+        .first()
     )
-    existing_texts = [q.question_text for q in old_qs]
-
-    modules_data = [
-        {
-            "module_number": m.module_number,
-            "title": m.title,
-            "topics": m.topics,
-            "num_questions": m.num_questions,
-            "marks": m.marks,
-        }
-        for m in payload.modules
-    ]
-
-    llm_result = generate_question_sets(
-        modules=modules_data,
-        reference_text=reference_text,
-        existing_questions=existing_texts,
-        num_sets=3,
+    if not job:
+        return None
+    return schemas.GenerationJobOut(
+        id=job.id,
+        status=job.status.value,
+        error=job.error,
+        created_at=job.created_at,
+        finished_at=job.finished_at,
+        papers=[schemas.QuestionPaperOut.model_validate(p) for p in job_papers(db, job)],
     )
 
-    papers_out = []
-    used_hashes_in_batch = set()
-
-    for set_obj in llm_result.get("sets", []):
-        set_number = set_obj.get("set_number", 0)
-        qp = models.QuestionPaper(
-            user_id=current_user.id,
-            subject=payload.subject,
-            subject_code=payload.subject_code,
-            semester=payload.semester,
-            total_marks=payload.total_marks,
-            set_number=set_number,
-            num_modules=len(payload.modules),
-            marks_distribution=payload.marks_distribution,
-        )
-        db.add(qp)
-        db.flush()
-
-        for module in set_obj.get("modules", []):
-            module_number = module.get("module_number")
-            for q in module.get("questions", []):
-                q_text = (q.get("text") or "").strip()
-                if not q_text:
-                    continue
-                q_hash = question_hash(q_text)
-
-                if q_hash in used_hashes_in_batch:
-                    continue
-                existing_q = (
-                    db.query(models.Question)
-                    .join(models.QuestionPaper)
-                    .filter(
-                        models.Question.question_hash == q_hash,
-                        models.QuestionPaper.user_id == current_user.id,
-                    )
-                    .first()
-                )
-                if existing_q:
-                    continue
-
-                question = models.Question(
-                    question_paper_id=qp.id,
-                    module_number=module_number,
-                    question_text=q_text,
-                    marks=int(q.get("marks", 0)),
-                    blooms_level=q.get("blooms_level"),
-                    question_hash=q_hash,
-                )
-                db.add(question)
-                used_hashes_in_batch.add(q_hash)
-
-        db.commit()
-        db.refresh(qp)
-        papers_out.append(qp)
-
-    return papers_out
-
-
-@router.get("/", response_model=List[schemas.QuestionPaperOut])
-def list_papers(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+
+@router.get("/jobs/{job_id}", response_model=schemas.GenerationJobOut)
+async def get_job(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    papers = (
-        db.query(models.QuestionPaper)
-        .filter(models.QuestionPaper.user_id == current_user.id)
-        .order_by(models.QuestionPaper.created_at.desc())
-        .all()
-    )
-    return papers
+    # Validating the papers loads their questions lazily, which only the
+    # sync session under `run_sync` can do.
+    job_out = await db.run_sync(_job_out, job_id, user_id)
+    if job_out is None:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return job_out
+
+
+@router.get("/", response_model=Union[List[schemas.QuestionPaperOut], List[schemas.QuestionPaperSummary]])
+async def list_papers(
+    limit: int = Query(settings.PAPER_PAGE_SIZE, ge=1, le=settings.PAPER_PAGE_MAX),
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    db: AsyncSession = Depends(get_read_db),
+    user_id: int = Depends(get_current_user_id),
+):
+    """List the user's papers, newest first, one page at a time.
+
+    Pass the `X-Next-Cursor` response header back as `cursor` for the next
+    page; it is absent on the last page. With `summary=true` papers come
+    without their questions, only a `question_count`.
+    """
+    paper = models.QuestionPaper
+    query = select(*PAPER_COLUMNS, paper.created_at).where(paper.user_id == user_id)
+    if cursor:
+        created_at, last_id = decode_cursor(cursor)
+        query = query.where(
+            or_(paper.created_at < created_at, and_(paper.created_at == created_at, paper.id < last_id))
+        )
+    # One extra row tells whether another page exists.
+    result = await db.execute(query.order_by(paper.created_at.desc(), paper.id.desc()).limit(limit + 1))
+    rows = result.all()
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    # Rows are serialized straight from the projected columns (see `serialization`).
+    if summary:
+        return FastJSONResponse(await db.run_sync(paper_summaries, rows), headers=headers)
+    return FastJSONResponse(await db.run_sync(papers_with_questions, rows), headers=headers)
 
 
 @router.get("/{paper_id}", response_model=schemas.QuestionPaperOut)
-def get_paper(
+async def get_paper(
     paper_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    qp = (
-        db.query(models.QuestionPaper)
-        .filter(
-            models.QuestionPaper.id == paper_id,
-            models.QuestionPaper.user_id == current_user.id,
-        )
-        .first()
-    )
-    if not qp:
+    content = await db.run_sync(paper_by_id, user_id, paper_id)
+    if content is None:
         raise HTTPException(status_code=404, detail="Question paper not found")
-    return qp
+    return FastJSONResponse(content)
@@ -1,43 +1,44 @@
 from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from .. import models, schemas
-from ..auth import get_db, get_current_user
+from ..auth import Principal, get_current_principal, get_current_user_id, get_db, get_read_db
 
 router = APIRouter(prefix="/user", tags=["user"])
 
 
 @router.get("/me", response_model=schemas.UserBase)
-def get_me(current_user: models.User = Depends(get_current_user)):
-    return current_user
+async def get_me(principal: Principal = Depends(get_current_principal)):
+    return principal
+
+
+async def _find_profile(db: AsyncSession, user_id: int):
+    result = await db.execute(select(models.FacultyProfile).where(models.FacultyProfile.user_id == user_id))
+    return result.scalars().first()
 
 
 @router.get("/profile", response_model=schemas.FacultyProfileOut)
-def get_profile(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+async def get_profile(
+    db: AsyncSession = Depends(get_read_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    profile = db.query(models.FacultyProfile).filter(
-        models.FacultyProfile.user_id == current_user.id
-    ).first()
-    return profile
+    return await _find_profile(db, user_id)
 
 
 @router.put("/profile", response_model=schemas.FacultyProfileOut)
-def update_profile(
+async def update_profile(
     profile_in: schemas.FacultyProfileUpdate,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user_id: int = Depends(get_current_user_id),
 ):
-    profile = db.query(models.FacultyProfile).filter(
-        models.FacultyProfile.user_id == current_user.id
-    ).first()
+    profile = await _find_profile(db, user_id)
     if not profile:
-        profile = models.FacultyProfile(user_id=current_user.id)
+        profile = models.FacultyProfile(user_id=user_id)
         db.add(profile)
-        db.flush()
+        await db.flush()
     profile.department = profile_in.department
     profile.designation = profile_in.designation
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
+    await db.refresh(profile)
     return profile
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 from pydantic import BaseModel, EmailStr
 
 
@@ -59,10 +60,19 @@ class GeneratePaperRequest(BaseModel):
     subject_code: str
     total_marks: int
     modules: List[ModuleInput]
+    # Questions per marks value across the paper, e.g. {"2": 5, "10": 3}.
+    # Binding when papers are assembled from the question bank.
     marks_distribution: Optional[dict] = None
+    # Questions per Bloom's level across the paper, e.g. {"Apply": 3};
+    # the bank assembler gets as close to it as the bank allows.
+    blooms_distribution: Optional[Dict[str, int]] = None
+    # "generate", "bank" or "auto"; defaults to PAPER_ASSEMBLY_MODE.
+    assembly_mode: Optional[Literal["generate", "bank", "auto"]] = None
     syllabus_doc_id: int
     reference_material_ids: List[int]
     reference_question_material_ids: List[int] = []
+    # Skip the LLM response cache and always call the provider.
+    bypass_cache: bool = False
 
 
 class QuestionOut(BaseModel):
@@ -88,3 +98,29 @@ class QuestionPaperOut(BaseModel):
 
     class Config:
         from_attributes = True
+
+
+class QuestionPaperSummary(BaseModel):
+    """A paper without its questions, for listings."""
+
+    id: int
+    set_number: int
+    subject: str
+    subject_code: str
+    semester: str
+    total_marks: int
+    num_modules: int
+    created_at: Optional[datetime]
+    question_count: int
+
+    class Config:
+        from_attributes = True
+
+
+class GenerationJobOut(BaseModel):
+    id: int
+    status: str
+    error: Optional[str] = None
+    created_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    papers: List[QuestionPaperOut] = []
@@ -0,0 +1,137 @@
+"""Fast path for returning question papers.
+
+Validating ORM objects through `QuestionPaperOut` with `from_attributes` and
+then running `jsonable_encoder` over the result dominated the CPU time of
+large listings. The functions here read only the needed columns into plain
+dicts shaped exactly like `QuestionPaperOut` / `QuestionPaperSummary`, and
+`FastJSONResponse` encodes them with orjson without validating them again:
+the data comes straight from our own tables, so there is nothing to check.
+
+Routes keep their `response_model` for the OpenAPI schema; returning a
+`Response` makes FastAPI skip the model at runtime.
+"""
+import json
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+from fastapi.responses import JSONResponse
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+PAPER_COLUMNS = (
+    models.QuestionPaper.id,
+    models.QuestionPaper.set_number,
+    models.QuestionPaper.subject,
+    models.QuestionPaper.subject_code,
+    models.QuestionPaper.semester,
+    models.QuestionPaper.total_marks,
+    models.QuestionPaper.num_modules,
+)
+QUESTION_COLUMNS = (
+    models.Question.question_paper_id,
+    models.Question.id,
+    models.Question.module_number,
+    models.Question.question_text,
+    models.Question.blooms_level,
+    models.Question.marks,
+)
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response encoded with orjson when available, without validation."""
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content)
+        return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+def paper_dict(row: Sequence[Any], questions: List[Dict[str, Any]]) -> Dict[str, Any]:
+    paper_id, set_number, subject, subject_code, semester, total_marks, num_modules = row[:7]
+    return {
+        "id": paper_id,
+        "set_number": set_number,
+        "subject": subject,
+        "subject_code": subject_code,
+        "semester": semester,
+        "total_marks": total_marks,
+        "num_modules": num_modules,
+        "questions": questions,
+    }
+
+
+def question_dicts(db: Session, paper_ids: Iterable[int]) -> Dict[int, List[Dict[str, Any]]]:
+    """Questions of `paper_ids`, grouped by paper, in id order."""
+    grouped: Dict[int, List[Dict[str, Any]]] = defaultdict(list)
+    paper_ids = list(paper_ids)
+    if not paper_ids:
+        return grouped
+    rows = (
+        db.query(*QUESTION_COLUMNS)
+        .filter(models.Question.question_paper_id.in_(paper_ids))
+        .order_by(models.Question.question_paper_id, models.Question.id)
+        .all()
+    )
+    for paper_id, question_id, module_number, text, blooms_level, marks in rows:
+        grouped[paper_id].append(
+            {
+                "id": question_id,
+                "module_number": module_number,
+                "question_text": text,
+                "blooms_level": blooms_level,
+                "marks": marks,
+            }
+        )
+    return grouped
+
+
+def papers_with_questions(db: Session, paper_rows: Sequence[Sequence[Any]]) -> List[Dict[str, Any]]:
+    """`QuestionPaperOut`-shaped dicts for rows selected with `PAPER_COLUMNS`."""
+    questions = question_dicts(db, [row[0] for row in paper_rows])
+    return [paper_dict(row, questions.get(row[0], [])) for row in paper_rows]
+
+
+def paper_by_id(db: Session, user_id: int, paper_id: int) -> Optional[Dict[str, Any]]:
+    row = (
+        db.query(*PAPER_COLUMNS)
+        .filter(models.QuestionPaper.id == paper_id, models.QuestionPaper.user_id == user_id)
+        .first()
+    )
+    if row is None:
+        return None
+    return papers_with_questions(db, [row])[0]
+
+
+def paper_summaries(db: Session, paper_rows: Sequence[Any]) -> List[Dict[str, Any]]:
+    """`QuestionPaperSummary`-shaped dicts for rows of `PAPER_COLUMNS` plus `created_at`."""
+    counts: Dict[int, int] = {}
+    if paper_rows:
+        counts = dict(
+            db.query(models.Question.question_paper_id, func.count(models.Question.id))
+            .filter(models.Question.question_paper_id.in_([row[0] for row in paper_rows]))
+            .group_by(models.Question.question_paper_id)
+            .all()
+        )
+    summaries = []
+    for row in paper_rows:
+        item = paper_dict(row, [])
+        del item["questions"]
+        item["created_at"] = row.created_at
+        item["question_count"] = counts.get(row[0], 0)
+        summaries.append(item)
+    return summaries
+
@@ -0,0 +1,83 @@
+"""Streaming storage for uploaded files.
+
+Uploads are copied to disk in fixed-size chunks while a SHA-256 digest is
+computed, so memory per upload is bounded by `settings.UPLOAD_CHUNK_BYTES`
+no matter how large the file is. Blocking file I/O runs in the threadpool.
+"""
+import codecs
+import hashlib
+import os
+import uuid
+from dataclasses import dataclass
+
+from fastapi import HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
+
+from .config import settings
+
+
+@dataclass
+class StoredUpload:
+    path: str
+    sha256: str
+    size: int
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+async def save_upload(file: UploadFile, dest_path: str) -> StoredUpload:
+    """Stream `file` to `dest_path`, enforcing `settings.MAX_UPLOAD_BYTES`.
+
+    The data is written to a temporary name first and renamed into place
+    once complete, so a failed or oversized upload never leaves a truncated
+    file at `dest_path`. Raises HTTP 413 if the upload is too large.
+    """
+    directory = os.path.dirname(dest_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = os.path.join(directory, f".upload-{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    out = await run_in_threadpool(open, tmp_path, "wb")
+    try:
+        while True:
+            chunk = await file.read(settings.UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > settings.MAX_UPLOAD_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"File exceeds the maximum upload size of {settings.MAX_UPLOAD_BYTES} bytes.",
+                )
+            hasher.update(chunk)
+            await run_in_threadpool(out.write, chunk)
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(os.replace, tmp_path, dest_path)
+    except BaseException:
+        await run_in_threadpool(out.close)
+        await run_in_threadpool(_remove_quietly, tmp_path)
+        raise
+    return StoredUpload(path=dest_path, sha256=hasher.hexdigest(), size=size)
+
+
+def read_text_incrementally(file_path: str) -> str:
+    """Decode a text file chunk by chunk, keeping at most `MAX_EXTRACTED_TEXT_CHARS`."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    parts = []
+    remaining = settings.MAX_EXTRACTED_TEXT_CHARS
+    with open(file_path, "rb") as f:
+        while remaining > 0:
+            chunk = f.read(settings.UPLOAD_CHUNK_BYTES)
+            text = decoder.decode(chunk, final=not chunk)
+            if text:
+                parts.append(text[:remaining])
+                remaining -= len(parts[-1])
+            if not chunk:
+                break
+    return "".join(parts)
+
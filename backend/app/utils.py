@@ -1,4 +1,7 @@
 import hashlib
+from typing import Iterable, Iterator, List, TypeVar
+
+T = TypeVar("T")
 
 
 def normalize_question_text(text: str) -> str:
@@ -10,15 +13,18 @@ def question_hash(text: str) -> str:
     return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
 
 
-def filter_reference_by_topics(reference_text: str, topics: str) -> str:
-    """Simple NLP-like filter: keep paragraphs mentioning at least one topic token."""
-    topic_tokens = [t.strip().lower() for t in topics.replace("\n", ",").split(",") if t.strip()]
-    if not topic_tokens:
-        return reference_text
-    paragraphs = [p.strip() for p in reference_text.split("\n\n") if p.strip()]
-    selected = []
-    for p in paragraphs:
-        low = p.lower()
-        if any(tok in low for tok in topic_tokens):
-            selected.append(p)
-    return "\n\n".join(selected) if selected else reference_text
+def chunked(items: Iterable[T], size: int) -> Iterator[List[T]]:
+    """Yield successive lists of at most `size` items (e.g. for bounded `IN` clauses)."""
+    batch: List[T] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return (len(text) + 3) // 4
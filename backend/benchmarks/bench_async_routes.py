@@ -0,0 +1,236 @@
+"""Load-test the read routes on the sync and the async database layer.
+
+Seeds a database with one user and N papers of 10 questions each, then for
+each variant starts a uvicorn server in a subprocess and hammers
+`GET /papers/?limit=20` and `GET /user/profile` with concurrent clients:
+
+- sync: the previous route shape, `def` routes and dependencies on a sync
+  `Session`, so every request goes through the threadpool (`sync_app`
+  below mirrors the old code);
+- async: the app as it is now, on `AsyncSession`.
+
+Run from `backend/`:
+
+    python -m benchmarks.bench_async_routes
+    python -m benchmarks.bench_async_routes --database-url 'mysql+pymysql://root:pw@localhost/qp_bench'
+
+The default is a throwaway SQLite file. SQLite serializes access and its
+async driver runs on a thread of its own, so MySQL gives the more realistic
+picture.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+# The app reads its settings at import time.
+if __name__ == "__main__":
+    _parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    _parser.add_argument("--database-url", default=None)
+    _parser.add_argument("--papers", type=int, default=200)
+    _parser.add_argument("--concurrency", type=int, default=64)
+    _parser.add_argument("--seconds", type=float, default=10.0)
+    _parser.add_argument("--port", type=int, default=8765)
+    ARGS = _parser.parse_args()
+    if ARGS.database_url is None:
+        ARGS.database_url = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+    os.environ["DATABASE_URL"] = ARGS.database_url
+    os.environ.pop("DATABASE_REPLICA_URL", None)
+
+from fastapi import Depends, FastAPI, HTTPException, Query  # noqa: E402
+from fastapi.security import OAuth2PasswordBearer  # noqa: E402
+from jose import JWTError, jwt  # noqa: E402
+
+from app import models  # noqa: E402
+from app.auth import Principal, create_access_token, principal_cache, token_cache_key  # noqa: E402
+from app.config import settings  # noqa: E402
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.serialization import PAPER_COLUMNS, FastJSONResponse, papers_with_questions  # noqa: E402
+
+QUESTIONS_PER_PAPER = 10
+ENDPOINTS = ("/papers/?limit=20", "/user/profile")
+
+# --- the previous, sync route shape ----------------------------------------
+
+sync_app = FastAPI()
+_oauth2 = OAuth2PasswordBearer(tokenUrl="/auth/login")
+
+
+def _sync_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+def _sync_user_id(token: str = Depends(_oauth2)) -> int:
+    cache_key = token_cache_key(token)
+    principal = principal_cache.get(cache_key)
+    if principal is not None:
+        return principal.id
+    try:
+        payload = jwt.decode(token, settings.JWT_SECRET_KEY, algorithms=[settings.JWT_ALGORITHM])
+    except JWTError:
+        raise HTTPException(status_code=401)
+    db = SessionLocal()
+    try:
+        row = db.query(models.User.id, models.User.name, models.User.email).filter(
+            models.User.id == int(payload["sub"])
+        ).first()
+    finally:
+        db.close()
+    if row is None:
+        raise HTTPException(status_code=401)
+    principal_cache.set(cache_key, Principal(id=row.id, name=row.name, email=row.email), float(payload["exp"]))
+    return row.id
+
+
+@sync_app.get("/papers/")
+def _sync_list_papers(
+    limit: int = Query(20),
+    db=Depends(_sync_db),
+    user_id: int = Depends(_sync_user_id),
+):
+    paper = models.QuestionPaper
+    rows = (
+        db.query(*PAPER_COLUMNS, paper.created_at)
+        .filter(paper.user_id == user_id)
+        .order_by(paper.created_at.desc(), paper.id.desc())
+        .limit(limit + 1)
+        .all()
+    )
+    return FastJSONResponse(papers_with_questions(db, rows[:limit]))
+
+
+@sync_app.get("/user/profile")
+def _sync_get_profile(db=Depends(_sync_db), user_id: int = Depends(_sync_user_id)):
+    profile = db.query(models.FacultyProfile).filter(models.FacultyProfile.user_id == user_id).first()
+    return {"id": profile.id, "user_id": profile.user_id, "department": profile.department}
+
+
+# --- load generation --------------------------------------------------------
+
+
+def seed(num_papers: int) -> str:
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        user = db.query(models.User).filter(models.User.email == "bench@example.com").first()
+        if user is None:
+            user = models.User(name="bench", email="bench@example.com", password_hash="x")
+            db.add(user)
+            db.flush()
+            db.add(models.FacultyProfile(user_id=user.id, department="CSE"))
+            for n in range(num_papers):
+                paper = models.QuestionPaper(
+                    user_id=user.id,
+                    subject="Computer Networks",
+                    subject_code="CS501",
+                    semester="5",
+                    total_marks=100,
+                    set_number=n % 3 + 1,
+                    num_modules=5,
+                )
+                paper.questions = [
+                    models.Question(
+                        user_id=user.id,
+                        module_number=q % 5 + 1,
+                        question_text=f"Paper {n} question {q}: explain the sliding window protocol.",
+                        blooms_level="Understand",
+                        marks=10,
+                        question_hash=f"{n:08d}{q:056d}",
+                    )
+                    for q in range(QUESTIONS_PER_PAPER)
+                ]
+                db.add(paper)
+            db.commit()
+        return create_access_token({"sub": user.id})
+    finally:
+        db.close()
+
+
+async def _wait_ready(client, url: str, process: subprocess.Popen) -> None:
+    for _ in range(200):
+        if process.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            await client.get(url)
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def _load(base_url: str, path: str, token: str, concurrency: int, seconds: float) -> Dict[str, float]:
+    import httpx
+
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        headers = {"Authorization": f"Bearer {token}"}
+        # Warm up caches and connections.
+        await asyncio.gather(*(client.get(path, headers=headers) for _ in range(concurrency)))
+        deadline = time.perf_counter() + seconds
+
+        async def worker():
+            nonlocal errors
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                if response.status_code != 200:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def run_variant(app_path: str, token: str, args) -> Dict[str, Dict[str, float]]:
+    import httpx
+
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", app_path, "--port", str(args.port), "--log-level", "warning"],
+        env=dict(os.environ, PYTHONPATH=os.getcwd()),
+    )
+    base_url = f"http://127.0.0.1:{args.port}"
+    try:
+        async with httpx.AsyncClient(base_url=base_url) as client:
+            await _wait_ready(client, "/docs", process)
+        return {path: await _load(base_url, path, token, args.concurrency, args.seconds) for path in ENDPOINTS}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(args: Optional[argparse.Namespace] = None) -> None:
+    args = args or ARGS
+    token = seed(args.papers)
+    results = {
+        "sync": asyncio.run(run_variant("benchmarks.bench_async_routes:sync_app", token, args)),
+        "async": asyncio.run(run_variant("app.main:app", token, args)),
+    }
+    print(f"database: {engine.url.render_as_string(hide_password=True)}, concurrency {args.concurrency}")
+    print(f"{'endpoint':<20} {'variant':<7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'errors':>7}")
+    for path in ENDPOINTS:
+        for variant, by_path in results.items():
+            r = by_path[path]
+            print(f"{path:<20} {variant:<7} {r['rps']:>8.0f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Time assembling papers from the question bank.
+
+Seeds an in-memory SQLite database with a bank of N past questions over five
+modules, with marks of 2, 5 and 10 and mixed Bloom's levels, then times
+`assembly.plan_from_bank` for three sets with exact module marks, a
+`marks_distribution` and a `blooms_distribution`. The bank is read from the
+database on every run, as in a request.
+
+Run from `backend/`:
+
+    python -m benchmarks.bench_bank_assembly
+"""
+import random
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import assembly, models, schemas
+from app.database import Base
+
+SIZES = (100, 1000, 10000)
+REPEATS = 5
+LEVELS = ("Remember", "Understand", "Apply", "Analyze", "Evaluate", "Create")
+MARKS = (2, 5, 10)
+
+# Per module: two 2-mark, one 5-mark and one 10-mark question (19 marks).
+REQUEST = schemas.GeneratePaperRequest(
+    semester="5",
+    subject="Computer Networks",
+    subject_code="CS501",
+    total_marks=95,
+    modules=[
+        schemas.ModuleInput(module_number=n, title=f"Module {n}", topics="", num_questions=4, marks=19)
+        for n in range(1, 6)
+    ],
+    marks_distribution={"2": 10, "5": 5, "10": 5},
+    blooms_distribution={"Remember": 4, "Understand": 6, "Apply": 6, "Analyze": 4},
+    syllabus_doc_id=1,
+    reference_material_ids=[1],
+)
+
+
+def build_session(size: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add(models.User(id=1, name="bench", email="bench@example.com", password_hash="x"))
+    rng = random.Random(size)
+    per_paper = 20
+    for p in range(size // per_paper):
+        paper = models.QuestionPaper(
+            user_id=1,
+            subject=REQUEST.subject,
+            subject_code=REQUEST.subject_code,
+            semester=REQUEST.semester,
+            total_marks=95,
+            set_number=p % 3 + 1,
+            num_modules=5,
+        )
+        paper.questions = [
+            models.Question(
+                user_id=1,
+                module_number=q % 5 + 1,
+                question_text=f"Paper {p} question {q}",
+                marks=rng.choice(MARKS),
+                blooms_level=rng.choice(LEVELS),
+                question_hash=f"{p:08d}{q:056d}",
+            )
+            for q in range(per_paper)
+        ]
+        db.add(paper)
+    db.commit()
+    db.close()
+    return Session
+
+
+def main() -> None:
+    print(f"{'bank size':>10} {'best ms':>9} {'bank qs':>8} {'gaps':>5}")
+    for size in SIZES:
+        Session = build_session(size)
+        timings = []
+        for _ in range(REPEATS):
+            db = Session()
+            start = time.perf_counter()
+            plan = assembly.plan_from_bank(db, REQUEST, 1, 3, allow_gaps=True)
+            timings.append(time.perf_counter() - start)
+            db.close()
+        print(f"{size:>10} {min(timings) * 1000:>9.1f} {plan.question_count():>8} {len(plan.gaps):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""Compare the ORM + Pydantic response path for papers with the fast path.
+
+Builds an in-memory SQLite database with N papers of 10 questions each and
+times, per listing:
+
+- orm: ORM query with lazy-loaded questions, validated through
+  `List[QuestionPaperOut]` with `from_attributes` and JSON-encoded the way
+  FastAPI does for a `response_model` (the previous behaviour);
+- fast: column-projected queries into plain dicts encoded by
+  `FastJSONResponse` (what `GET /papers/` does now).
+
+Run from `backend/`:
+
+    python -m benchmarks.bench_paper_serialization
+"""
+import json
+import time
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas
+from app.database import Base
+from app.serialization import PAPER_COLUMNS, FastJSONResponse, papers_with_questions
+
+SIZES = (10, 100, 1000)
+QUESTIONS_PER_PAPER = 10
+REPEATS = 5
+
+
+def build_db(num_papers: int):
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    user = models.User(name="bench", email="bench@example.com", password_hash="x")
+    db.add(user)
+    db.flush()
+    for n in range(num_papers):
+        paper = models.QuestionPaper(
+            user_id=user.id,
+            subject="Computer Networks",
+            subject_code="CS501",
+            semester="5",
+            total_marks=100,
+            set_number=n % 3 + 1,
+            num_modules=5,
+        )
+        paper.questions = [
+            models.Question(
+                user_id=user.id,
+                module_number=q % 5 + 1,
+                question_text=f"Paper {n} question {q}: explain the sliding window protocol with an example.",
+                blooms_level="Understand",
+                marks=10,
+                question_hash=f"{n:08d}{q:056d}",
+            )
+            for q in range(QUESTIONS_PER_PAPER)
+        ]
+        db.add(paper)
+    db.commit()
+    return Session, user.id
+
+
+def orm_path(db, user_id: int) -> bytes:
+    papers = (
+        db.query(models.QuestionPaper)
+        .filter(models.QuestionPaper.user_id == user_id)
+        .order_by(models.QuestionPaper.created_at.desc())
+        .all()
+    )
+    adapter = TypeAdapter(List[schemas.QuestionPaperOut])
+    validated = adapter.validate_python(papers, from_attributes=True)
+    content = adapter.dump_python(validated, mode="json")
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def fast_path(db, user_id: int) -> bytes:
+    rows = (
+        db.query(*PAPER_COLUMNS, models.QuestionPaper.created_at)
+        .filter(models.QuestionPaper.user_id == user_id)
+        .order_by(models.QuestionPaper.created_at.desc(), models.QuestionPaper.id.desc())
+        .all()
+    )
+    return FastJSONResponse(papers_with_questions(db, rows)).body
+
+
+def best_of(Session, func, user_id: int) -> float:
+    timings = []
+    for _ in range(REPEATS):
+        db = Session()
+        start = time.perf_counter()
+        func(db, user_id)
+        timings.append(time.perf_counter() - start)
+        db.close()
+    return min(timings)
+
+
+def main() -> None:
+    print(f"{'papers':>7} {'orm ms':>9} {'fast ms':>9} {'speedup':>8}")
+    for size in SIZES:
+        Session, user_id = build_db(size)
+        db = Session()
+        assert json.loads(orm_path(db, user_id)) == json.loads(fast_path(db, user_id))
+        db.close()
+        orm_ms = best_of(Session, orm_path, user_id) * 1000
+        fast_ms = best_of(Session, fast_path, user_id) * 1000
+        print(f"{size:>7} {orm_ms:>9.1f} {fast_ms:>9.1f} {orm_ms / fast_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+"""Compare the ORM write path for generated papers with the bulk insert path.
+
+For three papers (one generation request) of N questions each, times:
+
+- orm: `db.add` per paper with a `flush` for its id, `Question` objects
+  added per paper, one commit, a `refresh` per paper and the response read
+  back through the lazy-loaded `questions` (the previous behaviour);
+- bulk: `paper_service.persist_papers`, i.e. one INSERT for the papers, one
+  executemany for the questions and the response built from memory;
+- bulk-noreturning: the same with RETURNING disabled, which is the path
+  taken on MySQL.
+
+Run from `backend/`:
+
+    python -m benchmarks.bench_save_papers
+"""
+import time
+from typing import Any, Dict, List
+from unittest import mock
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models, paper_service
+from app.database import Base
+from app.serialization import paper_dict
+
+SIZES = (50, 100, 200)
+PAPERS = 3
+REPEATS = 5
+
+
+def build_session():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    db.add(models.User(id=1, name="bench", email="bench@example.com", password_hash="x"))
+    db.commit()
+    db.close()
+    return Session
+
+
+def make_rows(size: int, run: int):
+    paper_rows = [
+        {
+            "user_id": 1,
+            "subject": "Computer Networks",
+            "subject_code": "CS501",
+            "semester": "5",
+            "total_marks": 100,
+            "set_number": n + 1,
+            "num_modules": 5,
+            "marks_distribution": None,
+        }
+        for n in range(PAPERS)
+    ]
+    question_rows = [
+        [
+            {
+                "user_id": 1,
+                "module_number": q % 5 + 1,
+                "question_text": f"Run {run} paper {n} question {q}: explain the sliding window protocol.",
+                "marks": 10,
+                "blooms_level": "Understand",
+                "question_hash": f"{run:04d}{n:04d}{q:056d}",
+                "minhash": bytes(512),
+            }
+            for q in range(size)
+        ]
+        for n in range(PAPERS)
+    ]
+    return paper_rows, question_rows
+
+
+def orm_path(db, paper_rows, question_rows) -> List[Dict[str, Any]]:
+    papers = []
+    for paper_row, questions in zip(paper_rows, question_rows):
+        qp = models.QuestionPaper(**paper_row)
+        db.add(qp)
+        db.flush()
+        db.add_all([models.Question(question_paper_id=qp.id, **q) for q in questions])
+        papers.append(qp)
+    db.commit()
+    for qp in papers:
+        db.refresh(qp)
+    return [
+        paper_dict(
+            (p.id, p.set_number, p.subject, p.subject_code, p.semester, p.total_marks, p.num_modules),
+            [
+                {
+                    "id": q.id,
+                    "module_number": q.module_number,
+                    "question_text": q.question_text,
+                    "blooms_level": q.blooms_level,
+                    "marks": q.marks,
+                }
+                for q in p.questions
+            ],
+        )
+        for p in papers
+    ]
+
+
+def bulk_path(db, paper_rows, question_rows) -> List[Dict[str, Any]]:
+    return paper_service.persist_papers(db, paper_rows, question_rows)
+
+
+def bulk_noreturning_path(db, paper_rows, question_rows) -> List[Dict[str, Any]]:
+    with mock.patch.object(paper_service, "_returns_many", return_value=False):
+        return paper_service.persist_papers(db, paper_rows, question_rows)
+
+
+def best_of(Session, func, size: int) -> float:
+    timings = []
+    for run in range(REPEATS):
+        paper_rows, question_rows = make_rows(size, run)
+        db = Session()
+        start = time.perf_counter()
+        out = func(db, paper_rows, question_rows)
+        timings.append(time.perf_counter() - start)
+        assert sum(len(p["questions"]) for p in out) == size * PAPERS
+        db.close()
+    return min(timings)
+
+
+def main() -> None:
+    print(f"{'questions/paper':>15} {'orm ms':>9} {'bulk ms':>9} {'no-ret ms':>10} {'speedup':>8}")
+    for size in SIZES:
+        Session = build_session()
+        orm_ms = best_of(Session, orm_path, size) * 1000
+        bulk_ms = best_of(Session, bulk_path, size) * 1000
+        noret_ms = best_of(Session, bulk_noreturning_path, size) * 1000
+        print(f"{size:>15} {orm_ms:>9.1f} {bulk_ms:>9.1f} {noret_ms:>10.1f} {orm_ms / bulk_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
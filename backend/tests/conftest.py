@@ -0,0 +1,36 @@
+"""Run the suite against a throwaway SQLite database and the fake provider.
+
+The settings are read when `app.config` is imported, so the environment is
+set here, before any test module imports the app.
+"""
+import os
+import tempfile
+
+_tmp = tempfile.mkdtemp(prefix="qpg-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_tmp, 'test.db')}"
+os.environ["DATABASE_REPLICA_URL"] = ""
+os.environ["LLM_PROVIDER"] = "fake"
+os.environ["LLM_PROVIDERS"] = "fake"
+os.environ["LLM_CACHE_BACKEND"] = "none"
+
+import pytest  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app import models  # noqa: E402
+from app.database import Base  # noqa: E402
+
+
+@pytest.fixture
+def db():
+    """A session on a fresh in-memory database with one user."""
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(models.User(id=1, name="test", email="test@example.com", password_hash="x"))
+    session.commit()
+    try:
+        yield session
+    finally:
+        session.close()
+        engine.dispose()
@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+from collections import Counter
+
+import pytest
+from fastapi import HTTPException
+
+from app import assembly, models, schemas
+from app.assembly import BankQuestion
+from app.database import Base, engine
+
+
+def make_request(modules, total_marks, **extra) -> schemas.GeneratePaperRequest:
+    return schemas.GeneratePaperRequest(
+        semester="5",
+        subject="Computer Networks",
+        subject_code="CS501",
+        total_marks=total_marks,
+        modules=[
+            schemas.ModuleInput(module_number=n, title=f"Module {n}", topics="", num_questions=count, marks=marks)
+            for n, count, marks in modules
+        ],
+        syllabus_doc_id=1,
+        reference_material_ids=[1],
+        **extra,
+    )
+
+
+def add_paper(db, questions, subject="Computer Networks"):
+    """Save one paper holding `questions`, given as (module, marks, level, text)."""
+    paper = models.QuestionPaper(
+        user_id=1,
+        subject=subject,
+        subject_code="CS501",
+        semester="5",
+        total_marks=sum(q[1] for q in questions),
+        set_number=1,
+        num_modules=len({q[0] for q in questions}),
+    )
+    paper.questions = [
+        models.Question(
+            user_id=1,
+            module_number=module,
+            question_text=text,
+            marks=marks,
+            blooms_level=level,
+            question_hash=hashlib.sha256(text.encode()).hexdigest(),
+        )
+        for module, marks, level, text in questions
+    ]
+    db.add(paper)
+    db.commit()
+
+
+def bank_questions(module, marks, count, level="Remember"):
+    return [(module, marks, level, f"M{module} {marks}-mark {level} question {i}") for i in range(count)]
+
+
+def paper_marks(plan, set_number):
+    return {module: sum(q.marks for q in qs) for module, qs in plan.sets[set_number].items()}
+
+
+def test_compositions_are_exact_and_cheapest_first():
+    def questions(marks, uses):
+        return [BankQuestion(f"{marks}-{i}", "", 1, marks, None, u) for i, u in enumerate(uses)]
+
+    available = {2: questions(2, [0, 0, 5]), 4: questions(4, [3, 3]), 6: questions(6, [1])}
+    found = assembly._compositions(available, 2, 8, limit=10)
+    assert [composition for _, composition in found] == [{2: 1, 6: 1}, {4: 2}]
+    assert [cost for cost, _ in found] == [1, 6]
+    assert assembly._compositions(available, 2, 9, limit=10) == []
+
+
+def test_solve_marks_meets_distribution():
+    options = [[(0, {2: 1, 6: 1}), (5, {4: 2})], [(0, {2: 1, 6: 1}), (5, {4: 2})]]
+    assert assembly._solve_marks(options, None, allow_gaps=False) == [{2: 1, 6: 1}, {2: 1, 6: 1}]
+    choices = assembly._solve_marks(options, {2: 1, 4: 2, 6: 1}, allow_gaps=False)
+    assert sorted(map(sorted, (c.items() for c in choices))) == [[(2, 1), (6, 1)], [(4, 2)]]
+
+
+def test_solve_marks_unsatisfiable():
+    options = [[(0, {2: 1, 6: 1})], [(0, {2: 1, 6: 1})]]
+    assert assembly._solve_marks(options, {4: 2, 2: 1, 6: 1}, allow_gaps=False) is None
+    # With gaps, the module that cannot fit becomes one.
+    choices = assembly._solve_marks(options, {4: 2, 2: 1, 6: 1}, allow_gaps=True)
+    assert choices.count(None) == 1
+
+
+def test_plan_hits_module_marks_and_distribution(db):
+    questions = []
+    for module in (1, 2):
+        questions += bank_questions(module, 2, 4) + bank_questions(module, 5, 3) + bank_questions(module, 10, 3)
+    add_paper(db, questions)
+    payload = make_request([(1, 3, 17), (2, 3, 17)], 34, marks_distribution={"2": 2, "5": 2, "10": 2})
+
+    plan = assembly.plan_from_bank(db, payload, 1, 3, allow_gaps=False)
+
+    assert plan.gaps == []
+    seen = set()
+    for set_number in (1, 2, 3):
+        assert paper_marks(plan, set_number) == {1: 17, 2: 17}
+        picked = [q for qs in plan.sets[set_number].values() for q in qs]
+        assert Counter(q.marks for q in picked) == {2: 2, 5: 2, 10: 2}
+        hashes = {q.question_hash for q in picked}
+        assert not hashes & seen, "a question was reused across sets"
+        seen |= hashes
+    assert plan.hashes == seen
+
+
+def test_marks_distribution_overrides_cheapest_composition(db):
+    questions = []
+    for module in (1, 2):
+        questions += bank_questions(module, 2, 1) + bank_questions(module, 4, 2) + bank_questions(module, 6, 1)
+    add_paper(db, questions)
+    # The 4-mark questions have been used before, so {2, 6} is cheaper per module.
+    add_paper(db, bank_questions(1, 4, 2) + bank_questions(2, 4, 2))
+
+    plan = assembly.plan_from_bank(db, make_request([(1, 2, 8), (2, 2, 8)], 16), 1, 1, allow_gaps=False)
+    assert [sorted(q.marks for q in qs) for qs in plan.sets[1].values()] == [[2, 6], [2, 6]]
+
+    payload = make_request([(1, 2, 8), (2, 2, 8)], 16, marks_distribution={"2": 1, "4": 2, "6": 1})
+    plan = assembly.plan_from_bank(db, payload, 1, 1, allow_gaps=False)
+    assert paper_marks(plan, 1) == {1: 8, 2: 8}
+    assert Counter(q.marks for qs in plan.sets[1].values() for q in qs) == {2: 1, 4: 2, 6: 1}
+
+
+def test_blooms_distribution_steers_picks(db):
+    add_paper(db, bank_questions(1, 5, 3, "Remember") + bank_questions(1, 5, 3, "Apply"))
+    payload = make_request([(1, 2, 10)], 10, blooms_distribution={"Apply": 2})
+    plan = assembly.plan_from_bank(db, payload, 1, 1, allow_gaps=False)
+    assert [q.blooms_level for q in plan.sets[1][1]] == ["Apply", "Apply"]
+
+    payload = make_request([(1, 2, 10)], 10, blooms_distribution={"Remember": 1, "Apply": 1})
+    plan = assembly.plan_from_bank(db, payload, 1, 1, allow_gaps=False)
+    assert sorted(q.blooms_level for q in plan.sets[1][1]) == ["Apply", "Remember"]
+
+
+def test_bank_mode_unsatisfiable_is_422(db):
+    questions = []
+    for module in (1, 2):
+        questions += bank_questions(module, 2, 4) + bank_questions(module, 5, 3) + bank_questions(module, 10, 2)
+    add_paper(db, questions)
+    payload = make_request([(1, 3, 17), (2, 3, 17)], 34, marks_distribution={"2": 2, "5": 2, "10": 2})
+
+    # Two sets fit; the third runs out of 10-mark questions.
+    assert assembly.plan_from_bank(db, payload, 1, 2, allow_gaps=False).gaps == []
+    with pytest.raises(HTTPException) as exc:
+        assembly.plan_from_bank(db, payload, 1, 3, allow_gaps=False)
+    assert exc.value.status_code == 422
+    assert "set 3" in exc.value.detail
+
+
+def test_assemble_papers_in_bank_mode_is_422_when_unsatisfiable():
+    Base.metadata.create_all(engine)
+    try:
+        with pytest.raises(HTTPException) as exc:
+            asyncio.run(assembly.assemble_papers(make_request([(1, 2, 10)], 10), 1, 3, "bank"))
+    finally:
+        Base.metadata.drop_all(engine)
+    assert exc.value.status_code == 422
+
+
+def test_auto_mode_leaves_gaps_for_the_llm(db):
+    add_paper(db, bank_questions(1, 5, 2))
+    payload = make_request([(1, 2, 10), (2, 2, 10)], 20)
+    plan = assembly.plan_from_bank(db, payload, 1, 1, allow_gaps=True)
+    assert paper_marks(plan, 1) == {1: 10}
+    assert [(set_number, unit["module_number"]) for set_number, unit in plan.gaps] == [(1, 2)]
+
+
+def test_bank_is_scoped_to_the_subject(db):
+    add_paper(db, bank_questions(1, 5, 2), subject="Operating Systems")
+    with pytest.raises(HTTPException) as exc:
+        assembly.plan_from_bank(db, make_request([(1, 2, 10)], 10), 1, 1, allow_gaps=False)
+    assert exc.value.status_code == 422
+
+
+@pytest.mark.parametrize(
+    "modules, total, distribution",
+    [
+        ([(1, 2, 10)], 12, None),  # module marks do not add up to total_marks
+        ([(1, 2, 10)], 10, {"5": 3}),  # wrong number of questions
+        ([(1, 2, 10)], 10, {"2": 1, "5": 1}),  # wrong total
+        ([(1, 2, 10)], 10, {"five": 2}),  # malformed
+    ],
+)
+def test_inconsistent_request_is_422(db, modules, total, distribution):
+    payload = make_request(modules, total, marks_distribution=distribution)
+    with pytest.raises(HTTPException) as exc:
+        assembly.plan_from_bank(db, payload, 1, 1, allow_gaps=True)
+    assert exc.value.status_code == 422
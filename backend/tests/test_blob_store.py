@@ -0,0 +1,116 @@
+import asyncio
+import io
+import os
+
+import pytest
+from fastapi import UploadFile
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from app import models
+from app.blob_store import collect_garbage, commit_upload, store_upload
+from app.config import settings
+from app.routers.file_routes import _delete_document
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """Run `work(session)` against a fresh SQLite file, with uploads under `tmp_path`."""
+    monkeypatch.setattr(settings, "FILE_UPLOAD_DIR", str(tmp_path / "uploads"))
+
+    def run(work):
+        async def main():
+            engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'blobs.db'}")
+            async with engine.begin() as conn:
+                await conn.run_sync(models.Base.metadata.create_all)
+            try:
+                async with async_sessionmaker(engine, expire_on_commit=False)() as db:
+                    return await work(db)
+            finally:
+                await engine.dispose()
+
+        return asyncio.run(main())
+
+    return run
+
+
+async def upload(db, content, user_id=1):
+    """Upload `content` as a reference material, committed like the upload route does."""
+    # An extension with no extractor keeps the process pool out of the test.
+    blob = await store_upload(db, UploadFile(file=io.BytesIO(content), filename="notes.dat"))
+    ref = models.ReferenceMaterial(user_id=user_id, title="notes", file_path=blob.file_path, blob_id=blob.id)
+    db.add(ref)
+    await commit_upload(db, blob)
+    return ref
+
+
+async def blob_rows(db):
+    return await db.run_sync(lambda s: s.query(models.FileBlob).populate_existing().all())
+
+
+async def add_user(db):
+    db.add(models.User(id=1, name="test", email="test@example.com", password_hash="x"))
+    await db.commit()
+
+
+def test_refcount_follows_documents_until_collected(store):
+    async def work(db):
+        await add_user(db)
+        first = await upload(db, b"same bytes")
+        second = await upload(db, b"same bytes")
+        (blob,) = await blob_rows(db)
+        assert blob.ref_count == 2 and first.blob_id == second.blob_id == blob.id
+        paths = (blob.file_path, blob.chunk_path)
+        assert all(os.path.exists(p) for p in paths)
+
+        await db.run_sync(_delete_document, first)
+        (blob,) = await blob_rows(db)
+        assert blob.ref_count == 1
+        assert all(os.path.exists(p) for p in paths)
+
+        await db.run_sync(_delete_document, second)
+        assert await blob_rows(db) == []
+        assert not any(os.path.exists(p) for p in paths)
+
+    store(work)
+
+
+def test_failed_commit_releases_the_reference(store):
+    async def work(db):
+        await add_user(db)
+        await upload(db, b"shared bytes")
+        with pytest.raises(IntegrityError):
+            # Without a user the document row cannot be committed.
+            await upload(db, b"shared bytes", user_id=None)
+        (blob,) = await blob_rows(db)
+        assert blob.ref_count == 1
+
+    store(work)
+
+
+def test_failed_commit_of_a_new_blob_removes_it(store, tmp_path):
+    async def work(db):
+        with pytest.raises(IntegrityError):
+            await upload(db, b"fresh bytes", user_id=None)
+        assert await blob_rows(db) == []
+
+    store(work)
+    blob_dir = tmp_path / "uploads" / "blobs"
+    assert [f for _, _, files in os.walk(blob_dir) for f in files] == []
+
+
+def test_collect_garbage_skips_referenced_blobs(store):
+    async def work(db):
+        await add_user(db)
+        kept_id = (await upload(db, b"kept")).blob_id
+        orphan = await upload(db, b"orphan")
+        await db.run_sync(
+            lambda s: s.query(models.FileBlob)
+            .filter(models.FileBlob.id == orphan.blob_id)
+            .update({models.FileBlob.ref_count: 0})
+        )
+        await db.commit()
+        assert await db.run_sync(collect_garbage) == 1
+        assert [b.id for b in await blob_rows(db)] == [kept_id]
+
+    store(work)
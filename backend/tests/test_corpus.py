@@ -0,0 +1,61 @@
+from app import chunk_store
+from app.chunk_store import ChunkPack
+from app.corpus import BlobIndex, Chunk, build_chunks, filter_reference_by_topics, pack_chunks
+
+
+def packed_index(tmp_path, paragraphs, name="doc.pack"):
+    rows = build_chunks("\n\n".join(paragraphs))
+    path = str(tmp_path / name)
+    pack_chunks(rows, path)
+    chunks = [
+        Chunk(
+            term_counts=row.term_counts,
+            token_count=row.token_count,
+            char_count=row.char_count,
+            offset=row.store_offset,
+            length=row.store_length,
+        )
+        for row in rows
+    ]
+    return BlobIndex.from_chunks(chunks, pack=ChunkPack(path))
+
+
+def reads():
+    return chunk_store.counters["chunks_read"]
+
+
+PARAGRAPHS = [f"Paragraph {i} about {'routing' if i % 2 else 'switching'} " + "x" * 90 for i in range(40)]
+
+
+def test_matches_in_document_order(tmp_path):
+    index = packed_index(tmp_path, PARAGRAPHS)
+    text = filter_reference_by_topics([index], "routing")
+    assert text.split("\n\n") == PARAGRAPHS[1::2]
+
+
+def test_stops_reading_at_the_budget(tmp_path):
+    index = packed_index(tmp_path, PARAGRAPHS)
+    unbudgeted = filter_reference_by_topics([index], "routing")
+    before = reads()
+    text = filter_reference_by_topics([index], "routing", budget_chars=500)
+    # ~110-character chunks: five reach the budget, the other fifteen stay packed.
+    assert reads() - before == 5
+    assert unbudgeted.startswith(text)
+    assert len(text) >= 500
+
+
+def test_fallback_stops_at_the_budget(tmp_path):
+    first = packed_index(tmp_path, PARAGRAPHS, "a.pack")
+    second = packed_index(tmp_path, PARAGRAPHS, "b.pack")
+    before = reads()
+    text = filter_reference_by_topics([first, second], "quantum computing", budget_chars=300)
+    assert reads() - before == 3
+    assert text.split("\n\n") == PARAGRAPHS[:3]
+    assert filter_reference_by_topics([first], "quantum computing", fallback_to_all=False, budget_chars=300) == ""
+
+
+def test_without_budget_reads_everything(tmp_path):
+    index = packed_index(tmp_path, PARAGRAPHS)
+    before = reads()
+    assert filter_reference_by_topics([index], "quantum computing").split("\n\n") == PARAGRAPHS
+    assert reads() - before == len(PARAGRAPHS)
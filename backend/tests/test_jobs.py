@@ -0,0 +1,207 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from app import database, jobs, models, paper_service, schemas
+from app.config import settings
+from app.paper_service import GenerationContext
+from app.question_index import QuestionIndexCache
+
+PAYLOAD = schemas.GeneratePaperRequest(
+    semester="5",
+    subject="Computer Networks",
+    subject_code="CS501",
+    total_marks=10,
+    modules=[schemas.ModuleInput(module_number=1, title="Transport", topics="tcp", num_questions=2, marks=10)],
+    assembly_mode="generate",
+    syllabus_doc_id=1,
+    reference_material_ids=[1],
+)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    """A session on the app's database (the one workers use), emptied of jobs and papers."""
+    database.Base.metadata.create_all(bind=database.engine)
+    session = database.SessionLocal()
+    for table in (models.Question, models.QuestionPaper, models.GenerationJob):
+        session.query(table).delete()
+    if session.get(models.User, 1) is None:
+        session.add(models.User(id=1, name="test", email="test@example.com", password_hash="x"))
+    session.commit()
+    monkeypatch.setattr(paper_service, "question_index", QuestionIndexCache(max_bytes=64 * 1024 * 1024))
+    monkeypatch.setattr(
+        jobs,
+        "load_generation_context",
+        lambda db, payload, user_id: GenerationContext(modules=[], reference_text="", existing_questions=[]),
+    )
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+def fake_sets(during=None):
+    """A stand-in for the provider call; runs `during()` while it is in flight."""
+    calls = SimpleNamespace(count=0)
+
+    async def generate_question_sets(**kwargs):
+        calls.count += 1
+        if during is not None:
+            await during()
+        return {
+            "sets": [
+                {
+                    "set_number": s,
+                    "modules": [
+                        {
+                            "module_number": 1,
+                            "questions": [
+                                {"text": f"Set {s}: explain congestion window growth", "marks": 5},
+                                {"text": f"Set {s}: derive slow start threshold behaviour", "marks": 5},
+                            ],
+                        }
+                    ],
+                }
+                for s in (1, 2, 3)
+            ]
+        }
+
+    return generate_question_sets, calls
+
+
+def take_over(job_id):
+    """Make `job_id`'s claim stale and claim it again, as another worker would."""
+    session = database.SessionLocal()
+    try:
+        session.query(models.GenerationJob).filter(models.GenerationJob.id == job_id).update(
+            {models.GenerationJob.claimed_at: datetime.utcnow() - timedelta(seconds=settings.JOB_STALE_SECONDS + 1)}
+        )
+        session.commit()
+        return jobs.claim_next_job(session)
+    finally:
+        session.close()
+
+
+def job_row(db, job_id):
+    db.expire_all()
+    return db.get(models.GenerationJob, job_id)
+
+
+def paper_count(db):
+    return db.query(models.QuestionPaper).count()
+
+
+def test_claims_oldest_runnable_job_once(db):
+    first, _ = jobs.submit_job(db, PAYLOAD, 1)
+    second, _ = jobs.submit_job(db, PAYLOAD, 1)
+
+    job_id, token = jobs.claim_next_job(db)
+    assert job_id == first.id
+    job = job_row(db, first.id)
+    assert (job.status, job.attempts, job.claim_token) == (models.JobStatus.running, 1, token)
+    assert jobs.claim_next_job(db)[0] == second.id
+    assert jobs.claim_next_job(db) is None
+
+
+def test_stale_claim_is_taken_over(db):
+    job, _ = jobs.submit_job(db, PAYLOAD, 1)
+    _, old_token = jobs.claim_next_job(db)
+
+    job_id, new_token = take_over(job.id)
+    assert job_id == job.id and new_token != old_token
+    assert job_row(db, job.id).attempts == 2
+    # The first worker can neither renew nor finish the job any more.
+    assert not jobs.renew_claim(db, job.id, old_token)
+    assert not jobs._finish_job(db, job.id, old_token, models.JobStatus.failed, None, "late")
+    assert job_row(db, job.id).status == models.JobStatus.running
+    assert jobs.renew_claim(db, job.id, new_token)
+
+
+def test_exhausted_stale_job_fails(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_MAX_ATTEMPTS", 1)
+    job, _ = jobs.submit_job(db, PAYLOAD, 1)
+    jobs.claim_next_job(db)
+
+    assert take_over(job.id) is None
+    job = job_row(db, job.id)
+    assert job.status == models.JobStatus.failed
+    assert job.claim_token is None
+
+
+def test_run_job_records_papers_with_result(db, monkeypatch):
+    generate, _ = fake_sets()
+    monkeypatch.setattr(jobs, "generate_question_sets", generate)
+    job, _ = jobs.submit_job(db, PAYLOAD, 1)
+    claim = jobs.claim_next_job(db)
+
+    asyncio.run(jobs.run_job(*claim))
+
+    job = job_row(db, job.id)
+    assert job.status == models.JobStatus.succeeded
+    assert job.claim_token is None
+    papers = jobs.job_papers(db, job)
+    assert [p.set_number for p in papers] == [1, 2, 3]
+    assert sorted(job.paper_ids) == sorted(p.id for p in papers) and paper_count(db) == 3
+
+
+def test_taken_over_job_leaves_no_papers(db, monkeypatch):
+    job, _ = jobs.submit_job(db, PAYLOAD, 1)
+    claim = jobs.claim_next_job(db)
+    new_claim = []
+
+    async def during():
+        # Another worker takes the job over while the provider call is in flight.
+        new_claim.append(take_over(job.id))
+
+    generate, _ = fake_sets(during)
+    monkeypatch.setattr(jobs, "generate_question_sets", generate)
+
+    asyncio.run(jobs.run_job(*claim))
+
+    job = job_row(db, job.id)
+    assert job.status == models.JobStatus.running
+    assert job.claim_token == new_claim[0][1]
+    assert job.paper_ids is None
+    assert paper_count(db) == 0
+
+
+def test_lost_heartbeat_stops_the_job(db, monkeypatch):
+    monkeypatch.setattr(settings, "JOB_HEARTBEAT_SECONDS", 0.01)
+    job, _ = jobs.submit_job(db, PAYLOAD, 1)
+    claim = jobs.claim_next_job(db)
+    finished = []
+
+    async def during():
+        take_over(job.id)
+        # The next heartbeat finds the claim gone and cancels the work here.
+        await asyncio.sleep(5)
+        finished.append(True)
+
+    generate, _ = fake_sets(during)
+    monkeypatch.setattr(jobs, "generate_question_sets", generate)
+
+    asyncio.run(asyncio.wait_for(jobs.run_job(*claim), timeout=2))
+
+    assert not finished
+    assert job_row(db, job.id).status == models.JobStatus.running
+    assert paper_count(db) == 0
+
+
+def test_idempotency_key_returns_the_same_job(db, monkeypatch):
+    generate, calls = fake_sets()
+    monkeypatch.setattr(jobs, "generate_question_sets", generate)
+
+    job, created = jobs.submit_job(db, PAYLOAD, 1, "key-1")
+    assert created
+    asyncio.run(jobs.run_job(*jobs.claim_next_job(db)))
+
+    again, created = jobs.submit_job(db, PAYLOAD, 1, "key-1")
+    assert not created and again.id == job.id
+    assert jobs.claim_next_job(db) is None
+    assert calls.count == 1 and paper_count(db) == 3
+
+    other, created = jobs.submit_job(db, PAYLOAD, 1, "key-2")
+    assert created and other.id != job.id
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+
+from app.json_stream import QuestionStreamParser, parse_answer
+
+ANSWER = {
+    "sets": [
+        {
+            "set_number": 1,
+            "modules": [
+                {
+                    "module_number": 1,
+                    "questions": [
+                        {
+                            "text": 'Explain the "three-way" handshake {SYN, ACK}.',
+                            "marks": 5,
+                            "blooms_level": "Understand",
+                        },
+                        {"text": "Path C:\\\\net\\\\tcp, a tab\\tand ] brackets [", "marks": 5, "blooms_level": "Apply"},
+                    ],
+                },
+                {
+                    "module_number": 2,
+                    "questions": [
+                        {"text": "Caf\u00e9 \u2013 routing \\u0041 \\\\\"", "marks": 10, "blooms_level": "Analyze"}
+                    ],
+                },
+            ],
+        },
+        {
+            "set_number": 2,
+            "modules": [
+                {"module_number": 1, "questions": [{"text": "What is {} in JSON?", "marks": 10, "blooms_level": None}]},
+                {"module_number": 2, "questions": [{"text": "Define \\\"latency\\\".", "marks": 10}]},
+            ],
+        },
+    ]
+}
+TEXT = json.dumps(ANSWER, indent=2)
+
+
+def flatten(answer):
+    return [
+        (s["set_number"], m["module_number"], q)
+        for s in answer["sets"]
+        for m in s["modules"]
+        for q in m["questions"]
+    ]
+
+
+def feed_all(chunks):
+    parser = QuestionStreamParser()
+    emitted = []
+    for chunk in chunks:
+        emitted.extend(parser.feed(chunk))
+    return parser, emitted
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_split_chunks_yield_every_question(size):
+    parser, emitted = feed_all(TEXT[i : i + size] for i in range(0, len(TEXT), size))
+    assert [(q.set_number, q.module_number, q.question) for q in emitted] == flatten(ANSWER)
+    assert parser.complete
+    assert parser.result() == ANSWER
+
+
+def test_split_at_every_position():
+    expected = flatten(ANSWER)
+    for cut in range(1, len(TEXT)):
+        _, emitted = feed_all([TEXT[:cut], TEXT[cut:]])
+        assert [(q.set_number, q.module_number, q.question) for q in emitted] == expected, cut
+
+
+def test_questions_are_emitted_as_soon_as_they_close():
+    first_end = TEXT.index("}", TEXT.index('"Understand"'))
+    parser = QuestionStreamParser()
+    assert parser.feed(TEXT[:first_end]) == []
+    [question] = parser.feed(TEXT[first_end : first_end + 1])
+    assert question.question["text"] == 'Explain the "three-way" handshake {SYN, ACK}.'
+    assert not parser.complete
+
+
+def test_preamble_and_missing_numbers():
+    text = '```json\n{"sets": [{"modules": [{"questions": [{"text": "a"}]}, {"questions": [{"text": "b"}]}]}]}\n```'
+    _, emitted = feed_all([text])
+    assert [(q.set_number, q.module_number, q.question["text"]) for q in emitted] == [(1, 1, "a"), (1, 2, "b")]
+
+
+def test_parse_answer_recovers_truncated_answer():
+    cut = TEXT.index('"set_number": 2')
+    result = parse_answer(TEXT[:cut] + '"set_number": 2, "modules": [{"module_number": 1, "questions": [{"te')
+    assert flatten(result) == flatten(ANSWER)[:3]
+
+
+def test_parse_answer_handles_trailing_garbage():
+    assert parse_answer("Here you go:\n" + TEXT + "\nHope this helps!") == ANSWER
+    assert flatten(parse_answer(TEXT + "} trailing }")) == flatten(ANSWER)
+
+
+def test_parse_answer_without_questions_raises():
+    with pytest.raises(ValueError):
+        parse_answer("I cannot help with that.")
+    with pytest.raises(ValueError):
+        parse_answer('{"sets": [{"set_number": 1, "modules": [')
@@ -0,0 +1,161 @@
+import asyncio
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from app.config import settings
+from app.fake_llm import fake_call, fake_stream
+from app.llm_router import ProviderRouter, parse_providers
+from app.llm_service import build_prompt
+
+MODULES = [
+    {"module_number": 1, "title": "Transport", "topics": "TCP handshake, congestion control", "num_questions": 2, "marks": 10}
+]
+PROMPT = build_prompt(MODULES, "", [], num_sets=1)
+
+
+@pytest.fixture(autouse=True)
+def router_settings(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_FAILURES", 2)
+    monkeypatch.setattr(settings, "LLM_BREAKER_RESET_SECONDS", 60)
+    monkeypatch.setattr(settings, "LLM_HEDGE_AFTER_SECONDS", 0)
+    monkeypatch.setattr(settings, "FAKE_LLM_LATENCY_SECONDS", 0)
+    monkeypatch.setattr(settings, "FAKE_LLM_FAILURE_RATE", 0)
+    set_profiles(monkeypatch, {"down": {"failure_rate": 1}})
+
+
+def set_profiles(monkeypatch, profiles):
+    monkeypatch.setattr(settings, "FAKE_LLM_PROFILES", json.dumps(profiles))
+
+
+def make_router(providers: str) -> ProviderRouter:
+    return ProviderRouter(
+        parse_providers(providers, {"fake": "fake"}),
+        calls={"fake": fake_call},
+        streams={"fake": fake_stream},
+    )
+
+
+def test_parse_providers_fills_in_default_models():
+    specs = parse_providers("openai:gpt-4o-mini, gemini ,fake", {"gemini": "gemini-1.5-flash"})
+    assert [spec.name for spec in specs] == ["openai:gpt-4o-mini", "gemini:gemini-1.5-flash", "fake:fake"]
+
+
+def test_fails_over_to_next_provider():
+    router = make_router("fake:down,fake")
+    result = asyncio.run(router.call(PROMPT))
+    assert [len(m["questions"]) for m in result["sets"][0]["modules"]] == [2]
+    stats = router.stats()
+    assert stats["fake:down"]["calls"] == 1
+    assert stats["fake:down"]["failures"] == 1
+    assert stats["fake:down"]["breaker"] == "closed"
+    assert stats["fake:fake"]["calls"] == 1
+    assert stats["fake:fake"]["failures"] == 0
+
+
+def test_breaker_opens_and_skips_provider():
+    router = make_router("fake:down,fake")
+    for _ in range(2):
+        asyncio.run(router.call(PROMPT))
+    assert router.stats()["fake:down"]["breaker"] == "open"
+
+    asyncio.run(router.call(PROMPT))
+    stats = router.stats()
+    assert stats["fake:down"]["calls"] == 2
+    assert stats["fake:down"]["skipped_open"] == 1
+    assert stats["fake:fake"]["calls"] == 3
+
+
+def test_half_open_trial_closes_or_reopens_breaker(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_BREAKER_RESET_SECONDS", 0.05)
+    router = make_router("fake:down,fake")
+    for _ in range(2):
+        asyncio.run(router.call(PROMPT))
+    breaker = router.breakers["fake:down"]
+    assert breaker.state == "open"
+
+    asyncio.run(asyncio.sleep(0.06))
+    assert breaker.state == "half_open"
+    # The trial fails: straight back to open, without waiting for more failures.
+    asyncio.run(router.call(PROMPT))
+    assert breaker.state == "open"
+    assert router.stats()["fake:down"]["calls"] == 3
+
+    asyncio.run(asyncio.sleep(0.06))
+    set_profiles(monkeypatch, {})
+    asyncio.run(router.call(PROMPT))
+    assert breaker.state == "closed"
+    assert breaker.failures == 0
+    assert router.stats()["fake:down"]["calls"] == 4
+
+
+def test_half_open_allows_a_single_trial():
+    router = make_router("fake:down,fake")
+    breaker = router.breakers["fake:down"]
+    breaker.reset_seconds = 0
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.release_trial()
+    assert breaker.allow()
+
+
+def test_closed_stream_releases_half_open_trial():
+    router = make_router("fake")
+    breaker = router.breakers["fake:fake"]
+    breaker.reset_seconds = 0
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == "half_open"
+
+    async def read_one_chunk_then_disconnect():
+        stream = router.stream(PROMPT)
+        await stream.__anext__()
+        await stream.aclose()
+
+    asyncio.run(read_one_chunk_then_disconnect())
+    # No verdict either way, but the provider can be tried again.
+    assert breaker.state == "half_open"
+    assert breaker.allow()
+
+
+def test_raises_last_error_when_every_provider_fails():
+    router = make_router("fake:down")
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(router.call(PROMPT))
+    assert exc.value.status_code == 502
+    with pytest.raises(HTTPException):
+        asyncio.run(router.call(PROMPT))
+
+    # Breaker open on the only provider: nothing left to try.
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(router.call(PROMPT))
+    assert exc.value.status_code == 503
+
+
+def test_hedges_slow_provider(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_HEDGE_AFTER_SECONDS", 0.05)
+    set_profiles(monkeypatch, {"slow": {"latency": 5}})
+    router = make_router("fake:slow,fake")
+    result = asyncio.run(asyncio.wait_for(router.call(PROMPT), timeout=2))
+    assert result["sets"]
+    stats = router.stats()
+    assert stats["fake:fake"]["hedges"] == 1
+    assert stats["fake:fake"]["hedge_wins"] == 1
+    # Losing the race is not a failure.
+    assert stats["fake:slow"]["failures"] == 0
+    assert stats["fake:slow"]["breaker"] == "closed"
+
+
+def test_stream_fails_over_before_first_chunk():
+    router = make_router("fake:down,fake")
+
+    async def collect():
+        return "".join([chunk async for chunk in router.stream(PROMPT)])
+
+    assert json.loads(asyncio.run(collect()))["sets"]
+    stats = router.stats()
+    assert stats["fake:down"]["failures"] == 1
+    assert stats["fake:fake"]["calls"] == 1
@@ -0,0 +1,75 @@
+import asyncio
+import time
+
+import pytest
+
+from app import llm_service
+from app.config import settings
+
+MODULES = [
+    {
+        "module_number": 1,
+        "title": "Transport",
+        "topics": "TCP handshake, congestion control",
+        "num_questions": 2,
+        "marks": 10,
+    },
+    {"module_number": 2, "title": "Routing", "topics": "Dijkstra, BGP", "num_questions": 3, "marks": 15},
+]
+
+
+def question_texts(result):
+    return [q["text"] for s in result["sets"] for m in s["modules"] for q in m["questions"]]
+
+
+@pytest.mark.parametrize("fan_out", ["module", "set", "none"])
+def test_generates_every_set_and_module(monkeypatch, fan_out):
+    monkeypatch.setattr(settings, "LLM_FAN_OUT", fan_out)
+    result = asyncio.run(llm_service.generate_question_sets(MODULES, "", [], num_sets=3))
+
+    assert [s["set_number"] for s in result["sets"]] == [1, 2, 3]
+    for set_obj in result["sets"]:
+        counts = {m["module_number"]: len(m["questions"]) for m in set_obj["modules"]}
+        assert counts == {1: 2, 2: 3}
+    texts = question_texts(result)
+    assert len(set(texts)) == len(texts), "sets repeat each other"
+
+
+def test_units_run_concurrently(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_FAN_OUT", "module")
+    monkeypatch.setattr(settings, "FAKE_LLM_LATENCY_SECONDS", 0.2)
+    started = time.perf_counter()
+    asyncio.run(llm_service.generate_question_sets(MODULES, "", [], num_sets=3))
+    # Six units of 0.2 s each; run one after another they would take 1.2 s.
+    assert time.perf_counter() - started < 0.6
+
+
+def test_gather_or_cancel_cancels_siblings_on_failure():
+    cancelled = []
+
+    async def slow(n):
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        return n
+
+    async def failing():
+        await asyncio.sleep(0.01)
+        raise ValueError("unit failed")
+
+    async def main():
+        return await asyncio.wait_for(llm_service.gather_or_cancel(slow(1), failing(), slow(2)), timeout=1)
+
+    with pytest.raises(ValueError):
+        asyncio.run(main())
+    assert sorted(cancelled) == [1, 2]
+
+
+def test_gather_or_cancel_keeps_order():
+    async def value(n, delay):
+        await asyncio.sleep(delay)
+        return n
+
+    assert asyncio.run(llm_service.gather_or_cancel(value(1, 0.03), value(2, 0.01), value(3, 0.02))) == [1, 2, 3]
@@ -0,0 +1,94 @@
+import itertools
+
+import pytest
+
+from app.config import settings
+from app.fake_llm import _wordings
+from app.near_dup import SIGNATURE_VERSION, minhasher, new_lsh_index, shingles, similarity
+
+# Rewordings of one question, which the filter should drop.
+REWORDED = [
+    ("Explain TCP handshake.", "Explain the TCP 3-way handshake"),
+    ("What are the necessary conditions for deadlock?", "State the four necessary conditions for a deadlock to occur."),
+    (
+        "What is a deadlock? Explain the conditions necessary for deadlock.",
+        "Define deadlock and list the conditions necessary for it.",
+    ),
+    ("Explain the OSI reference model with a neat diagram.", "Describe the seven layers of the OSI reference model."),
+    ("Explain paging with a neat diagram.", "Explain the concept of paging."),
+    (
+        "Explain the working of Dijkstra's shortest path algorithm.",
+        "Describe how Dijkstra's shortest path algorithm works.",
+    ),
+    ("Differentiate between TCP and UDP.", "Compare TCP with UDP."),
+    ("Explain the ACID properties of a transaction.", "What are the ACID properties of transactions? Explain each."),
+]
+# Distinct questions, often on related topics, which it should keep.
+DISTINCT = [
+    ("Explain process scheduling algorithms.", "Explain disk scheduling algorithms."),
+    ("Explain Dijkstra's shortest path algorithm.", "Explain the Bellman-Ford shortest path algorithm."),
+    ("Compare paging and segmentation.", "Compare paging and swapping."),
+    ("Explain TCP congestion control.", "Explain TCP flow control."),
+    ("Explain deadlock prevention.", "Explain deadlock avoidance."),
+    ("Explain the round robin scheduling algorithm.", "Explain the shortest job first scheduling algorithm."),
+    ("What are the main components of a TCP handshake?", "Describe how a TCP handshake works."),
+    ("Explain the ACID properties of a transaction.", "Explain two-phase locking for transactions."),
+]
+
+
+def estimate(a: str, b: str) -> float:
+    return similarity(minhasher.signature(a), minhasher.signature(b))
+
+
+def is_flagged(a: str, b: str) -> bool:
+    index = new_lsh_index()
+    index.add("past", minhasher.signature(a))
+    return bool(index.query(minhasher.signature(b), settings.NEAR_DUPLICATE_THRESHOLD))
+
+
+def test_normalizes_to_content_words():
+    assert shingles("Explain the TCP 3-way handshake") == {"tcp", "handshake"}
+    assert shingles("State the four necessary conditions.") == {"necessary", "condition"}
+
+
+def test_request_example_is_flagged():
+    assert is_flagged("Explain TCP handshake.", "Explain the TCP 3-way handshake")
+
+
+def test_different_topic_is_not_flagged():
+    assert not is_flagged(
+        "Explain the process scheduling algorithms with an example.",
+        "Explain the disk scheduling algorithms with an example.",
+    )
+
+
+@pytest.mark.parametrize("a, b", REWORDED)
+def test_rewordings_are_flagged(a, b):
+    assert is_flagged(a, b), estimate(a, b)
+
+
+@pytest.mark.parametrize("a, b", DISTINCT)
+def test_distinct_questions_are_not_flagged(a, b):
+    assert not is_flagged(a, b), estimate(a, b)
+
+
+def test_threshold_separates_the_examples():
+    lowest_reworded = min(estimate(a, b) for a, b in REWORDED)
+    highest_distinct = max(estimate(a, b) for a, b in DISTINCT)
+    assert highest_distinct < settings.NEAR_DUPLICATE_THRESHOLD < lowest_reworded
+
+
+def test_fake_wordings_are_not_near_duplicates():
+    wordings = [text for topic in ("tcp handshake", "routing", "paging") for _, text in _wordings([topic])]
+    for a, b in itertools.combinations(wordings, 2):
+        assert not is_flagged(a, b), (a, b)
+
+
+def test_stale_signatures_are_rejected():
+    signature = minhasher.signature("Explain TCP handshake.")
+    data = minhasher.to_bytes(signature)
+    assert data[0] == SIGNATURE_VERSION
+    assert (minhasher.from_bytes(data) == signature).all()
+    # Unversioned signatures from the character-shingle scheme.
+    assert minhasher.from_bytes(signature.astype("<u4").tobytes()) is None
+    assert minhasher.from_bytes(bytes([SIGNATURE_VERSION - 1]) + data[1:]) is None
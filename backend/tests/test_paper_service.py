@@ -0,0 +1,107 @@
+import pytest
+
+from app import models, paper_service, schemas
+from app.question_index import QuestionIndexCache
+from app.utils import question_hash
+
+PAYLOAD = schemas.GeneratePaperRequest(
+    semester="5",
+    subject="Computer Networks",
+    subject_code="CS501",
+    total_marks=10,
+    modules=[
+        schemas.ModuleInput(module_number=1, title="Transport", topics="", num_questions=2, marks=6),
+        schemas.ModuleInput(module_number=2, title="Routing", topics="", num_questions=1, marks=4),
+    ],
+    syllabus_doc_id=1,
+    reference_material_ids=[1],
+)
+
+PAST = "Describe the sliding window protocol used for flow control."
+
+
+def llm_result():
+    """Three sets, out of order, repeating a past question and one from an earlier set."""
+
+    def module(number, *texts):
+        return {"module_number": number, "questions": [{"text": t, "marks": 3, "blooms_level": "Apply"} for t in texts]}
+
+    return {
+        "sets": [
+            {
+                "set_number": 2,
+                "modules": [
+                    module(1, "Explain congestion window growth in TCP Reno.", PAST),
+                    module(2, "Compute shortest paths with Dijkstra on a sample graph."),
+                ],
+            },
+            {
+                "set_number": 1,
+                "modules": [
+                    module(1, "Derive the slow start threshold after a timeout."),
+                    module(2, "Contrast distance vector routing against link state flooding."),
+                ],
+            },
+            {
+                "set_number": 3,
+                "modules": [
+                    # Repeats a question of set 2 word for word.
+                    module(1, "Explain congestion window growth in TCP Reno."),
+                    module(2, "Illustrate count to infinity in RIP networks."),
+                ],
+            },
+        ]
+    }
+
+
+@pytest.fixture(params=["returning", "no_returning"])
+def returning(request, db, monkeypatch):
+    """Run once with INSERT ... RETURNING and once on the MySQL-style fallback."""
+    monkeypatch.setattr(paper_service, "question_index", QuestionIndexCache(max_bytes=64 * 1024 * 1024))
+    if request.param == "no_returning":
+        monkeypatch.setattr(paper_service, "_returns_many", lambda db: False)
+    paper = models.QuestionPaper(
+        user_id=1, subject="Computer Networks", subject_code="CS501", semester="5", total_marks=3, set_number=1,
+        num_modules=1,
+    )
+    paper.questions = [
+        models.Question(user_id=1, module_number=1, question_text=PAST, marks=3, question_hash=question_hash(PAST))
+    ]
+    db.add(paper)
+    db.commit()
+    return request.param
+
+
+def test_saved_papers_match_the_database(db, returning):
+    saved = paper_service.save_generated_sets(db, PAYLOAD, 1, llm_result())
+
+    assert (saved.duplicates, saved.near_duplicates) == (2, 0)
+    # Papers come back in the order the sets were given, with their own numbers.
+    assert [p["set_number"] for p in saved.papers] == [2, 1, 3]
+    db.expire_all()
+    for out in saved.papers:
+        paper = db.get(models.QuestionPaper, out["id"])
+        assert paper.set_number == out["set_number"] and paper.user_id == 1
+        stored = sorted(paper.questions, key=lambda q: q.id)
+        assert [q["id"] for q in out["questions"]] == [q.id for q in stored]
+        assert [q["question_text"] for q in out["questions"]] == [q.question_text for q in stored]
+        assert all(q.question_hash == question_hash(q.question_text) for q in stored)
+    texts = [[q["question_text"] for q in p["questions"]] for p in saved.papers]
+    assert texts == [
+        ["Explain congestion window growth in TCP Reno.", "Compute shortest paths with Dijkstra on a sample graph."],
+        [
+            "Derive the slow start threshold after a timeout.",
+            "Contrast distance vector routing against link state flooding.",
+        ],
+        ["Illustrate count to infinity in RIP networks."],
+    ]
+    # One row per hash: the past question and the repeat were not inserted again.
+    hashes = [h for (h,) in db.query(models.Question.question_hash).all()]
+    assert len(hashes) == len(set(hashes)) == 6
+
+
+def test_empty_result_saves_nothing(db, returning):
+    saved = paper_service.save_generated_sets(db, PAYLOAD, 1, {"sets": []})
+
+    assert saved.papers == []
+    assert db.query(models.QuestionPaper).count() == 1
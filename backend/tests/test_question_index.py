@@ -0,0 +1,149 @@
+import pytest
+
+from app import models, paper_service, schemas
+from app.near_dup import minhasher
+from app.question_index import QuestionIndexCache, user_scope
+from app.utils import question_hash
+
+PAYLOAD = schemas.GeneratePaperRequest(
+    semester="5",
+    subject="Computer Networks",
+    subject_code="CS501",
+    total_marks=10,
+    modules=[schemas.ModuleInput(module_number=1, title="Transport", topics="", num_questions=2, marks=10)],
+    syllabus_doc_id=1,
+    reference_material_ids=[1],
+)
+
+
+@pytest.fixture
+def index(monkeypatch):
+    cache = QuestionIndexCache(max_bytes=64 * 1024 * 1024)
+    monkeypatch.setattr(paper_service, "question_index", cache)
+    return cache
+
+
+def add_question(db, text, question_id=None, user_id=1, subject="Computer Networks", minhash=True):
+    paper = models.QuestionPaper(
+        user_id=user_id,
+        subject=subject,
+        subject_code="CS501",
+        semester="5",
+        total_marks=5,
+        set_number=1,
+        num_modules=1,
+    )
+    paper.questions = [
+        models.Question(
+            id=question_id,
+            user_id=user_id,
+            module_number=1,
+            question_text=text,
+            marks=5,
+            question_hash=question_hash(text),
+            minhash=minhasher.to_bytes(minhasher.signature(text)) if minhash else None,
+        )
+    ]
+    db.add(paper)
+    db.commit()
+
+
+def generated(*texts):
+    return {
+        "sets": [
+            {
+                "set_number": 1,
+                "modules": [{"module_number": 1, "questions": [{"text": t, "marks": 5} for t in texts]}],
+            }
+        ]
+    }
+
+
+def saved_texts(saved):
+    return [q["question_text"] for paper in saved.papers for q in paper["questions"]]
+
+
+def near_duplicates(index, db, text, scope=user_scope(1)):
+    return index.find_near_duplicates(db, scope, {"new": minhasher.signature(text)}, 0.65)
+
+
+def test_drops_exact_and_near_duplicates(db, index):
+    add_question(db, "Explain the sliding window protocol.")
+    add_question(db, "Explain TCP handshake.")
+    saved = paper_service.save_generated_sets(
+        db,
+        PAYLOAD,
+        1,
+        generated("Explain the sliding window protocol.", "Explain the TCP 3-way handshake", "Define subnetting."),
+    )
+    assert saved_texts(saved) == ["Define subnetting."]
+    assert (saved.duplicates, saved.near_duplicates) == (1, 1)
+
+
+def test_late_commit_below_watermark_is_still_a_duplicate(db, index):
+    add_question(db, "Explain the sliding window protocol.", question_id=10)
+    near_duplicates(index, db, "anything")  # warm: watermark is now id 10
+    # Another worker's transaction took id 5 earlier but commits only now.
+    add_question(db, "Define subnetting.", question_id=5)
+
+    saved = paper_service.save_generated_sets(db, PAYLOAD, 1, generated("Define subnetting.", "Explain ARP."))
+    assert saved_texts(saved) == ["Explain ARP."]
+    assert saved.duplicates == 1
+
+
+def test_catches_up_on_rows_written_elsewhere(db, index):
+    add_question(db, "Explain the sliding window protocol.")
+    assert not near_duplicates(index, db, "Explain the TCP 3-way handshake")
+    add_question(db, "Explain TCP handshake.")
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+    assert index.stats()["warm_loads"] == 1
+
+
+def test_records_own_saves_without_reloading(db, index):
+    near_duplicates(index, db, "anything")
+    paper_service.save_generated_sets(db, PAYLOAD, 1, generated("Explain TCP handshake."))
+    resident = index._indexes[user_scope(1)]
+    assert resident.last_question_id == 0
+    assert len(resident) == 1
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+
+
+def test_eviction_and_rewarm(db):
+    add_question(db, "Explain TCP handshake.", user_id=1)
+    db.add(models.User(id=2, name="other", email="other@example.com", password_hash="x"))
+    db.commit()
+    add_question(db, "Explain deadlock prevention.", user_id=2)
+    index = QuestionIndexCache(max_bytes=1)
+
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+    assert near_duplicates(index, db, "Explain deadlock prevention.", scope=user_scope(2)) == {"new"}
+    stats = index.stats()
+    # Over budget: only the most recently used scope stays resident.
+    assert (stats["indexes"], stats["evictions"], stats["warm_loads"]) == (1, 1, 2)
+
+    index.record(user_scope(1), [("x", minhasher.signature("Define subnetting."))])  # not resident: ignored
+    add_question(db, "Define subnetting.", user_id=1)
+    assert near_duplicates(index, db, "Define subnetting.") == {"new"}
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+    stats = index.stats()
+    assert (stats["warm_loads"], stats["evictions"]) == (3, 2)
+
+
+def test_scopes_are_separate(db, index):
+    add_question(db, "Explain TCP handshake.", subject="Operating Systems")
+    scope = (1, "Computer Networks", None, None)
+    assert not near_duplicates(index, db, "Explain the TCP 3-way handshake", scope=scope)
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+
+
+def test_backfills_missing_and_stale_signatures(db, index):
+    add_question(db, "Explain TCP handshake.", minhash=False)
+    add_question(db, "Explain deadlock prevention.")
+    stale = db.query(models.Question).filter(models.Question.question_text == "Explain deadlock prevention.").one()
+    stale.minhash = minhasher.signature(stale.question_text).astype("<u4").tobytes()
+    db.commit()
+
+    assert near_duplicates(index, db, "Explain the TCP 3-way handshake") == {"new"}
+    assert near_duplicates(index, db, "Explain deadlock prevention.") == {"new"}
+    for question in db.query(models.Question):
+        assert minhasher.from_bytes(question.minhash) is not None
@@ -0,0 +1,116 @@
+"""Read-only routes use the replica; everything else writes to the primary.
+
+The engines are bound when `app.database` is imported, so each case runs
+the app in a subprocess with its own `DATABASE_URL` and
+`DATABASE_REPLICA_URL`, using two SQLite files as primary and replica.
+Nothing copies rows between them, so which file a route answered from is
+visible in its response.
+"""
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPT = """
+import json
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from app.database import Base, engine, read_engine
+from app.main import app
+
+out = {"separate_engines": read_engine is not engine}
+if read_engine is not engine:
+    # The stand-in replica: its own schema and a paper and profile only it has.
+    Base.metadata.create_all(bind=read_engine)
+    with read_engine.begin() as conn:
+        conn.execute(text("INSERT INTO users (id, name, email, password_hash) VALUES (1, 'a', 'a@x.com', 'x')"))
+        conn.execute(text(
+            "INSERT INTO question_papers (id, user_id, subject, subject_code, semester, total_marks, set_number,"
+            " num_modules, created_at) VALUES (100, 1, 'REPLICA', 'R1', '5', 10, 1, 1, '2026-01-01 00:00:00')"
+        ))
+        conn.execute(text("INSERT INTO faculty_profiles (user_id, department) VALUES (1, 'replica')"))
+
+with TestClient(app) as client:
+    client.post("/auth/signup", json={"name": "a", "email": "a@x.com", "password": "pw"})
+    token = client.post("/auth/login", json={"email": "a@x.com", "password": "pw"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    syllabus = client.post(
+        "/files/upload-syllabus",
+        data={"semester": "5", "subject": "CN", "subject_code": "CS501"},
+        files={"file": ("syl.txt", b"TCP handshake basics", "text/plain")},
+        headers=headers,
+    ).json()["id"]
+    reference = client.post(
+        "/files/upload-reference",
+        data={"title": "book"},
+        files={"file": ("book.txt", b"The TCP handshake has three steps.", "text/plain")},
+        headers=headers,
+    ).json()["id"]
+    payload = {
+        "semester": "5", "subject": "CN", "subject_code": "CS501", "total_marks": 10,
+        "modules": [{"module_number": 1, "title": "T", "topics": "tcp handshake", "num_questions": 2, "marks": 10}],
+        "syllabus_doc_id": syllabus, "reference_material_ids": [reference],
+    }
+    generated = client.post("/papers/generate", json=payload, headers=headers)
+    assert generated.status_code == 200, generated.text
+    out["generated"] = [paper["id"] for paper in generated.json()]
+    out["listed"] = [paper["subject"] for paper in client.get("/papers/", headers=headers).json()]
+    out["get_replica_paper"] = client.get("/papers/100", headers=headers).status_code
+    out["get_generated_paper"] = client.get(f"/papers/{out['generated'][0]}", headers=headers).status_code
+    out["department"] = client.get("/user/profile", headers=headers).json()["department"]
+print("RESULT " + json.dumps(out))
+"""
+
+
+def run_app(tmp_path, primary, replica):
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite:///{primary}",
+        "DATABASE_REPLICA_URL": f"sqlite:///{replica}" if replica else "",
+        "FILE_UPLOAD_DIR": str(tmp_path / "uploads"),
+        "LLM_PROVIDER": "fake",
+        "LLM_PROVIDERS": "fake",
+        "LLM_CACHE_BACKEND": "none",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-c", SCRIPT], cwd=BACKEND, env=env, capture_output=True, text=True, timeout=120
+    )
+    assert proc.returncode == 0, proc.stderr
+    line = [line for line in proc.stdout.splitlines() if line.startswith("RESULT ")][-1]
+    return json.loads(line[len("RESULT "):])
+
+
+def paper_subjects(path):
+    with sqlite3.connect(path) as conn:
+        return [row[0] for row in conn.execute("SELECT subject FROM question_papers ORDER BY id")]
+
+
+def test_reads_use_the_replica_and_writes_the_primary(tmp_path):
+    primary, replica = tmp_path / "primary.db", tmp_path / "replica.db"
+    out = run_app(tmp_path, primary, replica)
+
+    assert out["separate_engines"]
+    assert len(out["generated"]) == 3
+    # Generating and saving wrote to the primary only.
+    assert paper_subjects(primary) == ["CN"] * 3
+    assert paper_subjects(replica) == ["REPLICA"]
+    # list_papers, get_paper and get_profile answered from the replica.
+    assert out["listed"] == ["REPLICA"]
+    assert out["get_replica_paper"] == 200
+    assert out["get_generated_paper"] == 404
+    assert out["department"] == "replica"
+
+
+def test_without_a_replica_reads_use_the_primary(tmp_path):
+    primary = tmp_path / "primary.db"
+    out = run_app(tmp_path, primary, None)
+
+    assert not out["separate_engines"]
+    assert paper_subjects(primary) == ["CN"] * 3
+    assert out["listed"] == ["CN"] * 3
+    assert out["get_replica_paper"] == 404
+    assert out["get_generated_paper"] == 200
+    assert out["department"] is None
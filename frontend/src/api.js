@@ -12,4 +12,34 @@ api.interceptors.request.use((config) => {
   return config
 })
 
+// POST `body` to `path` and call `onEvent` for each line of an NDJSON response
+// as it arrives. axios buffers whole responses in the browser, so this uses fetch.
+export async function postStream(path, body, onEvent) {
+  const token = localStorage.getItem('access_token')
+  const res = await fetch(`${api.defaults.baseURL}${path}`, {
+    method: 'POST',
+    headers: {
+      'Content-Type': 'application/json',
+      ...(token ? { Authorization: `Bearer ${token}` } : {}),
+    },
+    body: JSON.stringify(body),
+  })
+  if (!res.ok) {
+    const data = await res.json().catch(() => ({}))
+    throw new Error(data.detail || `Request failed with status ${res.status}`)
+  }
+  const reader = res.body.getReader()
+  const decoder = new TextDecoder()
+  let buffer = ''
+  for (;;) {
+    const { done, value } = await reader.read()
+    if (done) break
+    buffer += decoder.decode(value, { stream: true })
+    const lines = buffer.split('\n')
+    buffer = lines.pop()
+    lines.filter((line) => line.trim()).forEach((line) => onEvent(JSON.parse(line)))
+  }
+  if (buffer.trim()) onEvent(JSON.parse(buffer))
+}
+
 export default api
@@ -1,5 +1,5 @@
 import { useState } from 'react'
-import api from '../api'
+import api, { postStream } from '../api'
 import ModuleForm from '../components/ModuleForm'
 
 export default function GeneratePaperPage() {
@@ -8,11 +8,13 @@ export default function GeneratePaperPage() {
     subject: '',
     subject_code: '',
     total_marks: 100,
+    assembly_mode: 'generate',
   })
   const [modules, setModules] = useState([
     { module_number: 1, title: '', topics: '', num_questions: 2, marks: 20 },
   ])
   const [papers, setPapers] = useState([])
+  const [streamed, setStreamed] = useState([])
   const [loading, setLoading] = useState(false)
   const [syllabusFile, setSyllabusFile] = useState(null)
   const [referenceFile, setReferenceFile] = useState(null)
@@ -74,6 +76,8 @@ export default function GeneratePaperPage() {
 
   const handleGenerate = async () => {
     setLoading(true)
+    setPapers([])
+    setStreamed([])
     try {
       const syllabusDocId = await uploadSyllabus()
       const { referenceIds, refQpIds } = await uploadReferences()
@@ -85,12 +89,22 @@ export default function GeneratePaperPage() {
         total_marks: Number(meta.total_marks),
         modules,
         marks_distribution: null,
+        assembly_mode: meta.assembly_mode,
         syllabus_doc_id: syllabusDocId,
         reference_material_ids: referenceIds,
         reference_question_material_ids: refQpIds,
       }
-      const res = await api.post('/papers/generate', payload)
-      setPapers(res.data)
+      // Questions are shown as they arrive; the final event has the saved papers.
+      await postStream('/papers/generate/stream', payload, (event) => {
+        if (event.type === 'question') {
+          setStreamed((prev) => [...prev, event])
+        } else if (event.type === 'papers') {
+          setPapers(event.papers)
+          setStreamed([])
+        } else if (event.type === 'error') {
+          throw new Error(event.detail)
+        }
+      })
     } catch (err) {
       const msg = err?.response?.data?.detail || err.message || 'Failed to generate papers'
       alert(msg)
@@ -128,6 +142,11 @@ export default function GeneratePaperPage() {
           value={meta.total_marks}
           onChange={handleChange}
         />
+        <select name="assembly_mode" value={meta.assembly_mode} onChange={handleChange}>
+          <option value="generate">Generate new questions</option>
+          <option value="auto">Reuse question bank, generate the rest</option>
+          <option value="bank">Question bank only</option>
+        </select>
         <input
           type="file"
           onChange={(e) => setSyllabusFile(e.target.files[0])}
@@ -148,6 +167,22 @@ export default function GeneratePaperPage() {
         {loading ? 'Generating...' : 'Generate 3 Sets'}
       </button>
 
+      {loading && streamed.length > 0 && (
+        <div className="papers-preview">
+          <h3>Generating...</h3>
+          <ul>
+            {streamed.map((e, i) => (
+              <li key={i}>
+                <strong>
+                  Set {e.set_number} M{e.module_number}
+                </strong>{' '}
+                [{e.question.marks} marks] ({e.question.blooms_level}) - {e.question.text}
+              </li>
+            ))}
+          </ul>
+        </div>
+      )}
+
       {papers.length > 0 && (
         <div className="papers-preview">
           <h3>Generated Papers</h3>
@@ -3,11 +3,14 @@ import api from '../api'
 
 export default function PaperListPage() {
   const [papers, setPapers] = useState([])
+  const [nextCursor, setNextCursor] = useState(null)
 
-  const fetchPapers = async () => {
+  // The list is paginated; the next page's cursor comes back in a header.
+  const fetchPapers = async (cursor = null) => {
     try {
-      const res = await api.get('/papers')
-      setPapers(res.data)
+      const res = await api.get('/papers', { params: cursor ? { cursor } : {} })
+      setPapers((prev) => (cursor ? [...prev, ...res.data] : res.data))
+      setNextCursor(res.headers['x-next-cursor'] || null)
     } catch (err) {
       alert(err.response?.data?.detail || 'Failed to load papers')
     }
@@ -40,6 +43,7 @@ export default function PaperListPage() {
           </div>
         ))}
       </div>
+      {nextCursor && <button onClick={() => fetchPapers(nextCursor)}>Load more</button>}
     </div>
   )
 }